@@ -0,0 +1 @@
+"""Benchmarks of the gateway, run against in-process stand-ins of the remote services."""
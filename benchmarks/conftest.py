@@ -0,0 +1,16 @@
+import pytest
+from pytest_benchmark.utils import parse_compare_fail
+
+
+# The regression of a benchmark against the compared baseline that fails the run
+REGRESSION_THRESHOLD = "mean:20%"
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    # Applied only on a comparison, which is the only run it means anything for
+    compared = config.getoption("benchmark_compare", None)
+    if compared and not config.option.benchmark_compare_fail:
+        config.option.benchmark_compare_fail = [
+            parse_compare_fail(REGRESSION_THRESHOLD)
+        ]
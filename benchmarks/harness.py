@@ -0,0 +1,243 @@
+"""Drives the gateway against the stub services at a fixed concurrency
+and reports the throughput and the latency percentiles of every route.
+
+Run from the root of the repository, e.g.:
+
+    python -m benchmarks.harness --requests 2000 --concurrency 32 --latency 0.005
+"""
+
+import json
+import time
+import asyncio
+import logging
+import argparse
+from typing import Callable, Dict, List, Optional
+from aiohttp import ClientSession, ClientTimeout
+from pydantic import BaseModel
+import uvicorn
+from chrdiotypes.data_enums import PerformanceFlags
+from microfunkhaus import API, generate_app_with_config
+from tests.mocking import raw_performance
+from .stubs import StubSettings, StubUpstreams
+
+
+TOKEN = "benchmark"
+
+
+class RouteReport(BaseModel):
+    route: str
+    requests: int
+    errors: int
+    seconds: float
+    throughput: float
+    p50: float
+    p95: float
+    p99: float
+
+
+def get_percentile(ordered: List[float], share: float) -> float:
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, round(share * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def make_generation_payload(i: int) -> str:
+    return json.dumps({"sess_id": f"10.0.{i // 256 % 256}.{i % 256}"})
+
+
+def make_amendment_payload(i: int) -> str:
+    return json.dumps(
+        {
+            "sess_id": f"10.1.{i // 256 % 256}.{i % 256}",
+            "performance_object": json.loads(raw_performance),
+        }
+    )
+
+
+def make_labeling_payload(i: int) -> str:
+    return json.dumps(
+        {
+            "sess_id": f"10.2.{i // 256 % 256}.{i % 256}",
+            "ticket": str(i),
+            "flag": list(PerformanceFlags)[0].value,
+        }
+    )
+
+
+SCENARIOS: Dict[str, Callable[[int], str]] = {
+    "/generate": make_generation_payload,
+    "/amend/1": make_amendment_payload,
+    "/label": make_labeling_payload,
+}
+
+
+async def drive(
+    session: ClientSession,
+    base_url: str,
+    route: str,
+    make_payload: Callable[[int], str],
+    *,
+    requests: int,
+    concurrency: int,
+    ) -> RouteReport:
+    """Sends the given number of requests to a route,
+    keeping exactly concurrency of them in flight.
+    """
+
+    headers = {"X-Token": TOKEN, "Content-Type": "application/json"}
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def work():
+        nonlocal errors
+        for i in counter:
+            payload = make_payload(i)
+            start = time.perf_counter()
+            async with session.post(
+                base_url + route, data=payload, headers=headers
+            ) as response:
+                await response.read()
+                ok = response.status < 400
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(work() for _ in range(concurrency)))
+    seconds = time.perf_counter() - start
+    ordered = sorted(latencies)
+    return RouteReport(
+        route=route,
+        requests=requests,
+        errors=errors,
+        seconds=round(seconds, 3),
+        throughput=round(requests / seconds, 1),
+        p50=round(get_percentile(ordered, 0.50) * 1000, 2),
+        p95=round(get_percentile(ordered, 0.95) * 1000, 2),
+        p99=round(get_percentile(ordered, 0.99) * 1000, 2),
+    )
+
+
+async def run(
+    *,
+    requests: int,
+    concurrency: int,
+    warmup: int,
+    routes: List[str],
+    stub_settings: StubSettings,
+    overrides: Dict[str, StubSettings],
+    port: int,
+    ) -> List[RouteReport]:
+    """Starts the stubs and the gateway in this process, then drives every route."""
+
+    stubs = StubUpstreams(stub_settings, overrides)
+    await stubs.start()
+    app = generate_app_with_config(tokens={TOKEN}, remote_healthcheck_on_startup=False)
+    # Only the failures are worth the I/O during a benchmark
+    API.LOGGER.setLevel(logging.WARNING)
+    config = uvicorn.Config(
+        app, host="127.0.0.1", port=port, log_level="warning", access_log=False
+    )
+    server = uvicorn.Server(config)
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    base_url = f"http://127.0.0.1:{port}"
+    reports = []
+    try:
+        async with ClientSession(timeout=ClientTimeout(total=60)) as session:
+            for route in routes:
+                make_payload = SCENARIOS[route]
+                if warmup:
+                    await drive(
+                        session,
+                        base_url,
+                        route,
+                        make_payload,
+                        requests=warmup,
+                        concurrency=concurrency,
+                    )
+                reports.append(
+                    await drive(
+                        session,
+                        base_url,
+                        route,
+                        make_payload,
+                        requests=requests,
+                        concurrency=concurrency,
+                    )
+                )
+    finally:
+        server.should_exit = True
+        await serving
+        await stubs.close()
+    return reports
+
+
+def format_reports(reports: List[RouteReport]) -> str:
+    lines = [
+        f"{'route':<12}{'requests':>10}{'errors':>8}{'req/s':>10}"
+        f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    ]
+    for r in reports:
+        lines.append(
+            f"{r.route:<12}{r.requests:>10}{r.errors:>8}{r.throughput:>10}"
+            f"{r.p50:>10}{r.p95:>10}{r.p99:>10}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument(
+        "--routes", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS)
+    )
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--jitter", type=float, default=0.001)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument(
+        "--profile",
+        type=json.loads,
+        default={},
+        help='Per-service settings, e.g. \'{"microvoicemaster": {"latency": 0.02}}\'',
+    )
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--json", action="store_true", help="Print the reports as JSON")
+    args = parser.parse_args(argv)
+
+    stub_settings = StubSettings(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+    )
+    overrides = {
+        service: stub_settings.copy(update=settings)
+        for service, settings in args.profile.items()
+    }
+    reports = asyncio.run(
+        run(
+            requests=args.requests,
+            concurrency=args.concurrency,
+            warmup=args.warmup,
+            routes=args.routes,
+            stub_settings=stub_settings,
+            overrides=overrides,
+            port=args.port,
+        )
+    )
+    if args.json:
+        print(json.dumps([report.dict() for report in reports], indent=2))
+    else:
+        print(format_reports(reports))
+
+
+if __name__ == "__main__":
+    main()
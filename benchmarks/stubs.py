@@ -0,0 +1,132 @@
+"""In-process stand-ins for the remote services,
+listening on the addresses configured in '.endpoints.json'.
+
+Every service answers with a valid, canned response
+after a configurable delay, or fails with a configurable probability.
+"""
+
+import json
+import random
+import asyncio
+from typing import Dict, List, Optional, Tuple
+from aiohttp import web
+from pydantic import BaseModel
+from microfunkhaus import API
+from tests.mocking import raw_performance
+
+
+class StubSettings(BaseModel):
+    """Behaviour of a stub service.
+
+    Every response is delayed by a normally distributed number of seconds,
+    with the mean of latency and the standard deviation of jitter.
+    The error_rate share of the requests fails with error_status.
+    """
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 503
+
+
+PERFORMANCE = API.PerformanceResponse.parse_raw(raw_performance)
+PROGRESSION = API.construct_progression(PERFORMANCE).json()
+HEX_BLOB = json.dumps(PERFORMANCE.hex_blob)
+
+
+def get_service(endpoint: API.Endpoint) -> str:
+    return endpoint.name.split("/")[0]
+
+
+class StubUpstreams:
+    """Serves every endpoint and healthpoint from a single aiohttp app per address."""
+
+    def __init__(
+        self,
+        settings: StubSettings = StubSettings(),
+        overrides: Optional[Dict[str, StubSettings]] = None,
+        ):
+        self.settings = settings
+        self.overrides = overrides or {}
+        self.requests: Dict[str, int] = {}
+        self._runners: List[web.AppRunner] = []
+        self._routes: Dict[Tuple[str, str], List[Tuple[str, str]]] = {}
+        for endpoint in API.ENDPOINTS.values():
+            paths = [endpoint.path]
+            if endpoint.bulk.path is not None:
+                paths.append(endpoint.bulk.path)
+            for replica in endpoint.get_replicas():
+                for path in paths:
+                    self._routes.setdefault(replica.address, []).append(
+                        (f"/{path}", get_service(endpoint))
+                    )
+        for routes in self._routes.values():
+            # The longest path wins, e.g. 'ensure/sessions' over 'ensure/session'
+            routes.sort(key=lambda route: len(route[0]), reverse=True)
+
+    async def start(self) -> None:
+        for (host, port), routes in self._routes.items():
+            app = web.Application()
+            app.router.add_get("/healthcheck", self.healthcheck)
+            app.router.add_post("/{tail:.*}", self.make_handler(routes))
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, host, int(port)).start()
+            self._runners.append(runner)
+
+    async def close(self) -> None:
+        await asyncio.gather(*(runner.cleanup() for runner in self._runners))
+        self._runners.clear()
+
+    async def healthcheck(self, request: web.Request) -> web.Response:
+        return web.Response(text="OK")
+
+    def make_handler(self, routes: List[Tuple[str, str]]):
+        async def handle(request: web.Request) -> web.Response:
+            service = next(
+                (service for path, service in routes if request.path.startswith(path)),
+                None,
+            )
+            if service is None:
+                raise web.HTTPNotFound()
+            self.requests[service] = self.requests.get(service, 0) + 1
+            settings = self.overrides.get(service, self.settings)
+            body = await request.json()
+            delay = random.gauss(settings.latency, settings.jitter)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if random.random() < settings.error_rate:
+                return web.Response(status=settings.error_status)
+            return web.Response(
+                text=RESPONDERS[service](body), content_type="application/json"
+            )
+
+        return handle
+
+
+def respond_with_progression(body) -> str:
+    return PROGRESSION
+
+
+def respond_with_voices(body) -> str:
+    # A random voicing keeps the bureaucrat's cache as cold as in production
+    length = len(body["structures"])
+    voices = [[random.randrange(36, 84) for _ in range(length)] for _ in range(4)]
+    ticket = str(random.randrange(10**18))
+    return json.dumps({"voices": voices, "ticket": ticket})
+
+
+def respond_with_midi(body) -> str:
+    return HEX_BLOB
+
+
+def respond_with_receipt(body) -> str:
+    return json.dumps([True] * len(body) if isinstance(body, list) else True)
+
+
+RESPONDERS = {
+    "micropathforger": respond_with_progression,
+    "microvoicemaster": respond_with_voices,
+    "microbureaucrat": respond_with_midi,
+    "microaccountant": respond_with_receipt,
+}
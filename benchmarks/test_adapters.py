@@ -0,0 +1,125 @@
+"""Micro-benchmarks of the adapters and the models run on every request.
+
+Runs apart from the tests, with its own options:
+
+    pytest -c benchmarks/pytest.ini benchmarks
+
+Save a baseline on a quiet machine, e.g. before a change:
+
+    pytest -c benchmarks/pytest.ini benchmarks --benchmark-save=baseline
+
+and compare against the latest saved one, failing on a regression
+of the mean by more than the threshold in 'benchmarks/conftest.py':
+
+    pytest -c benchmarks/pytest.ini benchmarks --benchmark-compare
+"""
+
+import json
+from fastapi.encoders import jsonable_encoder
+from pytest import fixture
+from microfunkhaus import API
+from tests.mocking import raw_performance, f_cheetsheet, f_pseudomidi, f_perf_response
+
+
+raw_performance_request = json.dumps(
+    {
+        "sess_id": "192.0.0.1",
+        "user_object": {
+            "email": "ada.lovelace@aol.com",
+            "name_given": "Ada",
+            "name_family": "Lovelace",
+        },
+        "performance_object": {"graph": "major_graph", "key": 10},
+    }
+)
+raw_amendment_request = json.dumps(
+    {
+        "sess_id": "192.0.0.1",
+        "user_object": None,
+        "performance_object": json.loads(raw_performance),
+    }
+)
+
+
+@fixture
+def f_progression(f_perf_response):
+    return API.construct_progression(f_perf_response)
+
+
+def test_construct_cheet_sheet(benchmark, f_perf_response):
+    cheet_sheet = benchmark(API.construct_cheet_sheet, f_perf_response)
+    assert cheet_sheet.key == f_perf_response.key
+
+
+def test_construct_cheet_sheet_from_progression(
+    benchmark, f_perf_response, f_progression
+    ):
+    cheet_sheet = benchmark(API.construct_cheet_sheet, f_perf_response, f_progression)
+    assert len(cheet_sheet.info) == len(f_progression.nodes)
+
+
+def test_construct_progression(benchmark, f_perf_response):
+    progression = benchmark(API.construct_progression, f_perf_response)
+    assert len(progression.structures) == len(f_perf_response.structures)
+
+
+def test_construct_performance(
+    benchmark, f_progression, f_cheetsheet, f_pseudomidi, f_perf_response
+    ):
+    performance = benchmark(
+        API.construct_performance,
+        progression=f_progression,
+        cheet_sheet=f_cheetsheet,
+        pseudo_midi=f_pseudomidi,
+        hex_blob=f_perf_response.hex_blob,
+    )
+    assert performance.hex_blob == f_perf_response.hex_blob
+
+
+def test_construct_path_data(benchmark, f_progression):
+    assert benchmark(API.construct_path_data, f_progression)
+
+
+def test_construct_human_readable(benchmark, f_perf_response):
+    values = {**dict(f_perf_response), "human_readable": []}
+
+    def construct():
+        return API.PerformanceResponse.construct_human_readable(dict(values))
+
+    constructed = benchmark(construct)
+    assert constructed["human_readable"] == f_perf_response.human_readable
+
+
+def test_parse_performance_request(benchmark):
+    request = benchmark(API.PerformanceRequest.parse_raw, raw_performance_request)
+    assert request.performance_object.key == 10
+
+
+def test_parse_amendment_request(benchmark):
+    request = benchmark(API.AmendmentRequest.parse_raw, raw_amendment_request)
+    assert request.performance_object.human_readable
+
+
+def test_serialize_performance(benchmark, f_perf_response):
+    # As a route returning it renders the response
+    def serialize():
+        return json.dumps(jsonable_encoder(f_perf_response)).encode("utf-8")
+
+    assert json.loads(benchmark(serialize))["ticket"] == f_perf_response.ticket
+
+
+def test_construct_voicing_data(benchmark, f_progression, f_cheetsheet, f_pseudomidi):
+    transport = benchmark(
+        API.construct_voicing_data, f_progression, f_cheetsheet, f_pseudomidi
+    )
+    assert len(transport.path_nodes) == len(f_progression.nodes)
+
+
+def test_get_human_readable(benchmark, f_perf_response):
+    human_readable = benchmark(
+        API.get_human_readable,
+        f_perf_response.nodes,
+        f_perf_response.structures,
+        f_perf_response.key,
+    )
+    assert human_readable == f_perf_response.human_readable
@@ -0,0 +1,111 @@
+"""Benchmarks of the JSON path of a remote call and of a response:
+the previous one, through jsonable_encoder, the json module, parse_raw
+and FastAPI's response_model, against the current one.
+"""
+
+import json
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.utils import create_response_field
+from pytest import fixture, mark
+from chrdiotypes.musical import ProgressionFields, PseudoMIDI
+from microfunkhaus import API
+from tests.mocking import f_cheetsheet, f_perf_response
+
+
+def encode_previously(payload) -> bytes:
+    return json.dumps(jsonable_encoder(payload)).encode()
+
+
+def encode_currently(payload) -> bytes:
+    return API.dumps(API.prepare(payload))
+
+
+def decode_previously(model, body: bytes):
+    return model.parse_raw(body)
+
+
+def decode_currently(model, body: bytes):
+    return API.parse_model(model, body)
+
+
+def decode_trusted(model, body: bytes):
+    return API.parse_model(model, body, trusted=True)
+
+
+RESPONSE_FIELD = create_response_field(name="Response", type_=API.PerformanceResponse)
+
+
+def respond_previously(performance):
+    # What FastAPI does with the response_model of a route
+    content = performance.dict(by_alias=True)
+    value, _ = RESPONSE_FIELD.validate(content, {}, loc=("response",))
+    return API.FastJSONResponse(jsonable_encoder(value))
+
+
+def respond_currently(performance):
+    return API.ModelResponse(performance)
+
+
+ENCODERS = [encode_previously, encode_currently]
+DECODERS = [decode_previously, decode_currently, decode_trusted]
+
+
+@fixture
+def f_progression(f_perf_response):
+    return API.construct_progression(f_perf_response)
+
+
+@fixture
+def f_progression_body(f_progression) -> bytes:
+    return f_progression.json().encode()
+
+
+@fixture
+def f_voices_body() -> bytes:
+    voices = [[48 + i, 55 + i, 60 + i, 64 + i] for i in range(8)]
+    return json.dumps({"voices": voices, "ticket": "8120674621874145142"}).encode()
+
+
+@mark.benchmark(group="encode CheetSheet")
+@mark.parametrize("encode", ENCODERS)
+def test_encode_cheet_sheet(benchmark, encode, f_cheetsheet):
+    assert json.loads(benchmark(encode, f_cheetsheet))["key"] == f_cheetsheet.key
+
+
+@mark.benchmark(group="encode PathTransport")
+@mark.parametrize("encode", ENCODERS)
+def test_encode_path_data(benchmark, encode, f_progression):
+    assert benchmark(encode, API.construct_path_data(f_progression))
+
+
+@mark.benchmark(group="decode ProgressionFields")
+@mark.parametrize("decode", DECODERS)
+def test_decode_progression(benchmark, decode, f_progression_body, f_progression):
+    progression = benchmark(decode, ProgressionFields, f_progression_body)
+    assert progression.structures == f_progression.structures
+
+
+@mark.benchmark(group="decode PseudoMIDI")
+@mark.parametrize("decode", DECODERS)
+def test_decode_voices(benchmark, decode, f_voices_body):
+    assert len(benchmark(decode, PseudoMIDI, f_voices_body).voices) == 8
+
+
+@mark.benchmark(group="render PerformanceResponse")
+@mark.parametrize("response_class", [JSONResponse, API.FastJSONResponse])
+def test_render_performance(benchmark, response_class, f_perf_response):
+    content = jsonable_encoder(f_perf_response)
+    response = benchmark(response_class, content)
+    assert json.loads(response.body)["ticket"] == f_perf_response.ticket
+
+
+@mark.benchmark(group="respond PerformanceResponse")
+@mark.parametrize("respond", [respond_previously, respond_currently])
+def test_respond_performance(benchmark, respond, f_perf_response):
+    # Previously the human_readable was only computed by the validation
+    performance = f_perf_response
+    if respond is respond_previously:
+        performance = f_perf_response.copy(update={"human_readable": []})
+    response = benchmark(respond, performance)
+    assert json.loads(response.body) == jsonable_encoder(f_perf_response)
@@ -8,6 +8,7 @@ from .adapter_functions import (
     construct_progression,
     construct_path_data,
     construct_voicing_data,
+    construct_preview,
 )
 from .outer_models import (
     Performance,
@@ -16,21 +17,157 @@ from .outer_models import (
     PerformanceResponse,
     PerformanceRequest,
     AmendmentRequest,
+    BatchItemResponse,
+    ProgressionPreview,
     User,
+    get_human_readable,
+)
+from .conversions import (
+    SYMBOL_STRUCTURES,
+    INTERVAL_STRUCTURES,
+    NOTE_SYMBOLS,
+    CHORD_TYPES,
+    FLAVORS,
 )
 from .engine import (
     # post_multi_requests,
     post_single_request,
+    post_uncached_request,
+    post_retried_request,
+    post_hedged_request,
+    post_json,
+    get_timeout,
     instant_fire_coroutines,
     ping_dependency,
 )
-from .endpoints import Endpoint, ENDPOINTS, HEALTHPOINTS
+from .endpoints import (
+    Endpoint,
+    PoolSettings,
+    TimeoutSettings,
+    BreakerSettings,
+    RetrySettings,
+    CacheSettings,
+    BulkSettings,
+    BalancingSettings,
+    OutlierSettings,
+    Replica,
+    ENDPOINTS,
+    HEALTHPOINTS,
+    load_endpoints,
+    get_healthpoints,
+    update_endpoints,
+)
+from .balancing import (
+    ReplicaSelector,
+    ReplicaState,
+    STRATEGIES,
+    SELECTORS,
+    get_selector,
+    refresh_selectors,
+)
+from .reloading import EndpointsWatcher, ReloadSettings
+from .health import (
+    HealthMonitor,
+    HealthSettings,
+    UpstreamStatus,
+    UPSTREAM_HEALTH,
+    is_down,
+)
+from .retries import get_backoff_delay, get_hedge_delay, record_latency
+from .caching import (
+    ResponseCache,
+    MemoryCache,
+    RedisCache,
+    CACHE_BACKENDS,
+    CACHES,
+    get_cache,
+    make_cache_key,
+)
+from .transposition import (
+    ServedPerformances,
+    SERVED_PERFORMANCES,
+    transpose_hex_blob,
+    read_hex_blob_notes,
+    get_shift,
+    get_fingerprint,
+)
+from .coalescing import Coalescer, COALESCERS, get_coalescer, close_coalescers
+from .breakers import (
+    CircuitBreaker,
+    CircuitOpenError,
+    BreakerStates,
+    BREAKERS,
+    get_breaker,
+    ensure_closed,
+)
+from .serialization import (
+    FastJSONResponse,
+    ModelResponse,
+    dumps,
+    loads,
+    parse_model,
+    construct_model,
+    prepare,
+)
+from .deadlines import Deadline, DeadlineExceeded, DEADLINE_HEADER
+from .pool import SessionPool
+from .tracing import (
+    Span,
+    Tracer,
+    TracingSettings,
+    SpanExporter,
+    MemoryExporter,
+    FileExporter,
+    EXPORTERS,
+    TRACER,
+    CURRENT_SPAN,
+    TRACEPARENT_HEADER,
+    configure_tracing,
+    parse_traceparent,
+    get_trace_headers,
+)
+from .logs import (
+    LoggingSettings,
+    JSONFormatter,
+    NonBlockingQueueHandler,
+    LogListener,
+    configure_logging,
+    get_log_headers,
+    LOGGER,
+    REQUEST_ID,
+    REQUEST_ID_HEADER,
+)
+from .metrics import (
+    Counter,
+    Gauge,
+    CollectedCounter,
+    Histogram,
+    MetricsRegistry,
+    REGISTRY,
+    REQUESTS,
+    REQUEST_DURATION,
+    UPSTREAM_CONNECT,
+    UPSTREAM_TTFB,
+    UPSTREAM_DURATION,
+    UPSTREAM_BYTES,
+    make_trace_config,
+)
+from .dispatching import (
+    DataDispatcher,
+    DispatchSettings,
+    DISPATCHABLE_TYPES,
+    get_session_key,
+    get_ensured_key,
+)
 from .requests import (
+    get_generation_dependencies,
+    get_amendment_dependencies,
     get_req_progression_amendment,
     get_req_progression_generation,
     get_req_voices_generation,
     get_req_midihex_generation,
     # get_req_user_creation,
     ENSUREMENT_REQUEST_METHODS,
+    post_data,
     submit_data_tasks,
 )
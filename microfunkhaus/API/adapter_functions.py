@@ -14,16 +14,15 @@ from chrdiotypes.musical import (
     CheetSheet,
     ProgressionFields,
 )
-from chrdiotypes.data_enums import (
-    NotesInt,
-    ChordSymbolStructures,
-    ChordIntervalStructures,
-)
+from chrdiotypes.data_enums import NotesInt
+from .conversions import SYMBOL_STRUCTURES, INTERVAL_STRUCTURES
 from .outer_models import (
     Performance,
     GenericRequest,
     LabelingRequest,
     PerformanceResponse,
+    ProgressionPreview,
+    get_human_readable,
 )
 
 
@@ -34,8 +33,7 @@ def construct_path_data(progression: ProgressionFields) -> PathTransport:
 
     node_names = tuple(node.node_id for node in progression.nodes)
     structure_names = tuple(
-        ChordSymbolStructures[ChordIntervalStructures(structure).name]
-        for structure in progression.structures
+        SYMBOL_STRUCTURES[structure] for structure in progression.structures
     )
     nodes = tuple(zip(node_names, structure_names))
     return PathTransport(nodes=nodes, graph_name=progression.graph)
@@ -50,8 +48,7 @@ def construct_voicing_data(
 
     node_names = tuple(node.node_id for node in progression.nodes)
     structure_names = tuple(
-        ChordSymbolStructures[ChordIntervalStructures(structure).name]
-        for structure in progression.structures
+        SYMBOL_STRUCTURES[structure] for structure in progression.structures
     )
     path_nodes = tuple(zip(node_names, structure_names))
     perf_id = pseudo_midi.ticket
@@ -131,13 +128,12 @@ def construct_cheet_sheet(
         bases = [node.base for node in progression.nodes]
         node_names = tuple(node.node_id for node in progression.nodes)
         converted_structures = tuple(
-            ChordSymbolStructures[structure.name]
-            for structure in progression.structures
+            SYMBOL_STRUCTURES[structure] for structure in progression.structures
         )
     else:
         try:
             bases = [node.base for node in performance.nodes]  # type: ignore
-            structures = [ChordIntervalStructures[struc.name] for struc in performance.structures]  # type: ignore
+            structures = [INTERVAL_STRUCTURES[struc] for struc in performance.structures]  # type: ignore
             node_names = [node.node_id for node in performance.nodes]  # type: ignore
             converted_structures = tuple(x for x in performance.structures)  # type: ignore
         except AttributeError:
@@ -165,10 +161,7 @@ def construct_progression(performance: PerformanceResponse) -> ProgressionFields
     """
 
     nodes = tuple(performance.nodes)
-    structures = [
-        ChordIntervalStructures[ChordSymbolStructures(struc).name]
-        for struc in performance.structures
-    ]
+    structures = [INTERVAL_STRUCTURES[struc] for struc in performance.structures]
     progression = ProgressionFields(
         graph=performance.graph,
         nodes=nodes,
@@ -188,17 +181,39 @@ def construct_performance(
     """Combines data from various microservices into a PerformanceResponse."""
 
     symbol_structures = [
-        ChordSymbolStructures[structure.name] for structure in progression.structures
+        SYMBOL_STRUCTURES[structure] for structure in progression.structures
     ]
     performance = PerformanceResponse.construct(
         graph=progression.graph,
         key=cheet_sheet.key,
         nodes=progression.nodes,
         hex_blob=hex_blob,
-        human_readable=list(list()),  # Handled by validation
+        human_readable=get_human_readable(
+            progression.nodes, symbol_structures, cheet_sheet.key
+        ),
         structures=symbol_structures,
         ticket=pseudo_midi.ticket,
         changeabilities=progression.changeabilities,
     )
 
     return performance
+
+
+def construct_preview(
+    progression: ProgressionFields, cheet_sheet: CheetSheet
+    ) -> ProgressionPreview:
+    """Names the chords of a progression in the key chosen for its performance."""
+
+    symbol_structures = [
+        SYMBOL_STRUCTURES[structure] for structure in progression.structures
+    ]
+    return ProgressionPreview.construct(
+        key=cheet_sheet.key,
+        graph=progression.graph,
+        structures=symbol_structures,
+        changeabilities=progression.changeabilities,
+        nodes=progression.nodes,
+        human_readable=get_human_readable(
+            progression.nodes, symbol_structures, cheet_sheet.key
+        ),
+    )
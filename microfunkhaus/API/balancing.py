@@ -0,0 +1,253 @@
+"""Spreads the requests to a remote endpoint over its replicas."""
+
+import time
+import random
+from statistics import median
+from typing import Callable, Dict, List, Mapping, Optional, Sequence
+from .endpoints import Endpoint, Replica, ENDPOINTS
+from .health import is_down
+from .logs import LOGGER
+
+
+class ReplicaState:
+    """What a worker knows about a single replica of an endpoint
+    from the calls it has made to it.
+    """
+
+    __slots__ = (
+        "replica",
+        "outstanding",
+        "latency",
+        "error_rate",
+        "samples",
+        "requests",
+        "failures",
+        "ejections",
+        "ejected_until",
+    )
+
+    def __init__(self, replica: Replica):
+        self.replica = replica
+        self.outstanding = 0
+        self.latency: Optional[float] = None  # Smoothed, in seconds
+        self.error_rate = 0.0  # Smoothed
+        self.samples = 0  # Since the last ejection
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0  # Monotonic time
+
+    def snapshot(self) -> dict:
+        return {
+            "outstanding": self.outstanding,
+            "latency": round(self.latency, 4) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejected": self.ejected_until > time.monotonic(),
+            "ejections": self.ejections,
+            "down": is_down(self.replica.address),
+        }
+
+
+Strategy = Callable[["ReplicaSelector", Sequence[ReplicaState]], ReplicaState]
+
+
+class ReplicaSelector:
+    """Picks the replica of an endpoint for every call
+    according to the strategy of its balancing settings,
+    and keeps track of the calls in flight and their latency.
+
+    Replicas whose health checks fail are skipped, and so are the ones
+    ejected as outliers, unless that leaves none, which is left to the breaker.
+    """
+
+    def __init__(self, endpoint: Endpoint, previous: Optional["ReplicaSelector"] = None):
+        self.endpoint = endpoint
+        self.signature = get_signature(endpoint)
+        self.settings = endpoint.balancing
+        self.strategy = STRATEGIES[self.settings.strategy]
+        self._turn = 0
+        # The state of the replicas still serving the endpoint survives a reload
+        kept = previous.states if previous is not None else {}
+        self.states: Dict[tuple, ReplicaState] = {
+            replica.address: kept.get(replica.address) or ReplicaState(replica)
+            for replica in endpoint.get_replicas()
+        }
+        self._candidates: List[ReplicaState] = list(self.states.values())
+
+    def choose(self) -> Replica:
+        candidates = self._candidates
+        if len(candidates) == 1:
+            return candidates[0].replica
+        now = time.monotonic()
+        available = [
+            state
+            for state in candidates
+            if state.ejected_until <= now and not is_down(state.replica.address)
+        ]
+        if len(available) == 1:
+            return available[0].replica
+        return self.strategy(self, available or candidates).replica
+
+    def start(self, replica: Replica) -> None:
+        state = self.states.get(replica.address)
+        if state is not None:
+            state.outstanding += 1
+            state.requests += 1
+
+    def finish(self, replica: Replica, ok: bool, latency: Optional[float]) -> None:
+        """Records the outcome of a call started on the replica.
+        A call abandoned halfway has no latency to record.
+        """
+
+        state = self.states.get(replica.address)
+        if state is None:
+            return
+        state.outstanding -= 1
+        if not ok:
+            state.failures += 1
+        if latency is None:
+            return
+        weight = self.settings.ewma_weight
+        if state.latency is None:
+            state.latency = latency
+        else:
+            state.latency += weight * (latency - state.latency)
+        state.error_rate += weight * ((0.0 if ok else 1.0) - state.error_rate)
+        state.samples += 1
+        if len(self.states) > 1 and self.endpoint.outliers.enabled:
+            self._eject_outlier(state)
+
+    def _eject_outlier(self, state: ReplicaState) -> None:
+        settings = self.endpoint.outliers
+        if state.samples < settings.min_requests:
+            return
+        now = time.monotonic()
+        if state.ejected_until > now:
+            return
+        others = [
+            other.latency
+            for other in self.states.values()
+            if other is not state
+            and other.latency is not None
+            and other.samples >= settings.min_requests
+            and other.ejected_until <= now
+        ]
+        slow = bool(others) and state.latency > settings.latency_factor * median(others)
+        if not slow and state.error_rate < settings.error_rate:
+            return
+        ejected = sum(other.ejected_until > now for other in self.states.values())
+        if ejected + 1 > settings.max_ejected * len(self.states):
+            return
+        duration = min(settings.eject_for * 2 ** state.ejections, settings.eject_max)
+        state.ejected_until = now + duration
+        state.ejections += 1
+        # It's judged afresh once it's back
+        state.samples = 0
+        state.latency = None
+        state.error_rate = 0.0
+        LOGGER.warning(
+            "Replica ejected.",
+            extra={
+                "fields": {
+                    "endpoint": self.endpoint.name,
+                    "replica": f"{state.replica.host}:{state.replica.port}",
+                    "reason": "latency" if slow else "errors",
+                    "seconds": duration,
+                }
+            },
+        )
+
+    def snapshot(self) -> dict:
+        return {
+            f"{host}:{port}": state.snapshot()
+            for (host, port), state in self.states.items()
+        }
+
+
+def choose_round_robin(
+    selector: ReplicaSelector, candidates: Sequence[ReplicaState]
+    ) -> ReplicaState:
+    selector._turn += 1
+    return candidates[selector._turn % len(candidates)]
+
+
+def choose_least_outstanding(
+    selector: ReplicaSelector, candidates: Sequence[ReplicaState]
+    ) -> ReplicaState:
+    # Ties are broken in turns, not always in favour of the first replica
+    selector._turn += 1
+    start = selector._turn % len(candidates)
+    rotated = [*candidates[start:], *candidates[:start]]
+    return min(rotated, key=lambda state: state.outstanding)
+
+
+def choose_power_of_two(
+    selector: ReplicaSelector, candidates: Sequence[ReplicaState]
+    ) -> ReplicaState:
+    first, second = random.sample(candidates, 2)
+    return min(first, second, key=get_load)
+
+
+def get_load(state: ReplicaState) -> float:
+    # A replica without a latency yet is tried first
+    if state.latency is None:
+        return 0.0
+    return state.latency * (state.outstanding + 1)
+
+
+STRATEGIES: Dict[str, Strategy] = {
+    "round_robin": choose_round_robin,
+    "least_outstanding": choose_least_outstanding,
+    "power_of_two": choose_power_of_two,
+}
+
+# A registry of selectors, one per endpoint name within a worker
+SELECTORS: Dict[str, ReplicaSelector] = {}
+
+
+def get_signature(endpoint: Endpoint) -> tuple:
+    """What a selector depends on: the replicas and the settings of the endpoint."""
+
+    replicas = tuple(replica.address for replica in endpoint.get_replicas())
+    return (replicas, endpoint.balancing, endpoint.outliers)
+
+
+def get_selector(endpoint: Endpoint) -> ReplicaSelector:
+    """Returns the endpoint's selector, creates it on first use
+    and again once the endpoint is reloaded with other replicas or settings.
+
+    A call still holding the endpoint from before a reload
+    gets the selector of the reloaded one.
+    """
+
+    selector = SELECTORS.get(endpoint.name)
+    if selector is not None:
+        # Mostly the very same object, comparing the signatures is the slow path
+        if selector.endpoint is endpoint:
+            return selector
+        registered = ENDPOINTS.get(endpoint.name)
+        if registered is not None and registered is not endpoint:
+            return selector
+        if selector.signature == get_signature(endpoint):
+            return selector
+    selector = ReplicaSelector(endpoint, selector)
+    SELECTORS[endpoint.name] = selector
+    return selector
+
+
+def refresh_selectors(endpoints: Mapping[str, Endpoint]) -> None:
+    """Drops the selectors of the endpoints that are gone
+    and rebuilds the ones whose replicas or settings changed right away,
+    keeping the state of their surviving replicas.
+    """
+
+    for name, selector in tuple(SELECTORS.items()):
+        endpoint = endpoints.get(name)
+        if endpoint is None:
+            del SELECTORS[name]
+        elif selector.signature != get_signature(endpoint):
+            SELECTORS[name] = ReplicaSelector(endpoint, selector)
+        else:
+            selector.endpoint = endpoint
@@ -0,0 +1,142 @@
+"""Circuit breakers that stop calling remote endpoints known to be failing."""
+
+import time
+from collections import deque
+from enum import Enum
+from typing import Deque, Dict
+from .endpoints import Endpoint, BreakerSettings
+
+
+class BreakerStates(str, Enum):
+    closed = "closed"
+    open = "open"
+    half_open = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose breaker is open."""
+
+    def __init__(self, name: str):
+        super().__init__(f"The '{name}' service is temporarily unavailable.")
+        self.name = name
+
+
+class CircuitBreaker:
+    """Tracks outcomes of the latest calls to a single endpoint.
+
+    Opens once the share of failed (or too slow) calls in the window
+    reaches the threshold, lets a few probes through after a cooldown
+    and closes again if they succeed.
+    """
+
+    def __init__(self, name: str, settings: BreakerSettings):
+        self.name = name
+        self.settings = settings
+        self._outcomes: Deque[bool] = deque(maxlen=settings.window)
+        self._state = BreakerStates.closed
+        self._opened_at = 0.0
+        self._probes = 0
+
+    @property
+    def state(self) -> BreakerStates:
+        if (
+            self._state is BreakerStates.open
+            and time.monotonic() - self._opened_at >= self.settings.open_for
+        ):
+            self._state = BreakerStates.half_open
+            self._probes = 0
+        return self._state
+
+    @property
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def acquire(self) -> None:
+        """Reserves a call, raises CircuitOpenError if it isn't allowed."""
+
+        state = self.state
+        if state is BreakerStates.open:
+            raise CircuitOpenError(self.name)
+        if state is BreakerStates.half_open:
+            if self._probes >= self.settings.half_open_calls:
+                raise CircuitOpenError(self.name)
+            self._probes += 1
+
+    def record(self, ok: bool, latency: float) -> None:
+        """Registers the outcome of a call made after acquire()."""
+
+        slow_call = self.settings.slow_call
+        if ok and slow_call is not None and latency > slow_call:
+            ok = False
+        state = self.state
+        if state is BreakerStates.half_open:
+            self._probes = max(self._probes - 1, 0)
+            if ok:
+                self._outcomes.clear()
+                self._state = BreakerStates.closed
+            else:
+                self._trip()
+            return
+        self._outcomes.append(ok)
+        if (
+            state is BreakerStates.closed
+            and len(self._outcomes) >= self.settings.min_calls
+            and self.error_rate >= self.settings.error_rate
+        ):
+            self._trip()
+
+    def release(self) -> None:
+        """Gives back a reserved call that was never made."""
+
+        if self._state is BreakerStates.half_open:
+            self._probes = max(self._probes - 1, 0)
+
+    def trip(self) -> None:
+        """Opens the breaker on outside evidence, e.g. failed health checks."""
+
+        self._trip()
+
+    def allow_probes(self) -> None:
+        """Lets probes through an open breaker without waiting out its cooldown."""
+
+        if self._state is BreakerStates.open:
+            self._state = BreakerStates.half_open
+            self._probes = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state.value,
+            "error_rate": round(self.error_rate, 3),
+            "calls": len(self._outcomes),
+        }
+
+    def _trip(self) -> None:
+        self._state = BreakerStates.open
+        self._opened_at = time.monotonic()
+        self._probes = 0
+
+
+# A registry of breakers, one per endpoint name within a worker
+BREAKERS: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(endpoint: Endpoint) -> CircuitBreaker:
+    """Returns the endpoint's breaker, creates it on first use."""
+
+    breaker = BREAKERS.get(endpoint.name)
+    if breaker is None:
+        breaker = CircuitBreaker(endpoint.name, endpoint.breaker)
+        BREAKERS[endpoint.name] = breaker
+    return breaker
+
+
+def ensure_closed(*endpoints: Endpoint) -> None:
+    """Fails fast with CircuitOpenError if any of the endpoints
+    a scenario depends on is known to be down.
+    """
+
+    for endpoint in endpoints:
+        if get_breaker(endpoint).state is BreakerStates.open:
+            raise CircuitOpenError(endpoint.name)
@@ -0,0 +1,210 @@
+"""Content-addressed caches for the responses of deterministic remote endpoints."""
+
+import time
+import asyncio
+import hashlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from .endpoints import Endpoint, CacheSettings
+from .serialization import dumps
+from .metrics import CollectedCounter, REGISTRY
+
+try:
+    from redis import asyncio as aioredis
+    from redis.exceptions import RedisError
+except ImportError:  # pragma: no cover
+    aioredis = None
+    RedisError = OSError
+
+
+class ResponseCache(ABC):
+    """A common interface of the cache backends.
+    Keeps the hit/miss counters and the requests in flight,
+    so that concurrent misses on the same key are coalesced.
+    """
+
+    def __init__(self, settings: CacheSettings):
+        self.settings = settings
+        self.inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        value = await self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: bytes) -> None:
+        await self._set(key, value)
+
+    @abstractmethod
+    async def _get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    async def _set(self, key: str, value: bytes) -> None:
+        ...
+
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+class MemoryCache(ResponseCache):
+    """An in-process LRU cache, bounded by the number of items
+    and optionally by their total size.
+    """
+
+    def __init__(self, settings: CacheSettings):
+        super().__init__(settings)
+        self._items: "OrderedDict[str, Tuple[Optional[float], bytes]]" = OrderedDict()
+        self.size = 0
+        self.evictions = 0
+
+    async def _get(self, key: str) -> Optional[bytes]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at is not None and expires_at < time.monotonic():
+            self._pop(key)
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    async def _set(self, key: str, value: bytes) -> None:
+        max_bytes = self.settings.max_bytes
+        if max_bytes is not None and len(value) > max_bytes:
+            return
+        if key in self._items:
+            self._pop(key)
+        ttl = self.settings.ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._items[key] = (expires_at, value)
+        self.size += len(value)
+        while len(self._items) > self.settings.max_items or (
+            max_bytes is not None and self.size > max_bytes
+        ):
+            self._pop(next(iter(self._items)))
+            self.evictions += 1
+
+    def _pop(self, key: str) -> None:
+        _, value = self._items.pop(key)
+        self.size -= len(value)
+
+    def snapshot(self) -> dict:
+        return {
+            **super().snapshot(),
+            "items": len(self._items),
+            "bytes": self.size,
+            "evictions": self.evictions,
+        }
+
+
+class RedisCache(ResponseCache):
+    """A cache kept by a Redis-compatible server, shared between workers.
+    Requires the 'redis' extra, unless a client is given.
+
+    An unreachable server is treated as a miss, never as a failure.
+    """
+
+    def __init__(self, settings: CacheSettings, client: Any = None):
+        super().__init__(settings)
+        if client is None:
+            if aioredis is None:  # pragma: no cover
+                raise ImportError(
+                    "The 'redis' cache backend requires the 'redis' extra."
+                )
+            client = aioredis.from_url(settings.url or "redis://127.0.0.1:6379")
+        self._client = client
+        self.errors = 0
+
+    async def _get(self, key: str) -> Optional[bytes]:
+        try:
+            value = await self._client.get(key)
+        except (OSError, RedisError):
+            self.errors += 1
+            return None
+        return value
+
+    async def _set(self, key: str, value: bytes) -> None:
+        ttl = self.settings.ttl
+        try:
+            await self._client.set(
+                key, value, px=int(ttl * 1000) if ttl is not None else None
+            )
+        except (OSError, RedisError):
+            self.errors += 1
+
+    def snapshot(self) -> dict:
+        return {**super().snapshot(), "errors": self.errors}
+
+
+CACHE_BACKENDS = {
+    "memory": MemoryCache,
+    "redis": RedisCache,
+}
+
+# A registry of caches, one per endpoint name within a worker
+CACHES: Dict[str, ResponseCache] = {}
+
+
+def count_cache_lookups() -> Dict[Tuple[str, str], int]:
+    report = {}
+    for name, cache in CACHES.items():
+        report[(name, "hit")] = cache.hits
+        report[(name, "miss")] = cache.misses
+        report[(name, "coalesced")] = cache.coalesced
+    return report
+
+
+CACHE_LOOKUPS = REGISTRY.register(
+    CollectedCounter(
+        "microfunkhaus_cache_lookups_total",
+        "Lookups of the response caches, by endpoint and outcome.",
+        ("endpoint", "outcome"),
+        collect=count_cache_lookups,
+    )
+)
+
+
+def get_cache(endpoint: Endpoint) -> Optional[ResponseCache]:
+    """Returns the endpoint's cache, or None if caching is off for it."""
+
+    if not endpoint.cache.enabled:
+        return None
+    cache = CACHES.get(endpoint.name)
+    if cache is None:
+        cache = CACHE_BACKENDS[endpoint.cache.backend](endpoint.cache)
+        CACHES[endpoint.name] = cache
+    return cache
+
+
+def make_cache_key(
+    endpoint: Endpoint, serializable: Any, option: Optional[str] = None
+    ) -> str:
+    """Hashes the canonical form of the payload,
+    omitting the fields the response doesn't depend on.
+    The option of a single call, if any, is a part of the key.
+    """
+
+    if isinstance(serializable, dict) and endpoint.cache.exclude:
+        serializable = {
+            field: value
+            for field, value in serializable.items()
+            if field not in endpoint.cache.exclude
+        }
+    digest = hashlib.sha256(dumps(serializable, sort_keys=True)).hexdigest()
+    if option is not None:
+        return f"{endpoint.name}/{option}:{digest}"
+    return f"{endpoint.name}:{digest}"
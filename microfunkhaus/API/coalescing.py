@@ -0,0 +1,187 @@
+"""Coalesces concurrent requests to the same endpoint into bulk requests."""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from aiohttp import ClientResponseError
+from .endpoints import Endpoint
+from .deadlines import Deadline
+from .pool import SessionPool
+from .serialization import dumps, loads
+from .logs import LOGGER
+
+
+Sender = Callable[..., Awaitable[bytes]]
+Pending = Tuple[Any, asyncio.Future, Optional[Deadline]]
+
+
+class Coalescer:
+    """Collects the payloads for an endpoint for a short window,
+    then posts them as a list to its bulk counterpart
+    and hands every caller its own item of the response.
+
+    A bulk request the endpoint rejects as a client error is sent again
+    one item at a time, so that a single bad item doesn't fail the rest.
+    If the bulk path doesn't exist at all (404 or 405),
+    the items are sent one at a time from then on.
+    """
+
+    def __init__(self, endpoint: Endpoint):
+        self.endpoint = endpoint
+        self.bulk_endpoint = endpoint.copy(
+            update={
+                "name": f"{endpoint.name}/bulk",
+                "path": endpoint.bulk.path,
+                "option": endpoint.bulk.option,
+            }
+        )
+        self._pending: List[Pending] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # The loop keeps only weak references to the tasks
+        self._sending: Set[asyncio.Task] = set()
+        self.bulk_supported = True
+        self.requests = 0
+        self.bulk_requests = 0
+        self.single_requests = 0
+
+    async def post(
+        self,
+        serializable: Any,
+        send: Sender,
+        *,
+        pool: SessionPool,
+        deadline: Optional[Deadline] = None,
+        ) -> bytes:
+        """Queues the payload for the next bulk request and waits for its answer,
+        no longer than the deadline allows.
+        """
+
+        if not self.bulk_supported:
+            self.single_requests += 1
+            return await send(self.endpoint, serializable, pool=pool, deadline=deadline)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((serializable, future, deadline))
+        self.requests += 1
+        if len(self._pending) >= self.endpoint.bulk.max_items:
+            self._flush(send, pool)
+        elif self._timer is None:
+            self._timer = loop.call_later(
+                self.endpoint.bulk.window, self._flush, send, pool
+            )
+        timeout = deadline.remaining() if deadline is not None else None
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+    def _flush(self, send: Sender, pool: SessionPool) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        if pending:
+            self.bulk_requests += 1
+            task = asyncio.create_task(self._send(pending, send, pool))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def close(self) -> None:
+        """Cancels the items still waiting for a bulk request
+        and waits for the bulk requests on their way.
+        """
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        for _, future, _ in pending:
+            future.cancel()
+        await asyncio.gather(*self._sending, return_exceptions=True)
+
+    async def _send(self, pending: List[Pending], send: Sender, pool: SessionPool):
+        # The bulk request waits for the most patient of the callers
+        deadlines = [deadline for _, _, deadline in pending]
+        deadline = None
+        if None not in deadlines:
+            deadline = max(deadlines, key=lambda d: d.expires_at)
+        try:
+            body = await send(
+                self.bulk_endpoint,
+                [serializable for serializable, _, _ in pending],
+                pool=pool,
+                deadline=deadline,
+            )
+            items = loads(body)
+            if not isinstance(items, list) or len(items) != len(pending):
+                raise ValueError(
+                    f"Malformed bulk response from '{self.endpoint.name}'."
+                )
+        except ClientResponseError as e:
+            if e.status >= 500:
+                self._fail(pending, e)
+                return
+            if e.status in (404, 405) and self.bulk_supported:
+                self.bulk_supported = False
+                LOGGER.warning(
+                    "Bulk path not supported, sending items one at a time.",
+                    extra={"fields": {"endpoint": self.endpoint.name}},
+                )
+            await self._send_one_by_one(pending, send, pool)
+            return
+        except Exception as e:
+            self._fail(pending, e)
+            return
+        for (_, future, _), item in zip(pending, items):
+            if not future.done():
+                future.set_result(dumps(item))
+
+    async def _send_one_by_one(
+        self, pending: List[Pending], send: Sender, pool: SessionPool
+        ) -> None:
+        self.single_requests += len(pending)
+        outcomes = await asyncio.gather(
+            *(
+                send(self.endpoint, serializable, pool=pool, deadline=deadline)
+                for serializable, _, deadline in pending
+            ),
+            return_exceptions=True,
+        )
+        for (_, future, _), outcome in zip(pending, outcomes):
+            if isinstance(outcome, BaseException):
+                self._fail([(None, future, None)], outcome)
+            elif not future.done():
+                future.set_result(outcome)
+
+    def _fail(self, pending: List[Pending], error: BaseException) -> None:
+        for _, future, _ in pending:
+            if not future.done():
+                future.set_exception(error)
+                future.exception()  # Retrieved even if the caller is gone
+
+    def snapshot(self) -> dict:
+        return {
+            "requests": self.requests,
+            "bulk_requests": self.bulk_requests,
+            "single_requests": self.single_requests,
+            "bulk_supported": self.bulk_supported,
+            "sending": len(self._sending),
+        }
+
+
+# A registry of coalescers, one per endpoint name within a worker
+COALESCERS: Dict[str, Coalescer] = {}
+
+
+def get_coalescer(endpoint: Endpoint) -> Optional[Coalescer]:
+    """Returns the endpoint's coalescer, or None if it has no bulk counterpart."""
+
+    if endpoint.bulk.path is None:
+        return None
+    coalescer = COALESCERS.get(endpoint.name)
+    if coalescer is None:
+        coalescer = Coalescer(endpoint)
+        COALESCERS[endpoint.name] = coalescer
+    return coalescer
+
+
+async def close_coalescers() -> None:
+    """Waits for the bulk requests of every coalescer, e.g. on shutdown."""
+
+    await asyncio.gather(*(coalescer.close() for coalescer in COALESCERS.values()))
@@ -0,0 +1,60 @@
+"""Conversions between the enums of chrdiotypes, computed once at import.
+
+The enums only relate to each other by the names and values of their members,
+so every conversion by hand takes an enum lookup or two per chord.
+Looking it up in a table built from the same lookups is a single dict access.
+"""
+
+from typing import Callable, Dict, Iterable, Optional, Tuple, TypeVar
+from chrdiotypes.data_enums import (
+    NotesInt,
+    NotesSym,
+    NodeIDs,
+    ChordTypes,
+    ChordSymbolStructures,
+    ChordIntervalStructures,
+    StructureSymbols,
+    StructureValues,
+)
+
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+def build_table(members: Iterable[K], convert: Callable[[K], V]) -> Dict[K, V]:
+    """Maps every member to its conversion.
+    Leaves out the ones that have none, as the conversion by hand would fail on them.
+    """
+
+    table = {}
+    for member in members:
+        try:
+            table[member] = convert(member)
+        except (KeyError, ValueError):
+            continue
+    return table
+
+
+SYMBOL_STRUCTURES: Dict[ChordIntervalStructures, ChordSymbolStructures] = build_table(
+    ChordIntervalStructures, lambda structure: ChordSymbolStructures[structure.name]
+)
+INTERVAL_STRUCTURES: Dict[ChordSymbolStructures, ChordIntervalStructures] = {
+    symbol: interval for interval, symbol in SYMBOL_STRUCTURES.items()
+}
+
+# The symbol of a note by its number of halftones above C, i.e. (base + key) % 12
+NOTE_SYMBOLS: Tuple[str, ...] = tuple(
+    NotesSym[NotesInt(halftones).name].value for halftones in range(12)
+)
+
+# The type of the chord on a node, e.g. 'maj' or 'min'
+CHORD_TYPES: Dict[NodeIDs, str] = build_table(
+    NodeIDs, lambda node_id: ChordTypes(node_id.value[-1]).name.lower()
+)
+
+# The flavor of a structure, e.g. 7 for a seventh chord, None for a plain triad
+FLAVORS: Dict[ChordSymbolStructures, Optional[int]] = build_table(
+    ChordSymbolStructures,
+    lambda structure: StructureValues[StructureSymbols(structure.value[-1]).name].value,
+)
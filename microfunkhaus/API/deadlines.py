@@ -0,0 +1,69 @@
+"""Per-request time budgets shared by all of the remote calls of a request."""
+
+import asyncio
+import time
+from typing import Dict, Optional
+
+
+DEADLINE_HEADER = "X-Request-Timeout"
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Raised when there is no budget left for another remote call."""
+
+
+class Deadline:
+    """A moment after which nobody waits for the result anymore.
+
+    Measured with a monotonic clock and forwarded to the remote services
+    as the remaining budget in milliseconds (see DEADLINE_HEADER),
+    so that clock skew between hosts doesn't matter.
+    """
+
+    def __init__(self, timeout: float):
+        self.expires_at = time.monotonic() + timeout
+
+    @classmethod
+    def from_header(
+        cls,
+        value: Optional[str],
+        *,
+        default: float,
+        maximum: Optional[float] = None,
+        minimum: Optional[float] = None,
+        ) -> "Deadline":
+        """Creates a deadline from the client-supplied budget in milliseconds.
+        Falls back to the default budget if the header is absent, malformed
+        or not positive, never grants more than the maximum
+        nor less than the minimum.
+        """
+
+        try:
+            timeout = int(value) / 1000 if value is not None else default
+        except ValueError:
+            timeout = default
+        if timeout <= 0:
+            timeout = default
+        if maximum is not None:
+            timeout = min(timeout, maximum)
+        if minimum is not None:
+            timeout = max(timeout, minimum)
+        return cls(timeout)
+
+    def remaining(self) -> float:
+        """Seconds left, raises DeadlineExceeded if there are none."""
+
+        remaining = self.expires_at - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("The request deadline has been exceeded.")
+        return remaining
+
+    def allows(self, seconds: float) -> bool:
+        """Tells if there will be any budget left after the given time."""
+
+        return self.expires_at - time.monotonic() > seconds
+
+    def headers(self) -> Dict[str, str]:
+        """Headers that tell a remote service how long the caller will wait."""
+
+        return {DEADLINE_HEADER: str(int(self.remaining() * 1000))}
@@ -0,0 +1,380 @@
+"""Sends the data for the 'microaccountant' in the background."""
+
+import json
+import random
+import asyncio
+from pathlib import Path
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple, Union
+from aiohttp import ClientResponseError
+from pydantic import BaseModel
+from chrdiotypes.transport import (
+    SessionTransport,
+    UserTransport,
+    LabelTransport,
+)
+from .deadlines import Deadline
+from .caching import ResponseCache
+from .logs import LOGGER, REQUEST_ID
+from .tracing import CURRENT_SPAN
+
+
+class DispatchSettings(BaseModel):
+    """Limits of the background writes.
+
+    Up to max_queued writes wait in memory, the overflow goes
+    to the spill file if there is one, and is dropped otherwise.
+    Every write is attempted up to attempts times, each within timeout seconds.
+    Writes still failing after that are spilled as well.
+    Writes the 'microaccountant' rejects are set aside in a file
+    next to the spill file, named after it with a '.rejected' suffix,
+    to be looked into rather than sent again.
+
+    Every worker takes up to batch_size queued writes at once and sends them
+    together, so that endpoints with a bulk counterpart get them in one request.
+    """
+
+    max_queued: int = 1024
+    workers: int = 4
+    batch_size: int = 64
+    attempts: int = 3
+    backoff: float = 0.1
+    backoff_max: float = 2.0
+    timeout: float = 10.0
+    drain_timeout: float = 5.0
+    spill_path: Optional[str] = None
+
+
+Dispatchable = Union[UserTransport, SessionTransport, LabelTransport]
+Sender = Callable[..., Awaitable[Any]]
+
+DISPATCHABLE_TYPES = {
+    transport.__name__: transport
+    for transport in (SessionTransport, UserTransport, LabelTransport)
+}
+
+
+class DataDispatcher:
+    """Queues the writes so that no response has to wait on them,
+    and delivers them with its own workers.
+
+    Nothing is lost on a restart as long as there is a spill file:
+    whatever is left in memory on close is written to it,
+    and it's read back once the 'microaccountant' is reachable again.
+    The files are only ever touched by a single writer task,
+    which leaves the reading and writing to the default executor.
+
+    A session or a user identical to one still queued or on its way
+    is dropped, since ensuring it once is enough.
+    So is a session the 'microaccountant' has confirmed recently
+    for the same user, if there is a cache of the ensured ones.
+    """
+
+    def __init__(
+        self,
+        send: Sender,
+        settings: DispatchSettings,
+        ensured: Optional[ResponseCache] = None,
+        ):
+        self.send = send
+        self.settings = settings
+        self.ensured = ensured
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: "asyncio.Queue[Dispatchable]" = asyncio.Queue(
+            settings.max_queued
+        )
+        self._workers: Set[asyncio.Task] = set()
+        self._sessions: Set[str] = set()
+        self._spill = Path(settings.spill_path) if settings.spill_path else None
+        self._rejected = (
+            self._spill.with_name(self._spill.name + ".rejected")
+            if self._spill is not None
+            else None
+        )
+        self._unwritten: List[Tuple[Path, str]] = []
+        self._restoring = False
+        self._writer: Optional[asyncio.Task] = None
+        self.spill_pending = 0
+        self.submitted = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.spilled = 0
+        self.rejected = 0
+        self.restored = 0
+        self.dropped = 0
+        self.high_water = 0
+        self.deduplicated = 0
+        self.skipped = 0
+
+    def submit(self, data: Dispatchable) -> None:
+        """Queues a write and returns immediately."""
+
+        self._bind_loop()
+        self.submitted += 1
+        session = get_session_key(data)
+        if session is not None:
+            if session in self._sessions:
+                self.deduplicated += 1
+                return
+            self._sessions.add(session)
+        try:
+            self._queue.put_nowait(data)
+        except asyncio.QueueFull:
+            self._sessions.discard(session)
+            self._spill_or_drop(data)
+            return
+        self.high_water = max(self.high_water, self._queue.qsize())
+
+    async def open(self) -> None:
+        """Starts the workers and picks up the writes spilled last time."""
+
+        self._bind_loop()
+
+    async def close(self) -> None:
+        """Gives the workers a moment to finish,
+        then spills everything left in the queue.
+        """
+
+        same_loop = self._loop is asyncio.get_running_loop()
+        if same_loop:
+            try:
+                await asyncio.wait_for(
+                    self._drain(), timeout=self.settings.drain_timeout
+                )
+            except asyncio.TimeoutError:
+                pass
+        workers = tuple(self._workers)
+        self._workers.clear()
+        self._loop = None
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        writer, self._writer = self._writer, None
+        self._restoring = False
+        if writer is not None and same_loop:
+            await asyncio.gather(writer, return_exceptions=True)
+        while not self._queue.empty():
+            self._spill_or_drop(self._queue.get_nowait())
+        self._sessions.clear()
+        lines, self._unwritten = self._unwritten, []
+        if lines:
+            await asyncio.get_running_loop().run_in_executor(None, append_lines, lines)
+
+    def snapshot(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "capacity": self.settings.max_queued,
+            "high_water": self.high_water,
+            "workers": len(self._workers),
+            "submitted": self.submitted,
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "spilled": self.spilled,
+            "rejected": self.rejected,
+            "spill_pending": self.spill_pending,
+            "restored": self.restored,
+            "dropped": self.dropped,
+            "deduplicated": self.deduplicated,
+            "skipped": self.skipped,
+        }
+
+    async def _work(self) -> None:
+        # The workers outlive the request they were started by
+        REQUEST_ID.set(None)
+        CURRENT_SPAN.set(None)
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.settings.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                delivered = await asyncio.gather(
+                    *(self._deliver(data) for data in batch)
+                )
+            finally:
+                for data in batch:
+                    self._sessions.discard(get_session_key(data))
+                    self._queue.task_done()
+            if any(delivered) and self.spill_pending:
+                # The 'microaccountant' is back, so are the spilled writes
+                self._restore()
+
+    async def _deliver(self, data: Dispatchable) -> bool:
+        ensured_key = get_ensured_key(data) if self.ensured is not None else None
+        if ensured_key is not None and await self.ensured.get(ensured_key):
+            self.skipped += 1
+            return True
+        for attempt in range(1, self.settings.attempts + 1):
+            try:
+                await self.send(data, deadline=Deadline(self.settings.timeout))
+            except ClientResponseError as e:
+                if e.status < 500:
+                    # Won't be accepted no matter how many times it's sent
+                    self.failed += 1
+                    LOGGER.warning(
+                        "The 'microaccountant' rejected a write.",
+                        extra={"fields": {"status": e.status, "data": data.json()}},
+                    )
+                    self._set_aside(data)
+                    return False
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                pass
+            else:
+                self.sent += 1
+                if ensured_key is not None:
+                    await self.ensured.set(ensured_key, b"1")
+                return True
+            if attempt < self.settings.attempts:
+                self.retried += 1
+                await asyncio.sleep(self._get_backoff_delay(attempt))
+        self.failed += 1
+        self._spill_or_drop(data)
+        return False
+
+    def _get_backoff_delay(self, attempt: int) -> float:
+        ceiling = min(self.settings.backoff_max, self.settings.backoff * 2**attempt)
+        return random.uniform(0, ceiling)
+
+    def _bind_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # Workers of a finished loop are gone, the writes they left aren't
+        queue: "asyncio.Queue[Dispatchable]" = asyncio.Queue(
+            self.settings.max_queued
+        )
+        while not self._queue.empty():
+            queue.put_nowait(self._queue.get_nowait())
+        self._queue = queue
+        self._loop = loop
+        self._workers = {
+            asyncio.create_task(self._work()) for _ in range(self.settings.workers)
+        }
+        # Left from a finished loop, whatever it had yet to write stays queued
+        self._writer = None
+        if self._spill is not None:
+            self._restore()
+
+    async def _drain(self) -> None:
+        # The spilled writes being restored count as queued
+        while True:
+            if self._writer is not None:
+                await asyncio.gather(self._writer, return_exceptions=True)
+            await self._queue.join()
+            if self._writer is None or self._writer.done():
+                return
+
+    def _spill_or_drop(self, data: Dispatchable) -> None:
+        if self._spill is None:
+            self.dropped += 1
+            LOGGER.warning(
+                "Dropped a write for the 'microaccountant'.",
+                extra={"fields": {"data": data.json()}},
+            )
+            return
+        self._write_later(self._spill, data)
+        self.spilled += 1
+        self.spill_pending += 1
+
+    def _set_aside(self, data: Dispatchable) -> None:
+        if self._rejected is None:
+            self.dropped += 1
+            return
+        self._write_later(self._rejected, data)
+        self.rejected += 1
+
+    def _write_later(self, path: Path, data: Dispatchable) -> None:
+        item = {"type": type(data).__name__, "data": json.loads(data.json())}
+        self._unwritten.append((path, json.dumps(item) + "\n"))
+        self._start_writer()
+
+    def _restore(self) -> None:
+        """Has the writer move as many spilled writes back to the queue
+        as it has room for.
+        """
+
+        self._restoring = True
+        self._start_writer()
+
+    def _start_writer(self) -> None:
+        if self._loop is None:
+            return  # Written once there is a loop again
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write())
+
+    async def _write(self) -> None:
+        # The writer outlives the request it was started by
+        REQUEST_ID.set(None)
+        CURRENT_SPAN.set(None)
+        loop = asyncio.get_running_loop()
+        while self._unwritten or self._restoring:
+            if self._unwritten:
+                lines, self._unwritten = self._unwritten, []
+                await loop.run_in_executor(None, append_lines, lines)
+                continue
+            self._restoring = False
+            room = self._queue.maxsize - self._queue.qsize()
+            restored, left = await loop.run_in_executor(
+                None, take_lines, self._spill, room
+            )
+            self.spill_pending = left + sum(
+                path == self._spill for path, _ in self._unwritten
+            )
+            for line in restored:
+                item = json.loads(line)
+                transport = DISPATCHABLE_TYPES[item["type"]]
+                try:
+                    self._queue.put_nowait(transport.parse_obj(item["data"]))
+                except asyncio.QueueFull:
+                    self._unwritten.append((self._spill, line + "\n"))
+                    self.spill_pending += 1
+                    continue
+                self.restored += 1
+
+
+def append_lines(lines: List[Tuple[Path, str]]) -> None:
+    """Appends the lines to their files, in order."""
+
+    by_path = {}
+    for path, line in lines:
+        by_path.setdefault(path, []).append(line)
+    for path, path_lines in by_path.items():
+        with path.open("a") as spilled_file:
+            spilled_file.write("".join(path_lines))
+
+
+def take_lines(path: Path, count: int) -> Tuple[List[str], int]:
+    """Removes up to count lines from the start of the file.
+    Returns them and the number of lines left.
+    """
+
+    if not path.exists():
+        return [], 0
+    lines = path.read_text().splitlines()
+    taken, left = lines[:count], lines[count:]
+    if left:
+        path.write_text("".join(line + "\n" for line in left))
+    else:
+        path.unlink()
+    return taken, len(left)
+
+
+def get_session_key(data: Dispatchable) -> Optional[str]:
+    """Identifies a session or a user write, None for anything else."""
+
+    if isinstance(data, LabelTransport):
+        return None
+    return f"{type(data).__name__}:{data.json()}"
+
+
+def get_ensured_key(data: Dispatchable) -> Optional[str]:
+    """Identifies a session by its address and the user's email,
+    None for anything but a session or a user.
+    """
+
+    if isinstance(data, LabelTransport):
+        return None
+    email = data.user_object.email if isinstance(data, UserTransport) else ""
+    return f"ensured:{data.sess_id}:{email}"
@@ -1,12 +1,175 @@
 """Deserializes json-file into a registry of valid endpoint objects."""
 
 import json
-from typing import Optional
-from pydantic import BaseModel
+from types import MappingProxyType
+from typing import Dict, FrozenSet, Iterable, List, Mapping, Optional, Set, Tuple
+from pydantic import BaseModel, PrivateAttr, root_validator
+
+
+class PoolSettings(BaseModel):
+    """Connection pool options for a single upstream address."""
+
+    class Config:
+        allow_mutation = False
+
+    limit: int = 100
+    keepalive_timeout: float = 15.0
+    use_dns_cache: bool = True
+    ttl_dns_cache: Optional[int] = 10
+
+
+class TimeoutSettings(BaseModel):
+    """Socket-level timeouts (in seconds) for a single remote endpoint.
+    The total is capped by the request deadline, if there is one.
+    """
+
+    class Config:
+        allow_mutation = False
+
+    connect: Optional[float] = None
+    read: Optional[float] = None
+    total: Optional[float] = None
+
+
+class BreakerSettings(BaseModel):
+    """Circuit breaker thresholds for a single remote endpoint.
+    Calls slower than slow_call seconds count as failures.
+    """
+
+    class Config:
+        allow_mutation = False
+
+    window: int = 20
+    min_calls: int = 5
+    error_rate: float = 0.5
+    slow_call: Optional[float] = None
+    open_for: float = 30.0
+    half_open_calls: int = 1
+
+
+class RetrySettings(BaseModel):
+    """Retry and hedging policy for a single remote endpoint.
+    Meant only for the idempotent ones.
+
+    Backoff delays (in seconds) are jittered and grow exponentially.
+    A hedged request is fired if the first one runs longer
+    than the hedge_quantile of the recently observed latencies.
+    """
+
+    class Config:
+        allow_mutation = False
+
+    attempts: int = 1
+    backoff: float = 0.05
+    backoff_max: float = 1.0
+    statuses: FrozenSet[int] = frozenset({502, 503, 504})
+    hedge: bool = False
+    hedge_quantile: float = 0.95
+    hedge_min_samples: int = 20
+
+
+class CacheSettings(BaseModel):
+    """Response cache options for a single deterministic remote endpoint.
+
+    Responses are keyed by a hash of the canonical payload
+    without the excluded fields, and expire after ttl seconds.
+    The 'redis' backend expects a Redis-compatible server at the url.
+    """
+
+    class Config:
+        allow_mutation = False
+
+    enabled: bool = False
+    backend: str = "memory"
+    url: Optional[str] = None
+    max_items: int = 1024
+    max_bytes: Optional[int] = None
+    ttl: Optional[float] = None
+    exclude: FrozenSet[str] = frozenset()
+
+
+class BulkSettings(BaseModel):
+    """Coalescing options for a remote endpoint that also accepts lists.
+
+    Concurrent requests within window seconds, up to max_items of them,
+    are sent to the bulk path as a single list and answered with one, in order.
+    """
+
+    class Config:
+        allow_mutation = False
+
+    path: Optional[str] = None
+    option: Optional[str] = None
+    max_items: int = 16
+    window: float = 0.005
+
+
+class BalancingSettings(BaseModel):
+    """Load balancing options for a remote endpoint with several replicas.
+
+    The strategy is one of 'round_robin', 'least_outstanding'
+    or 'power_of_two', which picks the better of two random replicas
+    by their latency, smoothed with the ewma_weight of the latest call,
+    and by their requests in flight.
+    """
+
+    class Config:
+        allow_mutation = False
+
+    strategy: str = "round_robin"
+    ewma_weight: float = 0.3
+
+
+class OutlierSettings(BaseModel):
+    """Ejection of the replicas that stand out from the rest of an endpoint.
+
+    Once a replica has served min_requests calls, it's ejected for eject_for
+    seconds if its smoothed error rate reaches error_rate, or its smoothed
+    latency exceeds latency_factor times the median of the other replicas.
+    The ejection doubles with every repeated one, up to eject_max,
+    and no more than max_ejected of the replicas are out at once.
+    """
+
+    class Config:
+        allow_mutation = False
+
+    enabled: bool = True
+    min_requests: int = 10
+    error_rate: float = 0.5
+    latency_factor: float = 3.0
+    eject_for: float = 30.0
+    eject_max: float = 300.0
+    max_ejected: float = 0.5
+
+
+class Replica(BaseModel):
+    """One of the addresses serving a remote endpoint."""
+
+    class Config:
+        allow_mutation = False
+
+    host: str
+    port: str
+
+    @property
+    def address(self) -> Tuple[str, str]:
+        return (self.host, self.port)
 
 
 class Endpoint(BaseModel):
-    """A model to deserialize the configuration of remote endpoints."""
+    """A model to deserialize the configuration of remote endpoints.
+
+    The responses of a trusted endpoint are taken as valid without validation.
+    An endpoint served by several replicas lists them,
+    host and port then default to the ones of the first replica.
+
+    Endpoints are shared by all requests of a worker, hence immutable.
+    Their URLs are built once, a different option for a single call
+    is passed to get_url instead.
+    """
+
+    class Config:
+        allow_mutation = False
 
     name: str
     host: str
@@ -14,23 +177,139 @@ class Endpoint(BaseModel):
     path: str
     option: Optional[str] = None
     prefix: str = "http://"
+    trusted: bool = False
+    replicas: Tuple[Replica, ...] = ()
+    balancing: BalancingSettings = BalancingSettings()
+    outliers: OutlierSettings = OutlierSettings()
+    pool: PoolSettings = PoolSettings()
+    timeout: TimeoutSettings = TimeoutSettings()
+    breaker: BreakerSettings = BreakerSettings()
+    retry: RetrySettings = RetrySettings()
+    cache: CacheSettings = CacheSettings()
+    bulk: BulkSettings = BulkSettings()
+
+    _replicas: Tuple[Replica, ...] = PrivateAttr()
+    _base_urls: Dict[Tuple[str, str], str] = PrivateAttr()
+    _urls: Dict[Tuple[str, str], str] = PrivateAttr()
+    _url: str = PrivateAttr()
+    _hash: int = PrivateAttr()
+
+    @root_validator(pre=True)
+    def default_to_first_replica(cls, values):
+        replicas = values.get("replicas")
+        if replicas and "host" not in values and "port" not in values:
+            first = replicas[0]
+            if isinstance(first, Replica):
+                first = first.dict()
+            values = {**values, "host": first["host"], "port": first["port"]}
+        return values
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self._cache_urls()
+
+    def copy(self, **kwargs) -> "Endpoint":
+        endpoint = super().copy(**kwargs)
+        endpoint._cache_urls()
+        return endpoint
+
+    def _cache_urls(self) -> None:
+        self._replicas = self.replicas or (Replica(host=self.host, port=self.port),)
+        self._base_urls = {}
+        self._urls = {}
+        for replica in self._replicas:
+            base_url = f"{self.prefix}{replica.host}:{replica.port}/{self.path}"
+            self._base_urls[replica.address] = base_url
+            if self.option is not None:
+                self._urls[replica.address] = f"{base_url}/{self.option}"
+            else:
+                self._urls[replica.address] = base_url
+        self._url = self._urls[self._replicas[0].address]
+        self._hash = hash((self.name, self._url))
+
+    @property
+    def address(self) -> Tuple[str, str]:
+        return (self.host, self.port)
+
+    def get_replicas(self) -> Tuple[Replica, ...]:
+        """Returns the listed replicas, or the only one at host and port."""
+
+        return self._replicas
+
+    def get_url(
+        self, option: Optional[str] = None, replica: Optional[Replica] = None
+        ) -> str:
+        """Returns the URL of the endpoint at the replica, the first one by default,
+        with the given option in place of the configured one, if any.
+        """
+
+        address = self._replicas[0].address if replica is None else replica.address
+        if option is None:
+            return self._urls[address]
+        return f"{self._base_urls[address]}/{option}"
 
     def __str__(self):
-        if self.option is not None:
-            option = "/" + self.option
-        else:
-            option = ""
-        return f"{self.prefix}{self.host}:{self.port}/{self.path}{option}"
+        return self._url
 
     def __hash__(self):
-        return hash(tuple(self.dict().values()))
+        return self._hash
+
+
+def load_endpoints(path: str) -> Dict[str, Endpoint]:
+    """Reads the registry of endpoints from a json-file."""
+
+    with open(path, "r") as endpoints_file:
+        endpoints = json.load(endpoints_file)
+    return {endpoint["name"]: Endpoint(**endpoint) for endpoint in endpoints}
+
+
+def get_healthpoints(endpoints: Iterable[Endpoint]) -> List[Endpoint]:
+    """Returns an endpoint to check the health of every remote address,
+    named by its URL.
+    """
+
+    healthpoints: Dict[Tuple[str, str], Endpoint] = {}
+    for endpoint in endpoints:
+        for replica in endpoint.get_replicas():
+            if replica.address not in healthpoints:
+                url = f"{endpoint.prefix}{replica.host}:{replica.port}/healthcheck"
+                healthpoints[replica.address] = endpoint.copy(
+                    update={
+                        "name": url,
+                        "host": replica.host,
+                        "port": replica.port,
+                        "path": "healthcheck",
+                        "option": None,
+                        "replicas": (),
+                    }
+                )
+    return list(healthpoints.values())
+
+
+def update_endpoints(endpoints: Dict[str, Endpoint]) -> Set[str]:
+    """Replaces the contents of the registry in place,
+    so that every module holding it sees the new endpoints.
+    The unchanged ones stay the very same objects.
+    Returns the names of the endpoints added, changed or removed.
+    """
+
+    changed = {
+        name
+        for name in set(_ENDPOINTS) | set(endpoints)
+        if _ENDPOINTS.get(name) != endpoints.get(name)
+    }
+    updated = {
+        name: endpoint if name in changed else _ENDPOINTS[name]
+        for name, endpoint in endpoints.items()
+    }
+    _ENDPOINTS.clear()
+    _ENDPOINTS.update(updated)
+    HEALTHPOINTS[:] = get_healthpoints(updated.values())
+    return changed
 
 
-with open(".endpoints.json", "r") as endpoints_file:
-    endpoints = json.load(endpoints_file)
-    ENDPOINTS = {endpoint["name"]: Endpoint(**endpoint) for endpoint in endpoints}
-    for e in endpoints:
-        e["path"] = "healthcheck"
-        e["name"] = str(e)
-        e["option"] = None
-    HEALTHPOINTS = list(set(Endpoint(**e) for e in endpoints))
+# The registry is only ever changed with update_endpoints,
+# the requests in flight keep the endpoints they have started with
+_ENDPOINTS = load_endpoints(".endpoints.json")
+ENDPOINTS: Mapping[str, Endpoint] = MappingProxyType(_ENDPOINTS)
+HEALTHPOINTS = get_healthpoints(ENDPOINTS.values())
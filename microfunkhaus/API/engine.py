@@ -1,31 +1,336 @@
+import time
 import asyncio
-from fastapi.encoders import jsonable_encoder
-from typing import Tuple
-from aiohttp import ClientSession
+from functools import partial
+from types import SimpleNamespace
+from typing import Any, Dict, Optional, Tuple
+from aiohttp import (
+    ClientError,
+    ClientConnectionError,
+    ClientResponseError,
+    ClientTimeout,
+)
 from pydantic import BaseModel
 from .endpoints import Endpoint
+from .deadlines import Deadline
+from .breakers import get_breaker
+from .balancing import get_selector
+from .retries import get_backoff_delay, get_hedge_delay, record_latency
+from .caching import ResponseCache, get_cache, make_cache_key
+from .coalescing import get_coalescer
+from .pool import SessionPool
+from .serialization import dumps, prepare
+from .metrics import UPSTREAM_DURATION, UPSTREAM_BYTES
+from .logs import get_log_headers
+from .tracing import TRACER, get_trace_headers
+
+
+CLOCK_RESOLUTION = time.get_clock_info("monotonic").resolution
+
+
+def get_timeout(
+    endpoint: Endpoint, deadline: Optional[Deadline] = None
+    ) -> Tuple[ClientTimeout, Dict[str, str]]:
+    """Combines the endpoint's own timeouts with the remaining request budget.
+    Returns the timeout and the headers to forward the budget,
+    the request id and the trace with.
+    """
+
+    total = endpoint.timeout.total
+    headers = {**get_log_headers(), **get_trace_headers()}
+    if deadline is not None:
+        remaining = deadline.remaining()
+        total = remaining if total is None else min(total, remaining)
+        headers.update(deadline.headers())
+    timeout = ClientTimeout(
+        total=total,
+        sock_connect=endpoint.timeout.connect,
+        sock_read=endpoint.timeout.read,
+    )
+    return timeout, headers
 
 
 async def post_single_request(
-    endpoint: Endpoint, payload: BaseModel, *, session: ClientSession
-    ) -> str:
+    endpoint: Endpoint,
+    payload: BaseModel,
+    *,
+    pool: SessionPool,
+    deadline: Optional[Deadline] = None,
+    option: Optional[str] = None,
+    ) -> bytes:
     """Makes a single POST request according
     to the specified endpoint object
     and the pydantic-object payload.
+    Returns the body of the response as is.
+    An option replaces the endpoint's configured one for this call only.
+
+    Serves deterministic endpoints from their cache, if it's enabled.
+    Retries and hedges it according to the endpoint's policy.
+    Raises DeadlineExceeded (a TimeoutError) if the budget is already spent,
+    the request itself is abandoned once it runs out.
+    Raises CircuitOpenError without calling an endpoint known to be failing.
+    """
+
+    with TRACER.span(f"POST {endpoint.name}", endpoint=endpoint.name) as span:
+        serializable = prepare(payload)
+        cache = get_cache(endpoint)
+        if cache is None:
+            return await post_uncached_request(
+                endpoint, serializable, pool=pool, deadline=deadline, option=option
+            )
+
+        key = make_cache_key(endpoint, serializable, option)
+        cached = await cache.get(key)
+        if span is not None:
+            span.set(cached=cached is not None)
+        if cached is not None:
+            return cached
+
+        # Identical requests already on their way are awaited instead of repeated.
+        # The shared task outlives the cancellation of any of its callers.
+        task = cache.inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(
+                fill_cache(
+                    cache,
+                    key,
+                    endpoint,
+                    serializable,
+                    pool=pool,
+                    deadline=deadline,
+                    option=option,
+                )
+            )
+            cache.inflight[key] = task
+            task.add_done_callback(partial(forget_inflight, cache, key))
+        else:
+            cache.coalesced += 1
+        return await asyncio.shield(task)
+
+
+async def fill_cache(
+    cache: ResponseCache,
+    key: str,
+    endpoint: Endpoint,
+    serializable: Any,
+    *,
+    pool: SessionPool,
+    deadline: Optional[Deadline] = None,
+    option: Optional[str] = None,
+    ) -> bytes:
+    body = await post_uncached_request(
+        endpoint, serializable, pool=pool, deadline=deadline, option=option
+    )
+    await cache.set(key, body)
+    return body
+
+
+def forget_inflight(cache: ResponseCache, key: str, task: asyncio.Task) -> None:
+    cache.inflight.pop(key, None)
+    if not task.cancelled():
+        # Marks the exception as retrieved in case every caller is gone
+        task.exception()
+
+
+async def post_uncached_request(
+    endpoint: Endpoint,
+    serializable: Any,
+    *,
+    pool: SessionPool,
+    deadline: Optional[Deadline] = None,
+    option: Optional[str] = None,
+    ) -> bytes:
+    """Sends the request on its own,
+    or as a part of a bulk one if the endpoint has a bulk counterpart
+    and the call has no option of its own.
+    """
+
+    coalescer = get_coalescer(endpoint)
+    if coalescer is None or option is not None:
+        return await post_retried_request(
+            endpoint, serializable, pool=pool, deadline=deadline, option=option
+        )
+    return await coalescer.post(
+        serializable, post_retried_request, pool=pool, deadline=deadline
+    )
+
+
+async def post_retried_request(
+    endpoint: Endpoint,
+    serializable: Any,
+    *,
+    pool: SessionPool,
+    deadline: Optional[Deadline] = None,
+    option: Optional[str] = None,
+    ) -> bytes:
+    """Retries a request on transient failures with a jittered backoff,
+    as long as the endpoint's policy and the deadline allow.
+    """
+
+    policy = endpoint.retry
+    attempt = 1
+    while True:
+        try:
+            return await post_hedged_request(
+                endpoint, serializable, pool=pool, deadline=deadline, option=option
+            )
+        except ClientResponseError as e:
+            if attempt >= policy.attempts or e.status not in policy.statuses:
+                raise
+            error: Exception = e
+        except (ClientConnectionError, asyncio.TimeoutError) as e:
+            if attempt >= policy.attempts:
+                raise
+            error = e
+        delay = get_backoff_delay(endpoint, attempt)
+        if deadline is not None and not deadline.allows(delay):
+            raise error
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def post_hedged_request(
+    endpoint: Endpoint,
+    serializable: Any,
+    *,
+    pool: SessionPool,
+    deadline: Optional[Deadline] = None,
+    option: Optional[str] = None,
+    ) -> bytes:
+    """Fires a second, identical request if the first one is slower than usual.
+    Returns whichever answers first and cancels the other.
+    """
+
+    delay = get_hedge_delay(endpoint)
+    if delay is None:
+        return await post_json(
+            endpoint, serializable, pool=pool, deadline=deadline, option=option
+        )
+
+    first = asyncio.create_task(
+        post_json(endpoint, serializable, pool=pool, deadline=deadline, option=option)
+    )
+    pending = {first}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return first.result()
+
+        second = asyncio.create_task(
+            post_json(
+                endpoint, serializable, pool=pool, deadline=deadline, option=option
+            )
+        )
+        pending = {first, second}
+        while True:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                error = task.exception()
+                if error is None:
+                    return task.result()
+            if not pending:
+                raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def post_json(
+    endpoint: Endpoint,
+    serializable: Any,
+    *,
+    pool: SessionPool,
+    deadline: Optional[Deadline] = None,
+    option: Optional[str] = None,
+    ) -> bytes:
+    """Makes exactly one POST request through the endpoint's circuit breaker
+    to the replica its selector picks.
+    Times it, its connection and its first byte for the metrics.
+    """
+
+    with TRACER.span(f"attempt {endpoint.name}", endpoint=endpoint.name) as span:
+        timeout, headers = get_timeout(endpoint, deadline)
+        headers["Content-Type"] = "application/json"
+        data = dumps(serializable)
+        selector = get_selector(endpoint)
+        replica = selector.choose()
+        session = pool.session_for(endpoint, replica)
+        if span is not None:
+            span.set(replica=f"{replica.host}:{replica.port}")
+        breaker = get_breaker(endpoint)
+        breaker.acquire()
+        selector.start(replica)
+        start_time = time.monotonic()
+        try:
+            async with session.post(
+                endpoint.get_url(option, replica),
+                data=data,
+                headers=headers,
+                timeout=timeout,
+                raise_for_status=True,
+                trace_request_ctx=SimpleNamespace(endpoint=endpoint.name),
+            ) as response:
+                body = await response.read()
+        except ClientResponseError as e:
+            # Client errors are the caller's fault, not the endpoint's
+            latency = time.monotonic() - start_time
+            breaker.record(e.status < 500, latency)
+            selector.finish(replica, e.status < 500, latency)
+            if span is not None:
+                span.set(status=e.status)
+            UPSTREAM_DURATION.observe(endpoint.name, str(e.status), value=latency)
+            raise
+        except (ClientError, asyncio.TimeoutError) as e:
+            latency = time.monotonic() - start_time
+            if isinstance(e, asyncio.TimeoutError) and is_out_of_budget(deadline):
+                # The caller's budget ran out, not the endpoint's own timeouts
+                breaker.release()
+                selector.finish(replica, True, None)
+            else:
+                breaker.record(False, latency)
+                selector.finish(replica, False, latency)
+            UPSTREAM_DURATION.observe(endpoint.name, type(e).__name__, value=latency)
+            raise
+        except BaseException:
+            breaker.release()
+            selector.finish(replica, True, None)
+            raise
+        latency = time.monotonic() - start_time
+        breaker.record(True, latency)
+        selector.finish(replica, True, latency)
+        record_latency(endpoint, latency)
+        UPSTREAM_DURATION.observe(endpoint.name, str(response.status), value=latency)
+        UPSTREAM_BYTES.observe(endpoint.name, value=len(body))
+        if span is not None:
+            span.set(status=response.status, bytes=len(body))
+        return body
+
+
+def is_out_of_budget(deadline: Optional[Deadline]) -> bool:
+    """Tells if the request deadline, rather than the endpoint, timed a call out.
+    The timer may go off as early as the resolution of the clock.
     """
 
-    serializable = jsonable_encoder(payload)
-    async with session.post(
-        str(endpoint), json=serializable, raise_for_status=True
-    ) as response:
-        return await response.text()
+    return deadline is not None and not deadline.allows(CLOCK_RESOLUTION)
 
 
-async def ping_dependency(endpoint: Endpoint, *, session: ClientSession) -> bool:
+async def ping_dependency(
+    endpoint: Endpoint, *, pool: SessionPool, deadline: Optional[Deadline] = None
+    ) -> bool:
     """Returns True if endpoint responds OK (<400), else False"""
 
-    async with session.get(str(endpoint), raise_for_status=True) as response:
-        return response.ok
+    with TRACER.span(f"GET {endpoint.name}", endpoint=endpoint.name):
+        timeout, headers = get_timeout(endpoint, deadline)
+        session = pool.session_for(endpoint)
+        async with session.get(
+            str(endpoint),
+            headers=headers,
+            timeout=timeout,
+            raise_for_status=True,
+            trace_request_ctx=SimpleNamespace(endpoint=endpoint.name),
+        ) as response:
+            return response.ok
 
 
 # A legacy multirequest sender
@@ -0,0 +1,175 @@
+"""Checks the health of the remote addresses in the background."""
+
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+from pydantic import BaseModel
+from .endpoints import Endpoint, PoolSettings, ENDPOINTS, HEALTHPOINTS
+from .deadlines import Deadline
+from .breakers import get_breaker
+from .pool import SessionPool
+from .logs import LOGGER, REQUEST_ID
+from .tracing import CURRENT_SPAN
+
+
+class HealthSettings(BaseModel):
+    """How often (in seconds) every remote address is pinged,
+    how long a ping may take, and how many pings in a row
+    have to fail for the address to be taken as down.
+    The pings have connections of their own, up to connections per address,
+    so that a pool saturated by live traffic doesn't pass for a dead service.
+    No interval turns the background checks off,
+    the addresses are then checked on every '/healthcheck' instead.
+    """
+
+    interval: Optional[float] = 5.0
+    timeout: float = 2.0
+    failures: int = 2
+    connections: int = 2
+
+
+class UpstreamStatus:
+    """The outcome of the latest pings of a single remote address."""
+
+    __slots__ = ("url", "healthy", "latency", "error", "checked_at", "failures")
+
+    def __init__(self, url: str):
+        self.url = url
+        self.healthy: Optional[bool] = None  # Unknown until the first ping
+        self.latency: Optional[float] = None
+        self.error: Optional[str] = None
+        self.checked_at: Optional[float] = None  # Wall time
+        self.failures = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "healthy": self.healthy,
+            "latency": round(self.latency, 4) if self.latency is not None else None,
+            "error": self.error,
+            "checked_at": self.checked_at,
+        }
+
+
+# The status of every remote address, shared by all requests of a worker
+UPSTREAM_HEALTH: Dict[Tuple[str, str], UpstreamStatus] = {}
+
+
+def is_down(address: Tuple[str, str]) -> bool:
+    """Tells whether the latest pings of the address have failed.
+    An address that hasn't been checked yet isn't down.
+    """
+
+    status = UPSTREAM_HEALTH.get(address)
+    return status is not None and status.healthy is False
+
+
+Pinger = Callable[..., Awaitable[Any]]
+
+
+class HealthMonitor:
+    """Pings the healthpoints of all remote addresses on an interval
+    and keeps their status in UPSTREAM_HEALTH.
+
+    The replica selectors skip the addresses that are down.
+    An endpoint with all of its replicas down has its breaker opened,
+    and let probed again as soon as one of them is back.
+    """
+
+    def __init__(self, ping: Pinger, settings: HealthSettings):
+        self.ping = ping
+        self.settings = settings
+        self.pool = SessionPool(settings=PoolSettings(limit=settings.connections))
+        self._task: Optional[asyncio.Task] = None
+        self._tripped: Set[str] = set()
+        self.rounds = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def open(self) -> None:
+        if self.settings.interval is not None and self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def close(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self.pool.close()
+
+    async def check(self) -> bool:
+        """Pings every healthpoint at once, updates their status
+        and the breakers of the endpoints behind them.
+        Returns True if all of them are online.
+        """
+
+        healthpoints = tuple(HEALTHPOINTS)
+        await asyncio.gather(*(self._check_one(e) for e in healthpoints))
+        addresses = {e.address for e in healthpoints}
+        for address in tuple(UPSTREAM_HEALTH):
+            if address not in addresses:
+                # Removed from the endpoints by a reload
+                del UPSTREAM_HEALTH[address]
+        await self.pool.prune(addresses)
+        self._update_breakers()
+        self.rounds += 1
+        return all(UPSTREAM_HEALTH[address].healthy for address in addresses)
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {status.url: status.snapshot() for status in UPSTREAM_HEALTH.values()}
+
+    async def _watch(self) -> None:
+        # The checks outlive the request that started the worker
+        REQUEST_ID.set(None)
+        CURRENT_SPAN.set(None)
+        while True:
+            await asyncio.sleep(self.settings.interval)
+            try:
+                await self.check()
+            except Exception:
+                LOGGER.exception("Health check failed.")
+
+    async def _check_one(self, endpoint: Endpoint) -> None:
+        status = UPSTREAM_HEALTH.get(endpoint.address)
+        if status is None or status.url != str(endpoint):
+            status = UPSTREAM_HEALTH[endpoint.address] = UpstreamStatus(str(endpoint))
+        start_time = time.monotonic()
+        try:
+            await self.ping(
+                endpoint, pool=self.pool, deadline=Deadline(self.settings.timeout)
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            status.failures += 1
+            status.error = str(e) or type(e).__name__
+            # An address never seen online is down from the first failure
+            if status.failures >= self.settings.failures or status.healthy is None:
+                if status.healthy is not False:
+                    LOGGER.warning(
+                        "Remote service is down.",
+                        extra={"fields": {"url": status.url, "error": status.error}},
+                    )
+                status.healthy = False
+        else:
+            if status.healthy is False:
+                LOGGER.info(
+                    "Remote service is back.", extra={"fields": {"url": status.url}}
+                )
+            status.failures = 0
+            status.error = None
+            status.healthy = True
+        status.latency = time.monotonic() - start_time
+        status.checked_at = time.time()
+
+    def _update_breakers(self) -> None:
+        for name, endpoint in ENDPOINTS.items():
+            down = all(is_down(replica.address) for replica in endpoint.get_replicas())
+            if down:
+                get_breaker(endpoint).trip()
+                self._tripped.add(name)
+            elif name in self._tripped:
+                # Only the breakers opened here, the rest wait out their cooldown
+                get_breaker(endpoint).allow_probes()
+                self._tripped.discard(name)
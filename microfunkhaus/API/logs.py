@@ -0,0 +1,136 @@
+"""Structured logging that never blocks the event loop.
+
+Records are put on a bounded queue and written as JSON lines
+by a separate thread, so a slow stdout only ever costs dropped records.
+"""
+
+import sys
+import copy
+import json
+import queue
+import logging
+from datetime import datetime, timezone
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+from pydantic import BaseModel
+from .tracing import CURRENT_SPAN
+
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# The id of the request being served in the current context, if any
+REQUEST_ID: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+LOGGER = logging.getLogger("microfunkhaus")
+
+
+class LoggingSettings(BaseModel):
+    """Logging options.
+
+    Only the sample_rate share of successful requests is logged,
+    unless they take longer than slow_request seconds.
+    Failed ones are always logged in full.
+    Records go to the file at path if there is one, to stdout otherwise.
+    """
+
+    level: str = "INFO"
+    sample_rate: float = 1.0
+    slow_request: Optional[float] = None
+    path: Optional[str] = None
+    queue_size: int = 10000
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats a record as a single line of JSON,
+    merging in the fields passed as extra={"fields": {...}}.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "trace_id": getattr(record, "trace_id", None),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Drops a record instead of waiting when the queue is full."""
+
+    def __init__(self, records: queue.Queue):
+        super().__init__(records)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolves everything bound to the current context or to the caller's
+        # objects before the record leaves for another thread,
+        # but leaves the formatting to the listener
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if getattr(record, "request_id", None) is None:
+            record.request_id = REQUEST_ID.get()
+        span = CURRENT_SPAN.get()
+        if span is not None:
+            record.trace_id = span.trace_id
+        return record
+
+
+class LogListener(QueueListener):
+    """A QueueListener that can be started and stopped any number of times,
+    so that an app's shutdown doesn't depend on what happened before it.
+    """
+
+    def start(self) -> None:
+        if self._thread is None:
+            super().start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            super().stop()
+
+
+def configure_logging(settings: LoggingSettings) -> LogListener:
+    """Routes the records of the package through a queue to a JSON writer.
+    Returns its listener, which is left to the app to start and stop.
+    """
+
+    if settings.path is not None:
+        writer: logging.Handler = logging.FileHandler(settings.path)
+    else:
+        writer = logging.StreamHandler(sys.stdout)
+    writer.setFormatter(JSONFormatter())
+
+    records: queue.Queue = queue.Queue(settings.queue_size)
+    for handler in list(LOGGER.handlers):
+        if isinstance(handler, NonBlockingQueueHandler):
+            LOGGER.removeHandler(handler)
+    LOGGER.addHandler(NonBlockingQueueHandler(records))
+    LOGGER.setLevel(settings.level)
+    LOGGER.propagate = False
+    return LogListener(records, writer)
+
+
+def get_log_headers() -> Dict[str, str]:
+    """Returns the headers forwarding the current request id upstream."""
+
+    request_id = REQUEST_ID.get()
+    return {REQUEST_ID_HEADER: request_id} if request_id is not None else {}
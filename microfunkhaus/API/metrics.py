@@ -0,0 +1,248 @@
+"""Collects the metrics of a worker and renders them for Prometheus."""
+
+import asyncio
+from bisect import bisect_left
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from aiohttp import TraceConfig
+
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+Labels = Tuple[str, ...]
+
+
+def format_labels(names: Sequence[str], values: Labels, **extra: str) -> str:
+    pairs = [*zip(names, values), *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+    """A monotonic counter per combination of labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{format_labels(self.labels, labels)} {value}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Gauge:
+    """A value read at the time of a scrape from a callback,
+    which returns it per combination of labels.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Sequence[str] = (),
+        collect: Callable[[], Dict[Labels, float]] = dict,
+        ):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{format_labels(self.labels, labels)} {value}"
+            for labels, value in self.collect().items()
+        ]
+
+
+class CollectedCounter(Gauge):
+    """A monotonic counter kept elsewhere, e.g. by the attributes of an object,
+    read at the time of a scrape from a callback.
+    """
+
+    kind = "counter"
+
+
+class Histogram:
+    """Counts observations into buckets per combination of labels.
+    Only the bucket an observation falls into is incremented,
+    the cumulative counts are computed on a scrape.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+        ):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._counts: Dict[Labels, List[int]] = {}
+        self._sums: Dict[Labels, float] = {}
+
+    def observe(self, *labels: str, value: float) -> None:
+        counts = self._counts.get(labels)
+        if counts is None:
+            counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+            self._sums[labels] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self._sums[labels] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, counts in self._counts.items():
+            total = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                total += count
+                le = format_labels(self.labels, labels, le=str(bound))
+                lines.append(f"{self.name}_bucket{le} {total}")
+            plain = format_labels(self.labels, labels)
+            lines.append(f"{self.name}_sum{plain} {self._sums[labels]}")
+            lines.append(f"{self.name}_count{plain} {total}")
+        return lines
+
+
+class MetricsRegistry:
+    """Renders all of the registered metrics in the Prometheus text format,
+    along with the ones of the registry it extends, if any.
+
+    An app registers the metrics of its own objects in a registry
+    extending the module-level one, so that several apps in a process
+    don't overwrite each other's.
+    """
+
+    def __init__(self, extends: Optional["MetricsRegistry"] = None):
+        self.extends = extends
+        self.metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def collect(self) -> Dict[str, object]:
+        if self.extends is None:
+            return self.metrics
+        return {**self.extends.collect(), **self.metrics}
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.collect().values():
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REQUESTS = REGISTRY.register(
+    Counter(
+        "microfunkhaus_requests_total",
+        "Requests served, by route, method and status.",
+        ("route", "method", "status"),
+    )
+)
+REQUEST_DURATION = REGISTRY.register(
+    Histogram(
+        "microfunkhaus_request_duration_seconds",
+        "Time to respond, by route and method.",
+        ("route", "method"),
+    )
+)
+UPSTREAM_CONNECT = REGISTRY.register(
+    Histogram(
+        "microfunkhaus_upstream_connect_seconds",
+        "Time to open a new connection to a remote endpoint.",
+        ("endpoint",),
+    )
+)
+UPSTREAM_TTFB = REGISTRY.register(
+    Histogram(
+        "microfunkhaus_upstream_ttfb_seconds",
+        "Time from sending a request to receiving the response headers.",
+        ("endpoint",),
+    )
+)
+UPSTREAM_DURATION = REGISTRY.register(
+    Histogram(
+        "microfunkhaus_upstream_duration_seconds",
+        "Time of a single request to a remote endpoint, by outcome.",
+        ("endpoint", "outcome"),
+    )
+)
+UPSTREAM_BYTES = REGISTRY.register(
+    Histogram(
+        "microfunkhaus_upstream_response_bytes",
+        "Size of the responses of a remote endpoint.",
+        ("endpoint",),
+        SIZE_BUCKETS,
+    )
+)
+TASKS = REGISTRY.register(
+    Gauge(
+        "microfunkhaus_tasks",
+        "Tasks alive in the event loop of the worker.",
+        collect=lambda: {(): len(asyncio.all_tasks())},
+    )
+)
+
+
+def make_trace_config() -> TraceConfig:
+    """Times the connection and the first byte of the requests
+    made with a trace_request_ctx that names their endpoint.
+    """
+
+    async def on_request_start(session, context, params):
+        context.started_at = asyncio.get_running_loop().time()
+
+    async def on_connection_create_start(session, context, params):
+        context.connecting_at = asyncio.get_running_loop().time()
+
+    async def on_connection_create_end(session, context, params):
+        connecting_at = getattr(context, "connecting_at", None)
+        endpoint = get_traced_endpoint(context)
+        if connecting_at is not None and endpoint is not None:
+            elapsed = asyncio.get_running_loop().time() - connecting_at
+            UPSTREAM_CONNECT.observe(endpoint, value=elapsed)
+
+    async def on_request_end(session, context, params):
+        started_at = getattr(context, "started_at", None)
+        endpoint = get_traced_endpoint(context)
+        if started_at is not None and endpoint is not None:
+            elapsed = asyncio.get_running_loop().time() - started_at
+            UPSTREAM_TTFB.observe(endpoint, value=elapsed)
+
+    trace_config = TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_request_end.append(on_request_end)
+    return trace_config
+
+
+def get_traced_endpoint(context: SimpleNamespace):
+    request_context = getattr(context, "trace_request_ctx", None)
+    return getattr(request_context, "endpoint", None)
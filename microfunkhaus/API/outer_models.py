@@ -9,18 +9,32 @@ from chrdiotypes.data_enums import (
     ChordGravities,
     NodeIDs,
     NotesInt,
-    NotesSym,
     ChordSymbolStructures,
     GraphNames,
     PerformanceFlags,
-    ChordTypes,
-    StructureSymbols,
-    StructureValues,
     enum_encoders,
 )
 
 from chrdiotypes.transport import GenericUser
 from chrdiotypes.musical import NodeFields
+from .conversions import NOTE_SYMBOLS, CHORD_TYPES, FLAVORS
+
+
+def get_human_readable(
+    nodes: Sequence[NodeFields],
+    structures: Sequence[ChordSymbolStructures],
+    key: NotesInt,
+    ) -> list:
+    """Names every chord in the key: its root, type and flavor."""
+
+    return [
+        (
+            NOTE_SYMBOLS[(node.base + key) % 12],
+            CHORD_TYPES[node.node_id],
+            FLAVORS[structure],
+        )
+        for node, structure in zip(nodes, structures)
+    ]
 
 
 class User(GenericUser):
@@ -169,18 +183,9 @@ class PerformanceResponse(BaseModel):
             # If this check isn't here, somehow it tries to validate Performance instance,
             # which is in Union[Performance, PerformanceResponse] on PerformanceRequest.
 
-            names_and_types = [
-                (
-                    NotesSym[NotesInt((node.base + values["key"]) % 12).name].value,
-                    ChordTypes(node.node_id.value[-1]).name.lower(),
-                )
-                for node in values["nodes"]
-            ]
-            flavors = [
-                StructureValues[StructureSymbols(structure.value[-1]).name].value
-                for structure in values["structures"]
-            ]
-            values["human_readable"] = list(zip(*zip(*names_and_types), flavors))
+            values["human_readable"] = get_human_readable(
+                values["nodes"], values["structures"], values["key"]
+            )
 
         return values
 
@@ -204,6 +209,21 @@ class PerformanceResponse(BaseModel):
     #         raise ValueError('Performance is missing required values to create a PerformanceResponse')
 
 
+class ProgressionPreview(BaseModel):
+    """The chords of a performance, known before its voices and MIDI are."""
+
+    class Config:
+        json_encoders = enum_encoders
+        title = "Progression Preview Object"
+
+    key: NotesInt
+    graph: GraphNames
+    structures: Sequence[ChordSymbolStructures]
+    changeabilities: Sequence[bool]
+    human_readable: Sequence[Tuple[str, str, Union[int, None]]]
+    nodes: Sequence[NodeFields]
+
+
 class GenericRequest(BaseModel):
     """Basic options provider"""
 
@@ -290,3 +310,29 @@ class AmendmentRequest(PerformanceRequest):
         }
 
     performance_object: PerformanceResponse
+
+
+class BatchItemResponse(BaseModel):
+    """Outcome of a single item of a batch, either a performance or an error."""
+
+    class Config:
+        json_encoders = enum_encoders
+        title = "Batch Item Response Object"
+
+    status: int = Field(
+        ...,
+        title="Status",
+        description="The HTTP status the item would have had on its own.",
+        example=200,
+    )
+    performance: Optional[PerformanceResponse] = Field(
+        default=None,
+        title="Performance",
+        description="The generated performance, if there was no error.",
+    )
+    detail: Optional[str] = Field(
+        default=None,
+        title="Detail",
+        description="The error description, if there was one.",
+        example=None,
+    )
@@ -0,0 +1,122 @@
+"""Keeps long-lived connection pools to the remote services."""
+
+import asyncio
+from typing import Dict, Iterable, Optional, Tuple
+from aiohttp import ClientSession, TCPConnector
+from .endpoints import Endpoint, PoolSettings, Replica
+from .metrics import make_trace_config
+
+
+class SessionPool:
+    """Holds one pooled ClientSession per remote address
+    for the lifetime of a worker.
+
+    Endpoints sharing a host and a port share a connector,
+    configured by the first of them to be registered.
+    Every replica of an endpoint is an address of its own.
+    Settings given to the pool itself replace the endpoints' own
+    for every address.
+    """
+
+    def __init__(
+        self,
+        endpoints: Iterable[Endpoint] = (),
+        settings: Optional[PoolSettings] = None,
+        ):
+        self.settings = settings
+        self._settings: Dict[Tuple[str, str], PoolSettings] = {}
+        self._sessions: Dict[Tuple[str, str], ClientSession] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closing: Optional[asyncio.Future] = None
+        for endpoint in endpoints:
+            for replica in endpoint.get_replicas():
+                self._settings.setdefault(replica.address, settings or endpoint.pool)
+
+    async def open(self) -> None:
+        """Creates sessions for all of the registered addresses."""
+
+        for address in self._settings:
+            self._get_session(address)
+
+    async def close(self) -> None:
+        """Closes all sessions and their connectors."""
+
+        sessions = tuple(self._sessions.values())
+        self._sessions.clear()
+        self._loop = None
+        closing, self._closing = self._closing, None
+        if closing is not None:
+            await closing
+        await asyncio.gather(*(session.close() for session in sessions))
+
+    def session_for(
+        self, endpoint: Endpoint, replica: Optional[Replica] = None
+        ) -> ClientSession:
+        """Returns the pooled session for the address of the endpoint's replica,
+        its own address by default.
+        Opens it lazily, e.g. if the startup hook hasn't run
+        or the replica was added by a reload.
+        """
+
+        address = endpoint.address if replica is None else replica.address
+        self._settings.setdefault(address, self.settings or endpoint.pool)
+        return self._get_session(address)
+
+    async def prune(self, addresses: Iterable[Tuple[str, str]]) -> None:
+        """Closes the sessions of every address but the given ones,
+        e.g. of the replicas removed by a reload.
+        """
+
+        kept = set(addresses)
+        for address in tuple(self._settings):
+            if address not in kept:
+                del self._settings[address]
+        stale = [
+            self._sessions.pop(address)
+            for address in tuple(self._sessions)
+            if address not in kept
+        ]
+        await asyncio.gather(*(session.close() for session in stale))
+
+    def utilization(self) -> Dict[Tuple[str, str], float]:
+        """Reports the connections in use and the limit of every open pool."""
+
+        report = {}
+        for (host, port), session in self._sessions.items():
+            connector = session.connector
+            if connector is None or session.closed:
+                continue
+            address = f"{host}:{port}"
+            # aiohttp exposes no public counter of the connections in use,
+            # _acquired is an internal of the 3.x connectors pinned in pyproject.toml
+            acquired = getattr(connector, "_acquired", None)
+            if acquired is not None:
+                report[(address, "acquired")] = len(acquired)
+            report[(address, "limit")] = connector.limit
+        return report
+
+    def _get_session(self, address: Tuple[str, str]) -> ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Sessions are bound to the loop they were created in,
+            # the ones left from a finished loop are closed, not reused.
+            # Their connectors release what they can without that loop.
+            stale = tuple(self._sessions.values())
+            self._sessions.clear()
+            self._loop = loop
+            if stale:
+                self._closing = asyncio.gather(*(session.close() for session in stale))
+        session = self._sessions.get(address)
+        if session is None or session.closed:
+            settings = self._settings[address]
+            connector = TCPConnector(
+                limit=settings.limit,
+                keepalive_timeout=settings.keepalive_timeout,
+                use_dns_cache=settings.use_dns_cache,
+                ttl_dns_cache=settings.ttl_dns_cache,
+            )
+            session = ClientSession(
+                connector=connector, trace_configs=[make_trace_config()]
+            )
+            self._sessions[address] = session
+        return session
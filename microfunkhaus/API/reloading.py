@@ -0,0 +1,117 @@
+"""Reloads the registry of endpoints when its file changes, without a restart."""
+
+import os
+import asyncio
+from typing import Optional, Set
+from pydantic import BaseModel
+from .endpoints import ENDPOINTS, HEALTHPOINTS, load_endpoints, update_endpoints
+from .balancing import refresh_selectors
+from .breakers import BREAKERS
+from .caching import CACHES
+from .coalescing import COALESCERS
+from .pool import SessionPool
+from .logs import LOGGER
+
+
+class ReloadSettings(BaseModel):
+    """Where the registry of endpoints is read from
+    and how often (in seconds) it's checked for changes.
+    No interval turns the reloading off.
+    """
+
+    path: str = ".endpoints.json"
+    interval: Optional[float] = 5.0
+
+
+class EndpointsWatcher:
+    """Polls the modification time of the endpoints file
+    and replaces the registry with its contents once it changes.
+
+    A file that can't be read or validated is logged and ignored,
+    the current registry stays in place until it's fixed.
+    The breakers, caches and coalescers of the changed endpoints are dropped,
+    so that the next request creates them with the new settings.
+    Their selectors are rebuilt, the ones of removed endpoints dropped,
+    and so are the pooled sessions of the addresses no longer in use.
+    """
+
+    def __init__(self, settings: ReloadSettings, pool: Optional[SessionPool] = None):
+        self.settings = settings
+        self.pool = pool
+        self._mtime = self._stat()
+        self._task: Optional[asyncio.Task] = None
+        self.reloads = 0
+        self.failures = 0
+
+    async def open(self) -> None:
+        if self.settings.interval is not None and self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def close(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def check(self) -> Set[str]:
+        """Reloads the registry if the file has changed since the last check.
+        Returns the names of the endpoints added, changed or removed.
+        """
+
+        mtime = self._stat()
+        if mtime is None or mtime == self._mtime:
+            return set()
+        self._mtime = mtime
+        try:
+            endpoints = load_endpoints(self.settings.path)
+        except Exception as e:
+            self.failures += 1
+            LOGGER.warning(
+                "Could not reload the endpoints, keeping the current ones.",
+                extra={"fields": {"path": self.settings.path, "error": str(e)}},
+            )
+            return set()
+        changed = update_endpoints(endpoints)
+        for name in changed:
+            BREAKERS.pop(name, None)
+            CACHES.pop(name, None)
+            COALESCERS.pop(name, None)
+        bulk_endpoints = {
+            coalescer.bulk_endpoint.name: coalescer.bulk_endpoint
+            for coalescer in COALESCERS.values()
+        }
+        refresh_selectors({**ENDPOINTS, **bulk_endpoints})
+        if self.pool is not None:
+            await self.pool.prune(
+                replica.address
+                for endpoint in (*ENDPOINTS.values(), *HEALTHPOINTS)
+                for replica in endpoint.get_replicas()
+            )
+        self.reloads += 1
+        if changed:
+            LOGGER.info(
+                "Endpoints reloaded.",
+                extra={"fields": {"changed": sorted(changed)}},
+            )
+        return changed
+
+    def snapshot(self) -> dict:
+        return {
+            "path": self.settings.path,
+            "reloads": self.reloads,
+            "failures": self.failures,
+        }
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.settings.interval)
+            try:
+                await self.check()
+            except Exception:
+                LOGGER.exception("Endpoints reload failed.")
+
+    def _stat(self) -> Optional[int]:
+        try:
+            return os.stat(self.settings.path).st_mtime_ns
+        except OSError:
+            return None
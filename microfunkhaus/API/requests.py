@@ -1,7 +1,9 @@
 from typing import Optional, Tuple, Union
-from aiohttp import ClientSession
 
-from .engine import instant_fire_coroutines, post_single_request
+from .engine import post_single_request
+from .dispatching import DataDispatcher
+from .pool import SessionPool
+from .deadlines import Deadline
 from .adapter_functions import (
     construct_progression_request,
     construct_cheet_sheet,
@@ -28,6 +30,30 @@ from .endpoints import (
 )
 
 
+def get_generation_dependencies(
+    performance: Union[Performance, PerformanceResponse]
+    ) -> Tuple[Endpoint, ...]:
+    """Lists the endpoints called in a row to generate a performance."""
+
+    chain = (
+        ENDPOINTS["microvoicemaster/perform"],
+        ENDPOINTS["microbureaucrat/savemidi"],
+    )
+    if isinstance(performance, PerformanceResponse):
+        return chain
+    return (ENDPOINTS["micropathforger/generate"], *chain)
+
+
+def get_amendment_dependencies() -> Tuple[Endpoint, ...]:
+    """Lists the endpoints called in a row to amend a performance."""
+
+    return (
+        ENDPOINTS["micropathforger/amend"],
+        ENDPOINTS["microvoicemaster/perform"],
+        ENDPOINTS["microbureaucrat/savemidi"],
+    )
+
+
 def get_req_progression_generation(
     performance: Union[Performance, PerformanceResponse]
     ) -> Tuple[Endpoint, ProgressionRequest]:
@@ -41,14 +67,14 @@ def get_req_progression_generation(
 
 def get_req_progression_amendment(
     performance: PerformanceResponse, index: int
-    ) -> Tuple[Endpoint, ProgressionFields]:
+    ) -> Tuple[Endpoint, ProgressionFields, str]:
     """Constructs a valid endpoint-payload pair
-    to request an amendment execution from the 'micropathforger'.
+    to request an amendment execution from the 'micropathforger',
+    followed by the option of the call: the index of the chord to amend.
     """
 
     endpoint = ENDPOINTS["micropathforger/amend"]
-    endpoint.option = str(index)
-    return (endpoint, construct_progression(performance))
+    return (endpoint, construct_progression(performance), str(index))
 
 
 def get_req_voices_generation(
@@ -105,20 +131,25 @@ ENSUREMENT_REQUEST_METHODS = {
 }
 
 
+async def post_data(
+    data: Union[UserTransport, SessionTransport, LabelTransport],
+    *,
+    pool: SessionPool,
+    deadline: Optional[Deadline] = None,
+    ) -> bytes:
+    """Sends a single piece of data to the 'microaccountant'."""
+
+    request = ENSUREMENT_REQUEST_METHODS[type(data)](data)
+    return await post_single_request(*request, pool=pool, deadline=deadline)
+
+
 def submit_data_tasks(
     *data: Union[UserTransport, SessionTransport, LabelTransport],
-    storage: set,
-    session: ClientSession,
+    dispatcher: DataDispatcher,
     ) -> None:
-    """Immidiately sends data to the 'microaccountant',
-    but doesn't wait on its response.
+    """Queues data for the 'microaccountant'
+    without making anybody wait on its delivery.
     """
 
-    coroutines = [
-        post_single_request(
-            *ENSUREMENT_REQUEST_METHODS[type(data)](data), session=session
-        )
-        for data in data
-    ]
-    new_tasks = instant_fire_coroutines(*coroutines)
-    storage.update(new_tasks)
+    for item in data:
+        dispatcher.submit(item)
@@ -0,0 +1,43 @@
+"""Backoff and hedging helpers for retrying idempotent remote calls."""
+
+import random
+from collections import deque
+from typing import Deque, Dict, Optional
+from .endpoints import Endpoint
+
+
+LATENCY_SAMPLES = 100
+
+# Latencies of the latest successful calls, per endpoint name within a worker
+LATENCIES: Dict[str, Deque[float]] = {}
+
+
+def record_latency(endpoint: Endpoint, seconds: float) -> None:
+    samples = LATENCIES.get(endpoint.name)
+    if samples is None:
+        samples = LATENCIES[endpoint.name] = deque(maxlen=LATENCY_SAMPLES)
+    samples.append(seconds)
+
+
+def get_backoff_delay(endpoint: Endpoint, attempt: int) -> float:
+    """Returns a random delay (in seconds) before the next attempt,
+    the upper bound doubling with every failed one ("full jitter").
+    """
+
+    policy = endpoint.retry
+    ceiling = min(policy.backoff_max, policy.backoff * 2 ** (attempt - 1))
+    return random.uniform(0, ceiling)
+
+
+def get_hedge_delay(endpoint: Endpoint) -> Optional[float]:
+    """Returns how long to wait on a request before hedging it,
+    or None if hedging is off or there are too few samples yet.
+    """
+
+    policy = endpoint.retry
+    samples = LATENCIES.get(endpoint.name)
+    if not policy.hedge or samples is None or len(samples) < policy.hedge_min_samples:
+        return None
+    ordered = sorted(samples)
+    index = min(int(len(ordered) * policy.hedge_quantile), len(ordered) - 1)
+    return ordered[index]
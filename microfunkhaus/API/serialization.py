@@ -0,0 +1,186 @@
+"""JSON encoding and decoding of the payloads, straight to and from bytes.
+
+Uses orjson if it's installed, the standard library otherwise.
+The output is the same either way, but for the floats:
+orjson writes e.g. 1e-7 rather than 1e-07 and NaN as null.
+Integers beyond 64 bits, which orjson rejects, are left to the standard library.
+"""
+
+import json
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, TypeVar, Union
+from pydantic import BaseModel
+from pydantic.fields import (
+    ModelField,
+    SHAPE_LIST,
+    SHAPE_SEQUENCE,
+    SHAPE_SINGLETON,
+    SHAPE_TUPLE,
+    SHAPE_TUPLE_ELLIPSIS,
+)
+from pydantic.json import pydantic_encoder
+from pydantic.utils import lenient_issubclass
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+Model = TypeVar("Model", bound=BaseModel)
+Converter = Optional[Callable[[Any], Any]]  # None if the value is used as is
+
+
+def dumps(obj: Any, *, sort_keys: bool = False) -> bytes:
+    """Encodes an object made of JSON types, enums and whatever pydantic can encode."""
+
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=pydantic_encoder, option=option)
+        except orjson.JSONEncodeError:
+            pass  # The standard library raises its own error if it can't either
+    return json.dumps(
+        obj,
+        default=pydantic_encoder,
+        sort_keys=sort_keys,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    ).encode()
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def parse_model(
+    model: Type[Model], data: Union[bytes, str], *, trusted: bool = False
+    ) -> Model:
+    """Validates a model from a JSON body without decoding it to a string first,
+    which is what parse_raw does.
+
+    Only builds it with construct_model if the body comes from a trusted source.
+    """
+
+    if trusted:
+        return construct_model(model, loads(data))
+    return model.parse_obj(loads(data))
+
+
+# The (name, alias, converter) of every field, per model
+FIELD_CONVERTERS: Dict[type, List[Tuple[str, str, Converter]]] = {}
+
+
+def construct_model(model: Type[Model], obj: dict) -> Model:
+    """Builds a model from a decoded JSON object without validating it.
+
+    Nested models and enums are still built from their values,
+    the fields of other types are taken as they are,
+    so the object has to be valid in the first place.
+    """
+
+    converters = FIELD_CONVERTERS.get(model)
+    if converters is None:
+        converters = FIELD_CONVERTERS[model] = [
+            (name, field.alias, make_converter(field))
+            for name, field in model.__fields__.items()
+        ]
+    values = {}
+    for name, alias, convert in converters:
+        if alias in obj:
+            value = obj[alias]
+            values[name] = value if convert is None else convert(value)
+    return model.construct(**values)
+
+
+def make_converter(field: ModelField) -> Converter:
+    convert = make_shaped_converter(field)
+    if convert is None or not field.allow_none:
+        return convert
+    return lambda value: None if value is None else convert(value)
+
+
+def make_shaped_converter(field: ModelField) -> Converter:
+    if field.shape == SHAPE_SINGLETON and not field.sub_fields:
+        if lenient_issubclass(field.type_, BaseModel):
+            return lambda value: construct_model(field.type_, value)
+        if lenient_issubclass(field.type_, Enum):
+            return field.type_
+        if field.type_ in (str, int, float, bool, Any):
+            return None
+    elif field.shape in (SHAPE_LIST, SHAPE_SEQUENCE) and field.sub_fields:
+        convert = make_converter(field.sub_fields[0])
+        if convert is None:
+            return None
+        return lambda value: [convert(item) for item in value]
+    elif field.shape == SHAPE_TUPLE_ELLIPSIS and field.sub_fields:
+        convert = make_converter(field.sub_fields[0])
+        if convert is None:
+            return tuple
+        return lambda value: tuple(convert(item) for item in value)
+    elif field.shape == SHAPE_TUPLE and field.sub_fields:
+        converters = [make_converter(sub_field) for sub_field in field.sub_fields]
+        return lambda value: tuple(
+            item if convert is None else convert(item)
+            for convert, item in zip(converters, value)
+        )
+    # Anything else, e.g. a union, is left to the field's own validation
+    return lambda value: field.validate(value, {}, loc=field.alias)[0]
+
+
+def prepare(payload: BaseModel) -> Any:
+    """Returns the fields of a model, ready to be encoded with dumps.
+
+    A cheaper stand-in for FastAPI's jsonable_encoder:
+    only the values with a custom encoder in the model's config are converted,
+    the rest is left to dumps.
+    """
+
+    data = payload.dict(by_alias=True)
+    if "__root__" in data:
+        data = data["__root__"]
+    encoders = payload.__config__.json_encoders
+    return apply_encoders(data, encoders) if encoders else data
+
+
+def apply_encoders(obj: Any, encoders: Dict[Any, Any]) -> Any:
+    encode = encoders.get(type(obj))
+    if encode is not None:
+        return encode(obj)
+    if isinstance(obj, dict):
+        return {key: apply_encoders(value, encoders) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [apply_encoders(item, encoders) for item in obj]
+    return obj
+
+
+class FastJSONResponse(JSONResponse):
+    """A JSONResponse rendered with dumps, i.e. with orjson if it's installed."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class ModelResponse(FastJSONResponse):
+    """Renders a model, or a list of them, that is valid by construction.
+
+    Returned from a route, it skips FastAPI's handling of the response_model,
+    which would turn the model into a dict, validate it again and encode it.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return dumps(prepare(content))
+        if isinstance(content, list):
+            return dumps(
+                [
+                    prepare(item) if isinstance(item, BaseModel) else item
+                    for item in content
+                ]
+            )
+        return dumps(content)
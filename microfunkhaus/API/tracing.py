@@ -0,0 +1,226 @@
+"""Traces requests across the gateway and the remote services.
+
+Spans follow the W3C Trace Context: a request carrying a 'traceparent'
+header continues the caller's trace, and every remote call forwards it.
+"""
+
+import json
+import time
+import secrets
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+from pydantic import BaseModel
+
+
+TRACEPARENT_HEADER = "traceparent"
+
+
+class TracingSettings(BaseModel):
+    """Tracing options.
+
+    The 'memory' exporter keeps the latest max_spans spans,
+    the 'file' one appends them to the file at path as JSON lines.
+    """
+
+    enabled: bool = False
+    exporter: str = "memory"
+    path: Optional[str] = None
+    max_spans: int = 10000
+    flush_every: int = 64
+
+
+class Span:
+    """A timed operation within a trace."""
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "attributes",
+        "status",
+        "start",
+        "end",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str] = None,
+        attributes: Optional[dict] = None,
+        ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.status = "ok"
+        self.start = time.time()
+        self.end: Optional[float] = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "end": self.end,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+# The span being run in the current context, if any
+CURRENT_SPAN: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class SpanExporter(ABC):
+    def __init__(self, settings: TracingSettings):
+        self.settings = settings
+
+    @abstractmethod
+    def export(self, span: Span) -> None:
+        ...
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryExporter(SpanExporter):
+    """Keeps the finished spans in memory, e.g. for the tests."""
+
+    def __init__(self, settings: TracingSettings):
+        super().__init__(settings)
+        self.spans: Deque[Span] = deque(maxlen=settings.max_spans)
+
+    def export(self, span: Span) -> None:
+        self.spans.append(span)
+
+    def get_trace(self, trace_id: str) -> List[Span]:
+        return [span for span in self.spans if span.trace_id == trace_id]
+
+
+class FileExporter(SpanExporter):
+    """Appends the finished spans to a file, a batch at a time."""
+
+    def __init__(self, settings: TracingSettings):
+        super().__init__(settings)
+        self.path = settings.path or "traces.jsonl"
+        self._buffer: List[str] = []
+
+    def export(self, span: Span) -> None:
+        self._buffer.append(json.dumps(span.to_dict(), default=str))
+        if len(self._buffer) >= self.settings.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        lines, self._buffer = self._buffer, []
+        if lines:
+            with open(self.path, "a") as trace_file:
+                trace_file.write("\n".join(lines) + "\n")
+
+    def close(self) -> None:
+        self.flush()
+
+
+EXPORTERS = {
+    "memory": MemoryExporter,
+    "file": FileExporter,
+}
+
+
+class Tracer:
+    """Starts spans, nested under the current one,
+    and hands them to the exporter once they end.
+    Does nothing at all until it gets an exporter.
+    """
+
+    def __init__(self):
+        self.exporter: Optional[SpanExporter] = None
+
+    @contextmanager
+    def span(
+        self,
+        name: str,
+        *,
+        parent: Optional[Tuple[str, str]] = None,
+        **attributes,
+        ) -> Iterator[Optional[Span]]:
+        """Runs the block within a new span.
+        A parent given as (trace_id, span_id) takes precedence over the current span.
+        """
+
+        exporter = self.exporter
+        if exporter is None:
+            yield None
+            return
+        current = CURRENT_SPAN.get()
+        if parent is not None:
+            trace_id, parent_id = parent
+        elif current is not None:
+            trace_id, parent_id = current.trace_id, current.span_id
+        else:
+            trace_id, parent_id = secrets.token_hex(16), None
+        span = Span(name, trace_id, parent_id, attributes)
+        token = CURRENT_SPAN.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            span.end = time.time()
+            CURRENT_SPAN.reset(token)
+            exporter.export(span)
+
+
+TRACER = Tracer()
+
+
+def configure_tracing(settings: TracingSettings) -> Optional[SpanExporter]:
+    """Sets up the exporter of the tracer, or turns the tracing off."""
+
+    if TRACER.exporter is not None:
+        TRACER.exporter.close()
+    TRACER.exporter = None
+    if settings.enabled:
+        TRACER.exporter = EXPORTERS[settings.exporter](settings)
+    return TRACER.exporter
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Returns the trace id and the parent span id of a valid 'traceparent'."""
+
+    if header is None:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    version, trace_id, parent_id, _ = parts
+    try:
+        int(trace_id, 16), int(parent_id, 16)
+    except ValueError:
+        return None
+    if version == "ff" or trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id
+
+
+def get_trace_headers() -> Dict[str, str]:
+    """Returns the headers continuing the current trace upstream."""
+
+    span = CURRENT_SPAN.get()
+    return {TRACEPARENT_HEADER: span.traceparent} if span is not None else {}
@@ -0,0 +1,184 @@
+"""Transposes served performances locally, without calling the remote services."""
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from chrdiotypes.data_enums import NotesInt
+from .outer_models import PerformanceResponse
+
+
+PERCUSSION_CHANNEL = 9
+NOTE_STATUSES = (0x80, 0x90, 0xA0)  # Note off, note on, polyphonic aftertouch
+
+
+def read_varlen(data: bytearray, position: int) -> Tuple[int, int]:
+    """Reads a MIDI variable-length quantity.
+    Returns the value and the position right after it.
+    """
+
+    value = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, position
+
+
+def walk_notes(data: bytearray, shift: int = 0) -> List[Tuple[int, int]]:
+    """Walks over all tracks of a standard MIDI file,
+    shifting the notes of the melodic channels in place by the given halftones.
+    Returns the (absolute tick, note) pairs of the resulting note-on events.
+
+    Raises ValueError if the data is malformed
+    or a note gets out of the MIDI range.
+    """
+
+    notes = []
+    position = 0
+    try:
+        while position < len(data):
+            chunk_type = bytes(data[position : position + 4])
+            length = int.from_bytes(data[position + 4 : position + 8], "big")
+            position += 8
+            end = position + length
+            if chunk_type == b"MTrk":
+                walk_track(data, position, end, shift, notes)
+            position = end
+    except IndexError:
+        raise ValueError("Malformed MIDI data.")
+    return notes
+
+
+def walk_track(
+    data: bytearray, position: int, end: int, shift: int, notes: list
+    ) -> None:
+    tick = 0
+    status = 0
+    while position < end:
+        delta, position = read_varlen(data, position)
+        tick += delta
+        if data[position] & 0x80:
+            status = data[position]
+            position += 1
+        elif not status:
+            raise ValueError("Malformed MIDI data.")
+        if status == 0xFF:  # Meta event, starts with its type
+            length, position = read_varlen(data, position + 1)
+            position += length
+            status = 0
+        elif status in (0xF0, 0xF7):  # System exclusive
+            length, position = read_varlen(data, position)
+            position += length
+            status = 0
+        else:
+            kind, channel = status & 0xF0, status & 0x0F
+            if kind in NOTE_STATUSES and channel != PERCUSSION_CHANNEL:
+                note = data[position] + shift
+                if not 0 <= note <= 127:
+                    raise ValueError("Transposition gets out of the MIDI range.")
+                data[position] = note
+                if kind == 0x90 and data[position + 1]:
+                    notes.append((tick, note))
+            position += 1 if kind in (0xC0, 0xD0) else 2
+
+
+def transpose_hex_blob(hex_blob: str, shift: int) -> str:
+    """Shifts every melodic note of a hex-encoded MIDI file by the halftones."""
+
+    data = bytearray.fromhex(hex_blob)
+    walk_notes(data, shift)
+    return data.hex()
+
+
+def read_hex_blob_notes(hex_blob: str) -> List[Tuple[int, int]]:
+    """Returns the (absolute tick, note) pairs of a hex-encoded MIDI file."""
+
+    return walk_notes(bytearray.fromhex(hex_blob))
+
+
+def get_shift(old_key: int, new_key: int) -> int:
+    """The smallest shift in halftones between keys, within [-5, 6]."""
+
+    shift = (new_key - old_key) % 12
+    return shift - 12 if shift > 6 else shift
+
+
+def get_fingerprint(performance: PerformanceResponse) -> tuple:
+    """Everything but the key and the MIDI that identifies a progression."""
+
+    return (
+        performance.graph,
+        tuple(performance.nodes),
+        tuple(performance.structures),
+        tuple(performance.changeabilities),
+    )
+
+
+class ServedPerformances:
+    """Remembers the MIDI of the latest served performances
+    in every key they were served in, up to a number of tickets.
+    """
+
+    def __init__(self, max_tickets: int = 4096):
+        self.max_tickets = max_tickets
+        self._served: "OrderedDict[str, Tuple[tuple, Dict[str, int]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def remember(self, performance: PerformanceResponse) -> None:
+        fingerprint = get_fingerprint(performance)
+        served = self._served.get(performance.ticket)
+        if served is None or served[0] != fingerprint:
+            served = (fingerprint, {})
+            self._served[performance.ticket] = served
+        served[1][performance.hex_blob] = int(performance.key)
+        self._served.move_to_end(performance.ticket)
+        while len(self._served) > self.max_tickets:
+            self._served.popitem(last=False)
+
+    def transpose(
+        self, performance: PerformanceResponse
+        ) -> Optional[PerformanceResponse]:
+        """Returns the performance in its requested key if it's a verbatim copy
+        of a served one with only the key changed, otherwise None.
+
+        The result keeps the ticket of the served performance,
+        the only one the remote services know of, so a '/label' of it
+        is attributed to the served performance. Its amendments aren't
+        prefetched, and it doesn't take the ones of the served performance.
+        """
+
+        served = self._served.get(performance.ticket)
+        old_key = None
+        if served is not None and served[0] == get_fingerprint(performance):
+            old_key = served[1].get(performance.hex_blob)
+        if old_key is None or old_key == performance.key:
+            self.misses += 1
+            return None
+
+        try:
+            hex_blob = transpose_hex_blob(
+                performance.hex_blob, get_shift(old_key, performance.key)
+            )
+        except ValueError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        transposed = PerformanceResponse(
+            key=NotesInt(performance.key),
+            graph=performance.graph,
+            ticket=performance.ticket,
+            hex_blob=hex_blob,
+            structures=performance.structures,
+            changeabilities=performance.changeabilities,
+            nodes=performance.nodes,
+        )
+        self.remember(transposed)
+        return transposed
+
+    def snapshot(self) -> dict:
+        return {"tickets": len(self._served), "hits": self.hits, "misses": self.misses}
+
+
+# Performances served by this worker
+SERVED_PERFORMANCES = ServedPerformances()
@@ -1,7 +1,11 @@
 from .scenarios import (
     generate_progression,
+    iterate_generation,
+    generate_progressions,
     send_labels,
     amend_progression,
+    iterate_amendment,
+    perform_amendment,
     # create_user,
-    healthcheck_dependencies,
 )
+from .prefetching import AmendmentPrefetcher, PrefetchSettings
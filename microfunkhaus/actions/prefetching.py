@@ -0,0 +1,186 @@
+"""Speculatively amends performances before the clients ask for it."""
+
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Set, Tuple
+from pydantic import BaseModel
+
+from ..API import PerformanceResponse, Deadline, get_fingerprint
+
+
+class PrefetchSettings(BaseModel):
+    """Limits of the speculative work.
+
+    Nothing new is scheduled while the process uses more than max_cpu
+    of a core or there are max_pending amendments waiting already.
+    Results not asked for within ttl seconds are dropped.
+    """
+
+    enabled: bool = False
+    max_concurrency: int = 4
+    max_pending: int = 64
+    max_cpu: float = 0.75
+    max_items: int = 2048
+    timeout: float = 10.0
+    ttl: float = 300.0
+
+
+Amender = Callable[..., Awaitable[PerformanceResponse]]
+Prefetched = Tuple[tuple, float, asyncio.Task]
+
+
+class AmendmentPrefetcher:
+    """Runs the amendment pipeline for every changeable chord
+    of a freshly generated performance in the background,
+    so that a following '/amend/{index}' is served from memory.
+
+    Results are keyed by the ticket and the index,
+    and only match a verbatim copy of the generated performance.
+    Other performances sharing its ticket leave them untouched.
+    """
+
+    def __init__(self, amend: Amender, settings: PrefetchSettings):
+        self.amend = amend
+        self.settings = settings
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore = asyncio.Semaphore(settings.max_concurrency)
+        self._items: "OrderedDict[Tuple[str, int], Prefetched]" = OrderedDict()
+        self._running: Set[asyncio.Task] = set()
+        self._cpu_sample = (time.monotonic(), time.process_time())
+        self._cpu_load = 0.0
+        self.scheduled = 0
+        self.skipped = 0
+        self.hits = 0
+        self.misses = 0
+        self.wasted = 0
+
+    def schedule(self, performance: PerformanceResponse) -> None:
+        """Starts prefetching the amendments of every changeable chord,
+        unless it's over the budget.
+        """
+
+        self._bind_loop()
+        self._evict()
+        fingerprint = get_fingerprint_with_midi(performance)
+        expires_at = time.monotonic() + self.settings.ttl
+        for index, changeable in enumerate(performance.changeabilities):
+            if not changeable:
+                continue
+            if self._over_budget():
+                self.skipped += 1
+                continue
+            task = asyncio.create_task(self._prefetch(performance, index))
+            self._running.add(task)
+            task.add_done_callback(self._forget)
+            self._items[(performance.ticket, index)] = (fingerprint, expires_at, task)
+            self.scheduled += 1
+
+    async def take(
+        self,
+        performance: PerformanceResponse,
+        index: int,
+        deadline: Optional[Deadline] = None,
+        ) -> Optional[PerformanceResponse]:
+        """Returns the prefetched amendment, waiting for it if it's on its way,
+        but no longer than the deadline of the request allows.
+        Returns None if there is none for this very performance,
+        or it isn't ready in time, it's then kept for a retry.
+        """
+
+        self._bind_loop()
+        item = self._items.get((performance.ticket, index))
+        if item is None:
+            self.misses += 1
+            return None
+        fingerprint, expires_at, task = item
+        if fingerprint != get_fingerprint_with_midi(performance):
+            # Another performance under the same ticket, e.g. a transposed copy,
+            # leaves the prefetch to the one it was made for
+            self.misses += 1
+            return None
+        del self._items[(performance.ticket, index)]
+        timeout = deadline.remaining() if deadline is not None else None
+        try:
+            amended = await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            self.misses += 1
+            if not task.done():
+                self._items[(performance.ticket, index)] = item
+            return None
+        except Exception:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return amended
+
+    async def close(self) -> None:
+        tasks = [task for _, _, task in self._items.values()]
+        self._items.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def snapshot(self) -> dict:
+        taken = self.hits + self.misses
+        return {
+            "scheduled": self.scheduled,
+            "skipped": self.skipped,
+            "hits": self.hits,
+            "misses": self.misses,
+            "wasted": self.wasted,
+            "running": len(self._running),
+            "stored": len(self._items),
+            "hit_ratio": round(self.hits / taken, 3) if taken else 0.0,
+            "cpu_load": round(self._cpu_load, 3),
+        }
+
+    async def _prefetch(
+        self, performance: PerformanceResponse, index: int
+        ) -> PerformanceResponse:
+        async with self._semaphore:
+            deadline = Deadline(self.settings.timeout)
+            return await self.amend(performance, index, deadline=deadline)
+
+    def _bind_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Tasks left from a finished loop will never complete
+            self._items.clear()
+            self._running.clear()
+            self._semaphore = asyncio.Semaphore(self.settings.max_concurrency)
+            self._loop = loop
+
+    def _forget(self, task: asyncio.Task) -> None:
+        self._running.discard(task)
+        if not task.cancelled():
+            # Marks the exception as retrieved in case nobody takes the result
+            task.exception()
+
+    def _over_budget(self) -> bool:
+        if len(self._running) >= self.settings.max_pending:
+            return True
+        return self._measure_cpu() > self.settings.max_cpu
+
+    def _measure_cpu(self) -> float:
+        """Share of a core the process has used since the previous sample."""
+
+        wall, cpu = time.monotonic(), time.process_time()
+        last_wall, last_cpu = self._cpu_sample
+        if wall - last_wall >= 1.0:
+            self._cpu_load = (cpu - last_cpu) / (wall - last_wall)
+            self._cpu_sample = (wall, cpu)
+        return self._cpu_load
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        for key, (_, expires_at, task) in tuple(self._items.items()):
+            if expires_at > now and len(self._items) <= self.settings.max_items:
+                break
+            del self._items[key]
+            task.cancel()
+            self.wasted += 1
+
+
+def get_fingerprint_with_midi(performance: PerformanceResponse) -> tuple:
+    return (get_fingerprint(performance), int(performance.key), performance.hex_blob)
@@ -1,10 +1,12 @@
-import json
 import asyncio
-from typing import Sequence
-from aiohttp import ClientSession, ClientResponseError
+from typing import AsyncIterator, List, Optional, Sequence, Tuple, Union
+from pydantic import BaseModel
 from chrdiotypes.musical import PseudoMIDI, ProgressionFields
 
 from ..API import (
+    get_generation_dependencies,
+    get_amendment_dependencies,
+    ensure_closed,
     get_req_progression_generation,
     get_req_progression_amendment,
     get_req_voices_generation,
@@ -15,18 +17,45 @@ from ..API import (
     PerformanceResponse,
     construct_performance,
     construct_progression,
+    construct_preview,
     construct_session_data,
     construct_user_data,
     construct_label_data,
     post_single_request,
     get_req_midihex_generation,
-    ping_dependency,
-    Endpoint,
+    SessionPool,
+    TRACER,
+    DataDispatcher,
+    Deadline,
+    SERVED_PERFORMANCES,
+    loads,
+    parse_model,
 )
+from .prefetching import AmendmentPrefetcher
 
 
+# A stage name and its outcome:
+# 'progression', 'voices' or 'performance'
+Stage = Tuple[str, BaseModel]
 
-async def generate_progression(full_request: PerformanceRequest) -> PerformanceResponse:
+
+async def get_last_stage(stages: AsyncIterator[Stage]) -> BaseModel:
+    """Runs a scenario through and returns only its final outcome."""
+
+    async for _, outcome in stages:
+        pass
+    return outcome
+
+
+async def iterate_generation(
+    full_request: PerformanceRequest,
+    *,
+    pool: SessionPool,
+    dispatcher: DataDispatcher,
+    deadline: Optional[Deadline] = None,
+    transpose_locally: bool = False,
+    prefetcher: Optional[AmendmentPrefetcher] = None,
+    ) -> AsyncIterator[Stage]:
     """Makes calls to
     the 'micropathforger',
     the 'microvoicemaster' &
@@ -34,41 +63,68 @@ async def generate_progression(full_request: PerformanceRequest) -> PerformanceR
     to generate a chord progression
     and create its performance.
      
-    Sends user data to the 'microaccountant'.
+    Queues user data for the 'microaccountant' without waiting on it.
+
+    Yields every stage as soon as it's ready:
+    the 'progression' (chords only), its 'voices'
+    and finally the whole 'performance'.
+
+    Every call gets only what is left of the deadline, if one is given.
+    Fails fast with CircuitOpenError if any service in the chain is down.
+
+    If transpose_locally is set, a verbatim copy of a performance
+    served earlier with only its key changed is transposed in place.
+    Amendments of the new performance are prefetched, if there is a prefetcher.
     """
 
-    # Define a set instead of a variable
-    # in case there will be more requests
-    # of this type
-    task_chest = set()
-    local_session = ClientSession()
     performance = full_request.performance_object
+    transposed = None
+    if transpose_locally and isinstance(performance, PerformanceResponse):
+        transposed = SERVED_PERFORMANCES.transpose(performance)
+    if transposed is None:
+        ensure_closed(*get_generation_dependencies(performance))
 
     # Send user data
     if full_request.user_object is not None:
         session_data = construct_user_data(full_request)
     else:
         session_data = construct_session_data(full_request)
-    submit_data_tasks(session_data, storage=task_chest, session=local_session)
+    submit_data_tasks(session_data, dispatcher=dispatcher)
+
+    # Skips the remote services altogether
+    if transposed is not None:
+        yield "performance", transposed
+        return
 
     # Either generates or parses a chord progression.
     try:
         progression = construct_progression(performance)  # type: ignore PerformanceResponse
     except AttributeError:
         req_prog = get_req_progression_generation(performance)
-        progression_raw = await post_single_request(*req_prog, session=local_session)
-        progression = ProgressionFields.parse_raw(progression_raw)
+        progression_raw = await post_single_request(
+            *req_prog, pool=pool, deadline=deadline
+        )
+        with TRACER.span("parse ProgressionFields"):
+            progression = parse_model(
+                ProgressionFields, progression_raw, trusted=req_prog[0].trusted
+            )
 
-    # Generates voices
+    # The key is only settled once the voices are requested
     req_voice = get_req_voices_generation(performance, progression=progression)
-    voices_raw = await post_single_request(*req_voice, session=local_session)
-    voices = PseudoMIDI.parse_raw(voices_raw)
     cheetsheet = req_voice[1]
+    yield "progression", construct_preview(progression, cheetsheet)
+
+    # Generates voices
+    voices_raw = await post_single_request(*req_voice, pool=pool, deadline=deadline)
+    with TRACER.span("parse PseudoMIDI"):
+        voices = parse_model(PseudoMIDI, voices_raw, trusted=req_voice[0].trusted)
+    yield "voices", voices
 
     # Generate a midifile
     req_midihex = get_req_midihex_generation(voices)
-    midihex_raw = await post_single_request(*req_midihex, session=local_session)
-    midihex = json.loads(midihex_raw)
+    midihex_raw = await post_single_request(*req_midihex, pool=pool, deadline=deadline)
+    with TRACER.span("parse hex_blob"):
+        midihex = loads(midihex_raw)
 
     # Assembles a performance
     outcoming_performance = construct_performance(
@@ -77,108 +133,237 @@ async def generate_progression(full_request: PerformanceRequest) -> PerformanceR
         hex_blob=midihex,
         pseudo_midi=voices,
     )
+    if transpose_locally:
+        SERVED_PERFORMANCES.remember(outcoming_performance)
+    if prefetcher is not None:
+        prefetcher.schedule(outcoming_performance)
 
-    # Deals with background processes
-    try:
-        await asyncio.gather(*task_chest)
-    except ClientResponseError as e:  # pragma: no cover (no way to test remotely)
-        raise
-    await local_session.close()
-    del task_chest
-
-    return outcoming_performance
+    yield "performance", outcoming_performance
 
 
-async def amend_progression(
-    full_request: AmendmentRequest, index: int
+async def generate_progression(
+    full_request: PerformanceRequest,
+    *,
+    pool: SessionPool,
+    dispatcher: DataDispatcher,
+    deadline: Optional[Deadline] = None,
+    transpose_locally: bool = False,
+    prefetcher: Optional[AmendmentPrefetcher] = None,
     ) -> PerformanceResponse:
+    """Generates a chord progression and creates its performance,
+    skipping the intermediate stages.
+    """
+
+    stages = iterate_generation(
+        full_request,
+        pool=pool,
+        dispatcher=dispatcher,
+        deadline=deadline,
+        transpose_locally=transpose_locally,
+        prefetcher=prefetcher,
+    )
+    return await get_last_stage(stages)  # type: ignore PerformanceResponse
+
+
+async def generate_progressions(
+    full_requests: Sequence[PerformanceRequest],
+    *,
+    pool: SessionPool,
+    dispatcher: DataDispatcher,
+    concurrency: int,
+    deadline: Optional[Deadline] = None,
+    transpose_locally: bool = False,
+    prefetcher: Optional[AmendmentPrefetcher] = None,
+    ) -> List[Union[PerformanceResponse, Exception]]:
+    """Generates a performance for every request,
+    running up to the given number of pipelines at once.
+
+    Returns the outcomes in order, with an exception
+    in place of every failed item instead of failing them all.
+    """
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def generate(full_request: PerformanceRequest) -> PerformanceResponse:
+        async with semaphore:
+            return await generate_progression(
+                full_request,
+                pool=pool,
+                dispatcher=dispatcher,
+                deadline=deadline,
+                transpose_locally=transpose_locally,
+                prefetcher=prefetcher,
+            )
+
+    return await asyncio.gather(
+        *(generate(full_request) for full_request in full_requests),
+        return_exceptions=True,
+    )
+
+
+async def iterate_amendment_chain(
+    performance: PerformanceResponse,
+    index: int,
+    *,
+    pool: SessionPool,
+    deadline: Optional[Deadline] = None,
+    ) -> AsyncIterator[Stage]:
     """Makes calls to
     the 'micropathforger',
     the 'microvoicemaster' &
     the 'microbureaucrat' services
     to amend a chord progression
     and create its performance.
-     
-    Sends user data to the 'microaccountant'.
-    """
 
-    # Define a set instead of a variable
-    # in case there will be more requests
-    # of this type
-    task_chest = set()
-    old_performance = full_request.performance_object
-    local_session = ClientSession()
-
-    # Send user data
-    if full_request.user_object is not None:
-        session_data = construct_user_data(full_request)
-    else:
-        session_data = construct_session_data(full_request)
-    submit_data_tasks(session_data, storage=task_chest, session=local_session)
+    Yields the same stages as iterate_generation.
+    """
 
     # Generates an amended progression.
-    req_amend_progression = get_req_progression_amendment(old_performance, index)
+    amend_endpoint, old_progression, option = get_req_progression_amendment(
+        performance, index
+    )
     new_progression_raw = await post_single_request(
-        *req_amend_progression, session=local_session
+        amend_endpoint, old_progression, pool=pool, deadline=deadline, option=option
     )
-    new_progression = ProgressionFields.parse_raw(new_progression_raw)
+    with TRACER.span("parse ProgressionFields"):
+        new_progression = parse_model(
+            ProgressionFields, new_progression_raw, trusted=amend_endpoint.trusted
+        )
 
-    # Generates voices
-    req_voice = get_req_voices_generation(old_performance, progression=new_progression)
-    voices_raw = await post_single_request(*req_voice, session=local_session)
-    voices = PseudoMIDI.parse_raw(voices_raw)
+    req_voice = get_req_voices_generation(performance, progression=new_progression)
     cheetsheet = req_voice[1]
+    yield "progression", construct_preview(new_progression, cheetsheet)
+
+    # Generates voices
+    voices_raw = await post_single_request(*req_voice, pool=pool, deadline=deadline)
+    with TRACER.span("parse PseudoMIDI"):
+        voices = parse_model(PseudoMIDI, voices_raw, trusted=req_voice[0].trusted)
+    yield "voices", voices
 
     # Generates a midifile
     req_midihex = get_req_midihex_generation(voices)
-    midihex_raw = await post_single_request(*req_midihex, session=local_session)
-    midihex = json.loads(midihex_raw)
+    midihex_raw = await post_single_request(*req_midihex, pool=pool, deadline=deadline)
+    with TRACER.span("parse hex_blob"):
+        midihex = loads(midihex_raw)
 
     # Assembles a performance
-    outcoming_performance = construct_performance(
+    yield "performance", construct_performance(
         progression=new_progression,
         cheet_sheet=cheetsheet,
         hex_blob=midihex,
         pseudo_midi=voices,
     )
 
-    # Deals with background processes
-    try:
-        await asyncio.gather(*task_chest)
-    except ClientResponseError as e:  # pragma: no cover (no way to test remotely)
-        raise
-    await local_session.close()
-    del task_chest
-    return outcoming_performance
+
+async def perform_amendment(
+    performance: PerformanceResponse,
+    index: int,
+    *,
+    pool: SessionPool,
+    deadline: Optional[Deadline] = None,
+    ) -> PerformanceResponse:
+    """Amends a chord progression and creates its performance,
+    without any side effects.
+    """
+
+    stages = iterate_amendment_chain(
+        performance, index, pool=pool, deadline=deadline
+    )
+    return await get_last_stage(stages)  # type: ignore PerformanceResponse
+
+
+async def iterate_amendment(
+    full_request: AmendmentRequest,
+    index: int,
+    *,
+    pool: SessionPool,
+    dispatcher: DataDispatcher,
+    deadline: Optional[Deadline] = None,
+    transpose_locally: bool = False,
+    prefetcher: Optional[AmendmentPrefetcher] = None,
+    ) -> AsyncIterator[Stage]:
+    """Amends a chord progression and creates its performance,
+    unless the amendment has been prefetched already.
+     
+    Queues user data for the 'microaccountant' without waiting on it.
+
+    Yields the same stages as iterate_generation,
+    a prefetched amendment comes as a single 'performance'.
+
+    Every call gets only what is left of the deadline, if one is given.
+    Fails fast with CircuitOpenError if any service in the chain is down.
+    """
+
+    old_performance = full_request.performance_object
+    prefetched = None
+    if prefetcher is not None:
+        prefetched = await prefetcher.take(old_performance, index, deadline)
+    if prefetched is None:
+        ensure_closed(*get_amendment_dependencies())
+
+    # Send user data
+    if full_request.user_object is not None:
+        session_data = construct_user_data(full_request)
+    else:
+        session_data = construct_session_data(full_request)
+    submit_data_tasks(session_data, dispatcher=dispatcher)
+
+    if prefetched is not None:
+        outcoming_performance = prefetched
+    else:
+        stages = iterate_amendment_chain(
+            old_performance, index, pool=pool, deadline=deadline
+        )
+        async for stage, outcome in stages:
+            if stage == "performance":
+                outcoming_performance = outcome
+            else:
+                yield stage, outcome
+    if transpose_locally:
+        # Remembers the performance to transpose it later
+        SERVED_PERFORMANCES.remember(outcoming_performance)
+
+    yield "performance", outcoming_performance
 
 
-async def send_labels(labeling_request: LabelingRequest) -> bool:
+async def amend_progression(
+    full_request: AmendmentRequest,
+    index: int,
+    *,
+    pool: SessionPool,
+    dispatcher: DataDispatcher,
+    deadline: Optional[Deadline] = None,
+    transpose_locally: bool = False,
+    prefetcher: Optional[AmendmentPrefetcher] = None,
+    ) -> PerformanceResponse:
+    """Amends a chord progression and creates its performance,
+    skipping the intermediate stages.
+    """
+
+    stages = iterate_amendment(
+        full_request,
+        index,
+        pool=pool,
+        dispatcher=dispatcher,
+        deadline=deadline,
+        transpose_locally=transpose_locally,
+        prefetcher=prefetcher,
+    )
+    return await get_last_stage(stages)  # type: ignore PerformanceResponse
+
+
+async def send_labels(
+    labeling_request: LabelingRequest,
+    *,
+    dispatcher: DataDispatcher,
+    ) -> bool:
     """Notifies the 'microaccountant' about the user and a new label"""
     
-    # Define a set instead of a variable
-    # in case there will be more requests
-    # of this type
-    task_chest = set()
-    local_session = ClientSession()
-
     if labeling_request.user_object is not None:
         session_data = construct_user_data(labeling_request)
     else:
         session_data = construct_session_data(labeling_request)
-    submit_data_tasks(session_data, storage=task_chest, session=local_session)
+    submit_data_tasks(session_data, dispatcher=dispatcher)
     label_data = construct_label_data(labeling_request)
-    submit_data_tasks(label_data, storage=task_chest, session=local_session)
-
-    await asyncio.gather(*task_chest)
-    del task_chest
-    await local_session.close()
+    submit_data_tasks(label_data, dispatcher=dispatcher)
     return True
-
-
-async def healthcheck_dependencies(deps: Sequence[Endpoint]) -> bool:
-    """Checks if all services are online"""
-
-    session = ClientSession()
-    async with session:
-        oks = await asyncio.gather(*(ping_dependency(e, session=session) for e in deps))
-    return all(oks)
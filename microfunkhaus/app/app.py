@@ -1,7 +1,12 @@
 import json
 import time
+import random
+import asyncio
+import logging
+from uuid import uuid4
+from functools import partial
 from ipaddress import IPv4Address, AddressValueError
-from typing import Optional, Set
+from typing import AsyncIterator, List, Optional, Set, Tuple
 from fastapi import (
     FastAPI,
     Response,
@@ -12,23 +17,131 @@ from fastapi import (
     Header,
     Depends,
 )
-from aiohttp import ClientResponseError, ClientConnectionError
+from aiohttp import ClientResponseError
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
 from ..API import (
     PerformanceRequest,
     LabelingRequest,
     AmendmentRequest,
     PerformanceResponse,
-    HEALTHPOINTS,
+    BatchItemResponse,
+    SessionPool,
+    DataDispatcher,
+    DispatchSettings,
+    CacheSettings,
+    CACHE_BACKENDS,
+    post_data,
+    Deadline,
+    CircuitOpenError,
+    BreakerStates,
+    get_breaker,
+    close_coalescers,
+    CACHES,
+    Gauge,
+    CollectedCounter,
+    MetricsRegistry,
+    REGISTRY,
+    REQUESTS,
+    REQUEST_DURATION,
+    LoggingSettings,
+    configure_logging,
+    LOGGER,
+    REQUEST_ID,
+    REQUEST_ID_HEADER,
+    TracingSettings,
+    configure_tracing,
+    parse_traceparent,
+    TRACER,
+    TRACEPARENT_HEADER,
+    SERVED_PERFORMANCES,
+    ENDPOINTS,
+    EndpointsWatcher,
+    ReloadSettings,
+    SELECTORS,
+    get_selector,
+    HealthMonitor,
+    HealthSettings,
+    ping_dependency,
+    FastJSONResponse,
+    ModelResponse,
 )
 from ..actions import (
     generate_progression,
+    generate_progressions,
+    iterate_generation,
+    iterate_amendment,
     send_labels,
     amend_progression,
-    healthcheck_dependencies,
+    perform_amendment,
+    AmendmentPrefetcher,
+    PrefetchSettings,
 )
 
 
+# The counters of the snapshots exported as metrics
+DISPATCH_OUTCOMES = (
+    "submitted",
+    "sent",
+    "retried",
+    "failed",
+    "spilled",
+    "rejected",
+    "restored",
+    "dropped",
+    "deduplicated",
+    "skipped",
+)
+PREFETCH_OUTCOMES = ("scheduled", "skipped", "hits", "misses", "wasted")
+
+
+def describe_error(error: Exception) -> Tuple[int, str]:
+    """Maps a failure of a scenario to an HTTP status and its detail.
+    Logs the unexpected ones, which the caller answers with instead of raising.
+    """
+
+    if isinstance(error, ClientResponseError):
+        return error.status, error.message
+    if isinstance(error, asyncio.TimeoutError):
+        detail = "Remote services didn't respond in time."
+        return status.HTTP_504_GATEWAY_TIMEOUT, detail
+    if isinstance(error, CircuitOpenError):
+        return status.HTTP_503_SERVICE_UNAVAILABLE, str(error)
+    LOGGER.error("Unhandled error.", exc_info=error)
+    return status.HTTP_500_INTERNAL_SERVER_ERROR, "Internal Server Error"
+
+
+def format_stage(stage: str, data: dict, *, sse: bool = False) -> str:
+    """Formats a stage either as a Server-Sent Event or as a line of NDJSON."""
+
+    if sse:
+        return f"event: {stage}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"stage": stage, "data": data}) + "\n"
+
+
+async def stream_stages(
+    stages: AsyncIterator[Tuple[str, BaseModel]], *, sse: bool = False
+    ) -> AsyncIterator[str]:
+    """Sends every stage of a scenario as soon as it's ready.
+
+    The status line is gone by the time a failure happens,
+    so any failure ends the stream with an 'error' stage instead.
+    """
+
+    try:
+        async for stage, outcome in stages:
+            if stage == "performance":
+                # Fills in the fields skipped on construction
+                outcome = PerformanceResponse.parse_obj(outcome.dict())
+            yield format_stage(stage, jsonable_encoder(outcome), sse=sse)
+    except Exception as e:
+        status_code, detail = describe_error(e)
+        error = {"status": status_code, "detail": detail}
+        yield format_stage("error", error, sse=sse)
+
+
 def generate_app_with_config(
     tokens: Set[str] = {"testing",},
     remote_healthcheck_on_startup: bool = True
@@ -38,6 +151,18 @@ def generate_app_with_config(
     with open("config.json", "r") as config_file:
         config = json.load(config_file)
         TITLE = config["title"]
+        REQUEST_TIMEOUT = config.get("request_timeout", 10.0)
+        MIN_REQUEST_TIMEOUT = config.get("min_request_timeout", 0.5)
+        LOCAL_TRANSPOSITION = config.get("local_transposition", False)
+        PREFETCH = PrefetchSettings(**config.get("prefetch", {}))
+        BATCH_MAX_ITEMS = config.get("batch", {}).get("max_items", 32)
+        BATCH_CONCURRENCY = config.get("batch", {}).get("concurrency", 8)
+        DISPATCH = DispatchSettings(**config.get("dispatch", {}))
+        ENSURED = CacheSettings(**config.get("ensured", {}))
+        LOGGING = LoggingSettings(**config.get("logging", {}))
+        TRACING = TracingSettings(**config.get("tracing", {}))
+        RELOAD = ReloadSettings(**config.get("endpoints", {}))
+        HEALTH = HealthSettings(**config.get("health", {}))
 
     async def check_token(x_token: str = Header()):
         """Checks headers on each request, returns HTTP401 if token isn't recognized."""
@@ -47,18 +172,59 @@ def generate_app_with_config(
                 status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token"
             )
 
+    # Records are written by a separate thread, started with the app
+    log_listener = configure_logging(LOGGING)
+    span_exporter = configure_tracing(TRACING)
+
     app = FastAPI(
         title=TITLE,
         docs_url="/",
         dependencies=[Depends(check_token)],
+        default_response_class=FastJSONResponse,
     )
 
+    # One pooled session per remote address, shared by all requests of the worker
+    pool = SessionPool(ENDPOINTS.values())
+    app.state.pool = pool
+
+    # Sessions the 'microaccountant' confirmed recently aren't sent again
+    ensured = None
+    if ENSURED.enabled:
+        ensured = CACHE_BACKENDS[ENSURED.backend](ENSURED)
+
+    # Writes to the 'microaccountant' never hold up a response
+    dispatcher = DataDispatcher(partial(post_data, pool=pool), DISPATCH, ensured)
+    app.state.dispatcher = dispatcher
+
+    # Speculative amendments of generated performances
+    prefetcher = None
+    if PREFETCH.enabled:
+        amend = partial(perform_amendment, pool=pool)
+        prefetcher = AmendmentPrefetcher(amend, PREFETCH)
+    app.state.prefetcher = prefetcher
+
+    # Changes to the endpoints file take effect without a restart
+    watcher = EndpointsWatcher(RELOAD, pool)
+    app.state.watcher = watcher
+
+    # Probes of '/healthcheck' are answered from the latest background checks,
+    # made over connections of their own
+    monitor = HealthMonitor(ping_dependency, HEALTH)
+    app.state.monitor = monitor
+
     generation_description = """You can specify the optional key and mode (graph) parameters,
     or even supply the otherwise verbatim progression with a changed key to transpose it."""
     
+    batch_description = """Takes a list of the same requests as '/generate' does.
+    Every item gets its own status, a failed item doesn't fail the batch."""
+
     amendment_description = """It is crucially important to provide a valid performance object,
     copied verbatim from the response of the '/generate' endpoint."""
 
+    stream_description = """Sends the 'progression', 'voices' and 'performance' stages
+    as they are ready, as Server-Sent Events if 'text/event-stream' is accepted
+    or as newline-delimited JSON otherwise. A failure ends the stream with an 'error' stage."""
+
     app.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],
@@ -67,15 +233,166 @@ def generate_app_with_config(
         allow_headers=["*"],
     )
 
+    # Gauges read on every scrape of '/metrics', kept apart from other apps' ones
+    metrics_registry = MetricsRegistry(extends=REGISTRY)
+    metrics_registry.register(
+        Gauge(
+            "microfunkhaus_pool_connections",
+            "Connections in use and the limit of every remote address.",
+            ("address", "state"),
+            collect=pool.utilization,
+        )
+    )
+    metrics_registry.register(
+        Gauge(
+            "microfunkhaus_background_tasks",
+            "Background work waiting or running, by kind.",
+            ("kind",),
+            collect=lambda: {
+                ("dispatch_queued",): dispatcher.snapshot()["queued"],
+                ("prefetch_running",): (
+                    prefetcher.snapshot()["running"] if prefetcher is not None else 0
+                ),
+            },
+        )
+    )
+    metrics_registry.register(
+        CollectedCounter(
+            "microfunkhaus_dispatch_total",
+            "Writes handed to the dispatcher, by what became of them.",
+            ("outcome",),
+            collect=lambda: {
+                (outcome,): dispatcher.snapshot()[outcome]
+                for outcome in DISPATCH_OUTCOMES
+            },
+        )
+    )
+    metrics_registry.register(
+        CollectedCounter(
+            "microfunkhaus_prefetch_total",
+            "Amendments prefetched and taken, by outcome.",
+            ("outcome",),
+            collect=lambda: (
+                {
+                    (outcome,): prefetcher.snapshot()[outcome]
+                    for outcome in PREFETCH_OUTCOMES
+                }
+                if prefetcher is not None
+                else {}
+            ),
+        )
+    )
+
+    # Maps the endpoint functions to the route templates, so that
+    # the metrics aren't split by every value of a path parameter
+    route_templates = {}
+
+    def get_route_template(request: Request) -> str:
+        endpoint = request.scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if not route_templates:
+            route_templates.update(
+                (route.endpoint, route.path)
+                for route in app.routes
+                if hasattr(route, "endpoint")
+            )
+        return route_templates.get(endpoint, "unmatched")
+
+    def log_request(
+        request: Request, route: str, status_code: int, elapsed: float
+        ) -> None:
+        """Logs every failed or slow request in full,
+        and only a sample of the rest.
+        """
+
+        failed = status_code >= 400
+        slow = LOGGING.slow_request is not None and elapsed > LOGGING.slow_request
+        if not (failed or slow) and random.random() >= LOGGING.sample_rate:
+            return
+        fields = {
+            "method": request.method,
+            "route": route,
+            "status": status_code,
+            "process_time_us": round(elapsed * 10**6),
+        }
+        if failed or slow:
+            fields.update(
+                path=request.url.path,
+                query=request.url.query,
+                client=request.client.host if request.client else None,
+                user_agent=request.headers.get("user-agent"),
+            )
+        if status_code >= 500:
+            level = logging.ERROR
+        elif failed or slow:
+            level = logging.WARNING
+        else:
+            level = logging.INFO
+        LOGGER.log(level, "Request served.", extra={"fields": fields})
+
     @app.middleware("http")
     async def add_process_time(request: Request, call_next):
-        """Spits out the processing time for every request."""
+        """Tags every request with an id, traces it,
+        records its processing time for the metrics and logs it.
+        """
 
+        request_id = request.headers.get(REQUEST_ID_HEADER) or uuid4().hex
+        token = REQUEST_ID.set(request_id)
+        parent = parse_traceparent(request.headers.get(TRACEPARENT_HEADER))
         start_time = time.time()
-        response = await call_next(request)
-        process_time = round((time.time() - start_time) * 10**6)
-        print(f"Process time: {process_time}µs")
-        return response
+        status_code = 500
+        with TRACER.span(request.method, parent=parent, request_id=request_id) as span:
+            try:
+                response = await call_next(request)
+                status_code = response.status_code
+                response.headers[REQUEST_ID_HEADER] = request_id
+                return response
+            except Exception:
+                LOGGER.exception("Unhandled error.")
+                raise
+            finally:
+                elapsed = time.time() - start_time
+                route = get_route_template(request)
+                if span is not None:
+                    span.name = f"{request.method} {route}"
+                    span.set(route=route, status=status_code)
+                REQUESTS.inc(route, request.method, str(status_code))
+                REQUEST_DURATION.observe(route, request.method, value=elapsed)
+                log_request(request, route, status_code, elapsed)
+                REQUEST_ID.reset(token)
+
+    # Dependency
+    def get_deadline(
+        x_request_timeout: Optional[str] = Header(default=None),
+        ) -> Deadline:
+        """Starts the request's time budget.
+        Clients may ask for a shorter one (in milliseconds) than the configured,
+        but not for less than the configured minimum.
+        """
+
+        return Deadline.from_header(
+            x_request_timeout,
+            default=REQUEST_TIMEOUT,
+            maximum=REQUEST_TIMEOUT,
+            minimum=MIN_REQUEST_TIMEOUT,
+        )
+
+    # Dependency
+    def get_stream_format(accept: Optional[str] = Header(default=None)) -> bool:
+        """Tells whether a client wants Server-Sent Events instead of NDJSON."""
+
+        return accept is not None and "text/event-stream" in accept
+
+    def make_streaming_response(
+        stages: AsyncIterator[Tuple[str, BaseModel]], sse: bool
+        ) -> StreamingResponse:
+        media_type = "text/event-stream" if sse else "application/x-ndjson"
+        return StreamingResponse(
+            stream_stages(stages, sse=sse),
+            media_type=media_type,
+            headers={"Cache-Control": "no-cache"},
+        )
 
     # Dependency
     def get_real_ip(request: Request) -> Optional[IPv4Address]:
@@ -92,20 +409,45 @@ def generate_app_with_config(
             # address 'testclient' in requests
             return IPv4Address("255.255.255.255")
 
+    @app.on_event("startup")
+    async def open_pool():  # pragma: no cover
+        log_listener.start()
+        await pool.open()
+        await dispatcher.open()
+        await watcher.open()
+        await monitor.open()
+
+    @app.on_event("shutdown")
+    async def close_pool():  # pragma: no cover
+        await monitor.close()
+        await watcher.close()
+        if prefetcher is not None:
+            await prefetcher.close()
+        await dispatcher.close()
+        await close_coalescers()
+        await pool.close()
+        if span_exporter is not None:
+            span_exporter.close()
+        log_listener.stop()
+
     if remote_healthcheck_on_startup:
         @app.on_event("startup")
         async def startup_event():  # pragma: no cover
             ok = False
             try:
-                ok = await healthcheck_dependencies(HEALTHPOINTS)
+                ok = await monitor.check()
             finally:
                 # This awkward if statement is here
                 # so you don't need to re-raise
                 # the exception in case of failure
                 if not ok:
-                    print("Could not establish connections to all of the microservices.")
+                    LOGGER.warning(
+                        "Could not establish connections to all of the microservices."
+                    )
                 else:
-                    print("Connections to all of the microservices are established.")
+                    LOGGER.info(
+                        "Connections to all of the microservices are established."
+                    )
     else:
         pass
 
@@ -121,15 +463,101 @@ def generate_app_with_config(
     async def gen_progression(
         performance: PerformanceRequest,
         real_ip=Depends(get_real_ip),
-        ) -> PerformanceResponse:
+        deadline=Depends(get_deadline),
+        ) -> ModelResponse:
         """Generates a performance according to options provided in request."""
 
         performance.sess_id = real_ip
         try:
-            responses = await generate_progression(performance)
+            responses = await generate_progression(
+                performance,
+                pool=pool,
+                dispatcher=dispatcher,
+                deadline=deadline,
+                transpose_locally=LOCAL_TRANSPOSITION,
+                prefetcher=prefetcher,
+            )
         except ClientResponseError as e:  # pragma: no cover (no way to test for now)
             raise HTTPException(status_code=e.status, detail=e.message)
-        return responses
+        except asyncio.TimeoutError:  # pragma: no cover (no way to test for now)
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail="Remote services didn't respond in time.",
+            )
+        except CircuitOpenError as e:  # pragma: no cover (no way to test for now)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e)
+            )
+        return ModelResponse(responses)
+
+
+    @app.post(
+        "/generate/stream",
+        summary="Generates a new progression stage by stage",
+        description=stream_description,
+        response_description="A stream of stages of a generated progression",
+        response_class=StreamingResponse,
+        status_code=status.HTTP_200_OK,
+    )
+    async def stream_progression(
+        performance: PerformanceRequest,
+        real_ip=Depends(get_real_ip),
+        deadline=Depends(get_deadline),
+        sse=Depends(get_stream_format),
+        ) -> StreamingResponse:
+        """Streams the generation of a performance."""
+
+        performance.sess_id = real_ip
+        stages = iterate_generation(
+            performance,
+            pool=pool,
+            dispatcher=dispatcher,
+            deadline=deadline,
+            transpose_locally=LOCAL_TRANSPOSITION,
+            prefetcher=prefetcher,
+        )
+        return make_streaming_response(stages, sse)
+
+
+    @app.post(
+        "/generate/batch",
+        summary="Generates several progressions at once",
+        description=batch_description,
+        response_description="A list of generated progressions or errors, in order",
+        response_model=List[BatchItemResponse],
+        status_code=status.HTTP_200_OK,
+    )
+    async def gen_progressions(
+        performances: List[PerformanceRequest],
+        real_ip=Depends(get_real_ip),
+        deadline=Depends(get_deadline),
+        ) -> ModelResponse:
+        """Generates a performance for every request in the batch."""
+
+        if len(performances) > BATCH_MAX_ITEMS:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"No more than {BATCH_MAX_ITEMS} items per batch.",
+            )
+        for performance in performances:
+            performance.sess_id = real_ip
+        outcomes = await generate_progressions(
+            performances,
+            pool=pool,
+            dispatcher=dispatcher,
+            concurrency=BATCH_CONCURRENCY,
+            deadline=deadline,
+            transpose_locally=LOCAL_TRANSPOSITION,
+            prefetcher=prefetcher,
+        )
+        items = []
+        for outcome in outcomes:
+            if isinstance(outcome, Exception):
+                status_code, detail = describe_error(outcome)
+                items.append(BatchItemResponse(status=status_code, detail=detail))
+            else:
+                items.append(BatchItemResponse(status=200, performance=outcome))
+        return ModelResponse(items)
 
 
     @app.post(
@@ -149,15 +577,67 @@ def generate_app_with_config(
             example=1,
         ),
         real_ip=Depends(get_real_ip),
-        ) -> PerformanceResponse:
+        deadline=Depends(get_deadline),
+        ) -> ModelResponse:
         """Changes a performance according to options provided in request."""
         
         full_request.sess_id = real_ip
         try:
-            responses = await amend_progression(full_request, index)
+            responses = await amend_progression(
+                full_request,
+                index,
+                pool=pool,
+                dispatcher=dispatcher,
+                deadline=deadline,
+                transpose_locally=LOCAL_TRANSPOSITION,
+                prefetcher=prefetcher,
+            )
         except ClientResponseError as e:  # pragma: no cover (no way to test for now)
             raise HTTPException(status_code=e.status, detail=e.message)
-        return responses
+        except asyncio.TimeoutError:  # pragma: no cover (no way to test for now)
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail="Remote services didn't respond in time.",
+            )
+        except CircuitOpenError as e:  # pragma: no cover (no way to test for now)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e)
+            )
+        return ModelResponse(responses)
+
+    @app.post(
+        "/amend/{index}/stream",
+        summary="Changes a specified chord in a progression stage by stage",
+        description=stream_description,
+        response_description="A stream of stages of an amended progression",
+        response_class=StreamingResponse,
+        status_code=status.HTTP_200_OK,
+    )
+    async def stream_amendment(
+        full_request: AmendmentRequest,
+        index: int = Path(
+            ...,
+            title="Index",
+            description="The chord under this index will be substituted",
+            example=1,
+        ),
+        real_ip=Depends(get_real_ip),
+        deadline=Depends(get_deadline),
+        sse=Depends(get_stream_format),
+        ) -> StreamingResponse:
+        """Streams the amendment of a performance."""
+
+        full_request.sess_id = real_ip
+        stages = iterate_amendment(
+            full_request,
+            index,
+            pool=pool,
+            dispatcher=dispatcher,
+            deadline=deadline,
+            transpose_locally=LOCAL_TRANSPOSITION,
+            prefetcher=prefetcher,
+        )
+        return make_streaming_response(stages, sse)
 
     @app.post("/label")
     async def label_progression(
@@ -167,22 +647,68 @@ def generate_app_with_config(
         """Sends labels to the remote database."""
 
         labeling_request.sess_id = real_ip
-        try:
-            await send_labels(labeling_request)
-        except ClientResponseError as e:  # pragma: no cover (no way to test for now)
-            raise HTTPException(status_code=e.status, detail=e.message)
+        await send_labels(labeling_request, dispatcher=dispatcher)
         return Response(status_code=201)
 
     @app.get("/healthcheck")
     async def healthcheck():
-        """Checks if remote endpoints are online.
+        """Reports the latest checks of the remote endpoints
+        and the state of their circuit breakers, replicas, caches
+        and the queue of background writes.
         Self-check is implied.
         """
 
-        try:
-            ok = await healthcheck_dependencies(HEALTHPOINTS)
-            return Response(status_code=200)
-        except ClientConnectionError as e:  # pragma: no cover (no way to test for now)
-            raise HTTPException(status_code=429, detail="Not all remotes are healthy.")
+        if not monitor.running:
+            # The background checks are off or haven't been started
+            await monitor.check()
+        dependencies = monitor.snapshot()
+        breakers = {
+            name: get_breaker(endpoint).snapshot()
+            for name, endpoint in ENDPOINTS.items()
+        }
+        healthy = all(
+            dependency["healthy"] for dependency in dependencies.values()
+        ) and not any(
+            breaker["state"] == BreakerStates.open for breaker in breakers.values()
+        )
+        replicas = {name: selector.snapshot() for name, selector in SELECTORS.items()}
+        caches = {name: cache.snapshot() for name, cache in CACHES.items()}
+        if LOCAL_TRANSPOSITION:
+            caches["transposition"] = SERVED_PERFORMANCES.snapshot()
+        if prefetcher is not None:
+            caches["prefetch"] = prefetcher.snapshot()
+        if ensured is not None:
+            caches["ensured"] = ensured.snapshot()
+        content = {
+            "dependencies": dependencies,
+            "breakers": breakers,
+            "replicas": replicas,
+            "caches": caches,
+            "dispatch": dispatcher.snapshot(),
+            "endpoints": watcher.snapshot(),
+        }
+        if not healthy:  # pragma: no cover (no way to test for now)
+            return FastJSONResponse(content, status_code=429)
+        return FastJSONResponse(content, status_code=200)
+
+    @app.get("/admin/replicas")
+    async def replicas():
+        """Shows what this worker has observed of every replica of every endpoint:
+        requests in flight, smoothed latency and error rate,
+        and whether it's ejected as an outlier or failing its health checks.
+        """
+
+        return {
+            name: get_selector(endpoint).snapshot()
+            for name, endpoint in ENDPOINTS.items()
+        }
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        """Exposes the metrics of this worker in the Prometheus text format."""
+
+        return PlainTextResponse(
+            metrics_registry.render(), media_type="text/plain; version=0.0.4"
+        )
 
     return app
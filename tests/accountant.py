@@ -0,0 +1,66 @@
+"""A local stand-in for the 'microaccountant',
+accepting both single and bulk writes and remembering all of them.
+"""
+
+from typing import Callable, List, Optional, Tuple
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from microfunkhaus import API
+
+
+class StandInAccountant:
+    """Optionally without the bulk paths,
+    or rejecting the items the given function refuses.
+    """
+
+    def __init__(
+        self, bulk: bool = True, refuse: Optional[Callable[[dict], bool]] = None
+        ):
+        self.bulk = bulk
+        self.refuse = refuse
+        self.requests: List[Tuple[str, object]] = []
+        self.server = None
+
+    @property
+    def items(self) -> list:
+        received = []
+        for _, body in self.requests:
+            received.extend(body if isinstance(body, list) else [body])
+        return received
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post("/{section}/{kind}", self.accept)
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+    async def close(self) -> None:
+        await self.server.close()
+
+    async def accept(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        if isinstance(body, list) and not self.bulk:
+            raise web.HTTPNotFound()
+        refused = self.refuse is not None and any(
+            self.refuse(item) for item in (body if isinstance(body, list) else [body])
+        )
+        if refused:
+            raise web.HTTPUnprocessableEntity()
+        self.requests.append((request.path, body))
+        if isinstance(body, list):
+            return web.json_response([True] * len(body))
+        return web.json_response(True)
+
+    def endpoint(self, name: str) -> API.Endpoint:
+        """Points a copy of the endpoint at the stand-in,
+        named after its port, so that its coalescer is its own.
+        """
+
+        endpoint = API.ENDPOINTS[name]
+        return endpoint.copy(
+            update={
+                "name": f"standin/{self.server.port}/{name}",
+                "host": self.server.host,
+                "port": str(self.server.port),
+            }
+        )
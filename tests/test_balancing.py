@@ -0,0 +1,202 @@
+import os
+import json
+import asyncio
+from microfunkhaus import API
+
+
+def make_endpoint(strategy="round_robin", ports=("8101", "8102", "8103")):
+    return API.Endpoint(
+        name="testing/balanced",
+        path="testing",
+        replicas=[{"host": "127.0.0.1", "port": port} for port in ports],
+        balancing=API.BalancingSettings(strategy=strategy),
+    )
+
+
+def test_replicas_default_the_address():
+    endpoint = make_endpoint()
+    assert endpoint.address == ("127.0.0.1", "8101")
+    assert str(endpoint) == "http://127.0.0.1:8101/testing"
+    second = endpoint.get_replicas()[1]
+    assert endpoint.get_url("7", second) == "http://127.0.0.1:8102/testing/7"
+
+
+def test_round_robin_cycles_through_replicas():
+    selector = API.ReplicaSelector(make_endpoint())
+    ports = [selector.choose().port for _ in range(6)]
+    assert sorted(ports[:3]) == ["8101", "8102", "8103"]
+    assert ports[:3] == ports[3:]
+
+
+def test_least_outstanding_avoids_busy_replicas():
+    selector = API.ReplicaSelector(make_endpoint("least_outstanding"))
+    first, second, third = selector.endpoint.get_replicas()
+    selector.start(first)
+    selector.start(second)
+    assert all(selector.choose() == third for _ in range(3))
+    selector.finish(first, True, 0.01)
+    assert selector.choose() in (first, third)
+
+
+def test_power_of_two_prefers_faster_replica():
+    selector = API.ReplicaSelector(make_endpoint("power_of_two", ports=("8101", "8102")))
+    fast, slow = selector.endpoint.get_replicas()
+    for replica, latency in ((fast, 0.01), (slow, 0.5)):
+        selector.start(replica)
+        selector.finish(replica, True, latency)
+    assert all(selector.choose() == fast for _ in range(10))
+    assert selector.snapshot()["127.0.0.1:8102"]["latency"] == 0.5
+
+
+def test_selector_keeps_surviving_replicas_on_reload():
+    endpoint = make_endpoint()
+    selector = API.get_selector(endpoint)
+    kept = endpoint.get_replicas()[1]
+    selector.start(kept)
+    reloaded = API.get_selector(make_endpoint(ports=("8102", "8104")))
+    assert reloaded is not selector
+    assert reloaded.snapshot()["127.0.0.1:8102"]["outstanding"] == 1
+    assert "127.0.0.1:8101" not in reloaded.snapshot()
+    API.SELECTORS.pop(endpoint.name)
+
+
+
+def test_selector_is_kept_for_equal_endpoints():
+    selector = API.get_selector(make_endpoint())
+    try:
+        assert API.get_selector(make_endpoint()) is selector
+        assert API.get_selector(make_endpoint("least_outstanding")) is not selector
+    finally:
+        API.SELECTORS.pop("testing/balanced")
+
+
+def test_calls_from_before_a_reload_keep_the_selector():
+    original = dict(API.ENDPOINTS)
+    name = "micropathforger/generate"
+    stale = original[name]
+    reloaded = stale.copy(
+        update={
+            "replicas": (
+                API.Replica(host=stale.host, port=stale.port),
+                API.Replica(host=stale.host, port="8101"),
+            )
+        }
+    )
+    try:
+        API.update_endpoints({**original, name: reloaded})
+        API.refresh_selectors(API.ENDPOINTS)
+        selector = API.get_selector(reloaded)
+        selector.start(reloaded.get_replicas()[1])
+        for endpoint in (stale, reloaded, stale):
+            assert API.get_selector(endpoint) is selector
+        assert selector.snapshot()[f"{stale.host}:8101"]["outstanding"] == 1
+    finally:
+        API.update_endpoints(original)
+        API.refresh_selectors(API.ENDPOINTS)
+
+
+def test_watcher_reloads_changed_endpoints(tmp_path):
+    original = dict(API.ENDPOINTS)
+    path = tmp_path / "endpoints.json"
+    entries = [json.loads(endpoint.json()) for endpoint in original.values()]
+    path.write_text(json.dumps(entries))
+    watcher = API.EndpointsWatcher(API.ReloadSettings(path=str(path), interval=None))
+    selector = API.get_selector(original[entries[0]["name"]])
+    try:
+        assert asyncio.run(watcher.check()) == set()
+        entries[0]["replicas"] = [
+            {"host": "127.0.0.1", "port": "8101"},
+            {"host": "127.0.0.1", "port": "8102"},
+        ]
+        path.write_text(json.dumps(entries))
+        os.utime(path, ns=(0, 1))
+        assert asyncio.run(watcher.check()) == {entries[0]["name"]}
+        assert len(API.ENDPOINTS[entries[0]["name"]].get_replicas()) == 2
+        assert API.ENDPOINTS[entries[1]["name"]] is original[entries[1]["name"]]
+        reloaded = API.SELECTORS[entries[0]["name"]]
+        assert reloaded is not selector and len(reloaded.states) == 2
+        assert any(str(e).endswith(":8102/healthcheck") for e in API.HEALTHPOINTS)
+
+        path.write_text("[{")
+        os.utime(path, ns=(0, 2))
+        assert asyncio.run(watcher.check()) == set()
+        assert watcher.snapshot()["failures"] == 1
+        assert len(API.ENDPOINTS[entries[0]["name"]].get_replicas()) == 2
+    finally:
+        API.update_endpoints(original)
+        API.refresh_selectors(API.ENDPOINTS)
+
+
+def test_selector_skips_replicas_that_are_down():
+    selector = API.ReplicaSelector(make_endpoint())
+    down = selector.endpoint.get_replicas()[0]
+    API.UPSTREAM_HEALTH[down.address] = status = API.UpstreamStatus(str(down))
+    status.healthy = False
+    try:
+        assert all(selector.choose() != down for _ in range(6))
+    finally:
+        API.UPSTREAM_HEALTH.pop(down.address)
+
+
+def test_monitor_trips_breakers_of_endpoints_down():
+    endpoint = API.ENDPOINTS["micropathforger/generate"]
+    failing = {endpoint.address}
+
+    async def ping(healthpoint, **kwargs):
+        if healthpoint.address in failing:
+            raise ConnectionRefusedError("refused")
+        return True
+
+    monitor = API.HealthMonitor(ping, API.HealthSettings(interval=None, failures=2))
+    try:
+        assert not asyncio.run(monitor.check())
+        assert API.is_down(endpoint.address)
+        report = monitor.snapshot()[f"http://{endpoint.host}:{endpoint.port}/healthcheck"]
+        assert report["error"] == "refused"
+        assert API.get_breaker(endpoint).state == API.BreakerStates.open
+
+        failing.clear()
+        assert asyncio.run(monitor.check())
+        assert API.get_breaker(endpoint).state == API.BreakerStates.half_open
+    finally:
+        API.UPSTREAM_HEALTH.clear()
+        for name in API.ENDPOINTS:
+            API.BREAKERS.pop(name, None)
+
+
+def test_slow_replica_is_ejected():
+    endpoint = make_endpoint(ports=("8101", "8102", "8103")).copy(
+        update={"outliers": API.OutlierSettings(min_requests=3, eject_for=60.0)}
+    )
+    selector = API.ReplicaSelector(endpoint)
+    replicas = endpoint.get_replicas()
+    for _ in range(3):
+        for replica, latency in zip(replicas, (0.01, 0.012, 0.5)):
+            selector.start(replica)
+            selector.finish(replica, True, latency)
+    report = selector.snapshot()
+    assert report["127.0.0.1:8103"]["ejected"]
+    assert report["127.0.0.1:8103"]["ejections"] == 1
+    assert all(selector.choose() != replicas[2] for _ in range(6))
+
+    # No more than half of the replicas are out at once
+    for _ in range(3):
+        selector.start(replicas[1])
+        selector.finish(replicas[1], False, 0.01)
+    assert not selector.snapshot()["127.0.0.1:8102"]["ejected"]
+
+
+def test_monitor_pings_over_its_own_connections():
+    used = []
+
+    async def ping(healthpoint, *, pool, **kwargs):
+        used.append(pool)
+        return True
+
+    monitor = API.HealthMonitor(ping, API.HealthSettings(interval=None, connections=1))
+    try:
+        assert asyncio.run(monitor.check())
+    finally:
+        API.UPSTREAM_HEALTH.clear()
+    assert used and all(pool is monitor.pool for pool in used)
+    assert monitor.pool.settings.limit == 1
@@ -0,0 +1,145 @@
+import asyncio
+from chrdiotypes.data_enums import VoiceOrderings
+from microfunkhaus import API
+from .mocking import f_cheetsheet
+
+
+def make_endpoint(**settings):
+    return API.Endpoint(
+        name="testing/cached",
+        host="127.0.0.1",
+        port="0",
+        path="testing",
+        cache=API.CacheSettings(enabled=True, **settings),
+    )
+
+
+def test_cache_key_ignores_excluded_fields():
+    endpoint = make_endpoint(exclude={"ticket"})
+    voices = [[60, 64], [67, 72]]
+    first = API.make_cache_key(endpoint, {"voices": voices, "ticket": "1"})
+    second = API.make_cache_key(endpoint, {"ticket": "2", "voices": voices})
+    assert first == second
+    assert first != API.make_cache_key(endpoint, {"voices": voices[::-1]})
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = API.MemoryCache(make_endpoint(max_items=2).cache)
+
+    async def scenario():
+        await cache.set("a", "1")
+        await cache.set("b", "2")
+        assert await cache.get("a") == "1"
+        await cache.set("c", "3")
+        return await cache.get("a"), await cache.get("b"), await cache.get("c")
+
+    assert asyncio.run(scenario()) == ("1", None, "3")
+    assert cache.snapshot()["evictions"] == 1
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_memory_cache_respects_ttl_and_size():
+    cache = API.MemoryCache(make_endpoint(ttl=0.0, max_bytes=4).cache)
+
+    async def scenario():
+        await cache.set("expired", "1")
+        await cache.set("oversized", "12345")
+        return await cache.get("expired"), await cache.get("oversized")
+
+    assert asyncio.run(scenario()) == (None, None)
+    assert cache.size == 0
+
+
+def test_concurrent_misses_are_coalesced(monkeypatch):
+    endpoint = make_endpoint()
+    calls = []
+
+    async def post_retried_request(endpoint, serializable, **kwargs):
+        calls.append(serializable)
+        await asyncio.sleep(0.01)
+        return '"4d54"'
+
+    monkeypatch.setattr(API.engine, "post_retried_request", post_retried_request)
+    payload = API.CacheSettings()  # Any pydantic model will do
+
+    async def scenario():
+        pool = API.SessionPool()
+        requests = (
+            API.post_single_request(endpoint, payload, pool=pool) for _ in range(5)
+        )
+        return await asyncio.gather(*requests)
+
+    assert asyncio.run(scenario()) == ['"4d54"'] * 5
+    assert len(calls) == 1
+    assert API.get_cache(endpoint).coalesced == 4
+
+
+class FakeRedis:
+    """Keeps the values in a dict, or fails every call while it's down."""
+
+    def __init__(self):
+        self.values = {}
+        self.expiries = {}
+        self.down = False
+
+    async def get(self, key):
+        if self.down:
+            raise ConnectionRefusedError("refused")
+        return self.values.get(key)
+
+    async def set(self, key, value, px=None):
+        if self.down:
+            raise ConnectionRefusedError("refused")
+        self.values[key] = value
+        self.expiries[key] = px
+
+
+def test_redis_cache_treats_failures_as_misses():
+    client = FakeRedis()
+    cache = API.RedisCache(make_endpoint(backend="redis", ttl=1.5).cache, client)
+
+    async def scenario():
+        await cache.set("a", b"1")
+        hit = await cache.get("a")
+        client.down = True
+        await cache.set("b", b"2")
+        return hit, await cache.get("a")
+
+    assert asyncio.run(scenario()) == (b"1", None)
+    assert client.expiries == {"a": 1500}
+    assert cache.snapshot()["errors"] == 2
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cheet_sheets_differing_in_excluded_fields_share_a_voicing(
+    f_cheetsheet, monkeypatch
+    ):
+    ordered = f_cheetsheet.copy(update={"ordering": tuple(VoiceOrderings)[0]})
+    endpoint = API.ENDPOINTS["microvoicemaster/perform"].copy(
+        update={
+            "name": "testing/voicings",
+            "cache": API.CacheSettings(enabled=True, exclude={"ordering"}),
+        }
+    )
+    calls = []
+
+    async def post_retried_request(endpoint, serializable, **kwargs):
+        calls.append(serializable)
+        return b'{"voices":[[60,65,69]],"ticket":"1"}'
+
+    monkeypatch.setattr(API.engine, "post_retried_request", post_retried_request)
+
+    async def scenario():
+        pool = API.SessionPool()
+        return [
+            await API.post_single_request(endpoint, sheet, pool=pool)
+            for sheet in (f_cheetsheet, ordered)
+        ]
+
+    try:
+        first, second = asyncio.run(scenario())
+        cache = API.get_cache(endpoint)
+        assert first == second and len(calls) == 1
+        assert cache.snapshot()["items"] == 1
+    finally:
+        API.CACHES.pop(endpoint.name)
@@ -0,0 +1,77 @@
+import json
+import asyncio
+from microfunkhaus import API
+
+
+def make_coalescer(**settings):
+    endpoint = API.Endpoint(
+        name="testing/coalesced",
+        host="127.0.0.1",
+        port="0",
+        path="testing",
+        bulk=API.BulkSettings(path="testing/bulk", **settings),
+    )
+    return API.Coalescer(endpoint)
+
+
+def test_concurrent_requests_are_sent_in_bulk():
+    coalescer = make_coalescer(max_items=3, window=1.0)
+    sent = []
+
+    async def send(endpoint, serializable, **kwargs):
+        sent.append((str(endpoint), serializable))
+        return json.dumps([item["x"] * 2 for item in serializable])
+
+    async def scenario():
+        pool = API.SessionPool()
+        return await asyncio.gather(
+            *(coalescer.post({"x": x}, send, pool=pool) for x in range(3))
+        )
+
+    assert asyncio.run(scenario()) == [b"0", b"2", b"4"]
+    assert sent == [
+        ("http://127.0.0.1:0/testing/bulk", [{"x": 0}, {"x": 1}, {"x": 2}])
+    ]
+
+
+def test_malformed_bulk_response_fails_every_item():
+    coalescer = make_coalescer(window=0.0)
+
+    async def send(endpoint, serializable, **kwargs):
+        return "[]"
+
+    async def scenario():
+        pool = API.SessionPool()
+        return await asyncio.gather(
+            *(coalescer.post({"x": x}, send, pool=pool) for x in range(2)),
+            return_exceptions=True,
+        )
+
+    assert all(isinstance(outcome, ValueError) for outcome in asyncio.run(scenario()))
+
+
+def test_bulk_requests_are_kept_until_done():
+    coalescer = make_coalescer(max_items=2, window=1.0)
+    answered = asyncio.Event()
+
+    async def send(endpoint, serializable, **kwargs):
+        await answered.wait()
+        return json.dumps(serializable)
+
+    async def scenario():
+        pool = API.SessionPool()
+        posts = [
+            asyncio.create_task(coalescer.post({"x": x}, send, pool=pool))
+            for x in range(3)
+        ]
+        await asyncio.sleep(0)
+        sending = coalescer.snapshot()["sending"]
+        answered.set()
+        await coalescer.close()
+        outcomes = await asyncio.gather(*posts, return_exceptions=True)
+        return sending, coalescer.snapshot()["sending"], outcomes
+
+    sending, left, outcomes = asyncio.run(scenario())
+    assert (sending, left) == (1, 0)
+    assert outcomes[:2] == [b'{"x":0}', b'{"x":1}']
+    assert isinstance(outcomes[2], asyncio.CancelledError)
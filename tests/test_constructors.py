@@ -108,3 +108,28 @@ def test_construct_performance(progression, chsh, psdm, hex_blob):
     assert API.construct_performance(
         progression=progression, cheet_sheet=chsh, pseudo_midi=psdm, hex_blob=hex_blob
     )
+
+
+@given(structure=st.sampled_from(tuple(ChordIntervalStructures)))
+def test_conversion_tables_round_trip(structure):
+    symbol = API.SYMBOL_STRUCTURES[structure]
+    assert symbol == ChordSymbolStructures[structure.name]
+    assert API.INTERVAL_STRUCTURES[symbol] is structure
+
+
+@given(b_progression_fields)
+def test_trusted_parsing_matches_validation(progression):
+    body = API.dumps(API.prepare(progression))
+    trusted = API.parse_model(ProgressionFields, body, trusted=True)
+    assert trusted == API.parse_model(ProgressionFields, body)
+
+
+@given(st.dictionaries(st.text(), st.one_of(st.text(), st.integers())))
+def test_dumps_matches_without_orjson(obj):
+    fast = API.dumps(obj, sort_keys=True)
+    orjson = API.serialization.orjson
+    API.serialization.orjson = None
+    try:
+        assert API.dumps(obj, sort_keys=True) == fast
+    finally:
+        API.serialization.orjson = orjson
@@ -0,0 +1,163 @@
+import asyncio
+from ipaddress import IPv4Address
+from aiohttp import ClientConnectionError
+from chrdiotypes.data_enums import PerformanceFlags
+from chrdiotypes.transport import SessionTransport, LabelTransport
+from microfunkhaus import API
+from .accountant import StandInAccountant
+
+
+def make_dispatcher(sent, failures=0, **settings):
+    remaining = [failures]
+
+    async def send(data, *, deadline):
+        if remaining[0] > 0:
+            remaining[0] -= 1
+            raise ClientConnectionError()
+        sent.append(data)
+
+    settings = API.DispatchSettings(backoff=0.0, **settings)
+    return API.DataDispatcher(send, settings)
+
+
+def make_data(n):
+    return [SessionTransport(sess_id=IPv4Address(f"10.0.0.{i}")) for i in range(n)]
+
+
+def test_submission_doesnt_wait_on_delivery():
+    sent = []
+    dispatcher = make_dispatcher(sent)
+
+    async def scenario():
+        for data in make_data(3):
+            dispatcher.submit(data)
+        queued = dispatcher.snapshot()["queued"]
+        await dispatcher.close()
+        return queued
+
+    assert asyncio.run(scenario()) == 3
+    assert len(sent) == 3
+    assert dispatcher.sent == 3
+
+
+def test_failed_writes_are_retried():
+    sent = []
+    dispatcher = make_dispatcher(sent, failures=2, attempts=3, workers=1)
+
+    async def scenario():
+        dispatcher.submit(make_data(1)[0])
+        await dispatcher.close()
+
+    asyncio.run(scenario())
+    assert len(sent) == 1
+    assert (dispatcher.retried, dispatcher.failed) == (2, 0)
+
+
+def test_overflow_is_spilled_and_restored(tmp_path):
+    spill_path = str(tmp_path / "spill.jsonl")
+    data = make_data(3)
+    dispatcher = make_dispatcher(
+        [], failures=3, attempts=1, max_queued=1, workers=1, spill_path=spill_path
+    )
+
+    async def overflow():
+        for item in data:
+            dispatcher.submit(item)
+        await dispatcher.close()
+
+    asyncio.run(overflow())
+    assert dispatcher.snapshot()["spill_pending"] == 3
+
+    sent = []
+    restarted = make_dispatcher(sent, spill_path=spill_path)
+
+    async def restart():
+        await restarted.open()
+        await restarted.close()
+
+    asyncio.run(restart())
+    assert sorted(d.sess_id for d in sent) == sorted(d.sess_id for d in data)
+    assert restarted.snapshot()["spill_pending"] == 0
+
+
+def make_labels(n):
+    flag = list(PerformanceFlags)[0]
+    return [
+        LabelTransport(sess_id=IPv4Address("10.0.0.1"), perf_id=str(i), flag=flag)
+        for i in range(n)
+    ]
+
+
+def dispatch_to(accountant, data, **settings):
+    async def scenario():
+        await accountant.start()
+        endpoints = {
+            SessionTransport: accountant.endpoint("microaccountant/people"),
+            LabelTransport: accountant.endpoint("microaccountant/data"),
+        }
+        pool = API.SessionPool()
+
+        async def send(data, *, deadline):
+            endpoint = endpoints[type(data)]
+            return await API.post_single_request(
+                endpoint, data, pool=pool, deadline=deadline
+            )
+
+        dispatcher = API.DataDispatcher(send, API.DispatchSettings(**settings))
+        for item in data:
+            dispatcher.submit(item)
+        await dispatcher.close()
+        await pool.close()
+        await accountant.close()
+        return dispatcher
+
+    return asyncio.run(scenario())
+
+
+def test_writes_reach_the_accountant_in_bulk():
+    accountant = StandInAccountant()
+    dispatcher = dispatch_to(accountant, make_data(4) * 5 + make_labels(50))
+    assert dispatcher.deduplicated == 16
+    assert len(accountant.items) == 54
+    assert len(accountant.requests) <= 4
+    assert {path for path, _ in accountant.requests} <= {
+        "/ensure/sessions",
+        "/gather/labels",
+    }
+
+
+def test_writes_fall_back_to_single_paths():
+    accountant = StandInAccountant(bulk=False)
+    dispatcher = dispatch_to(accountant, make_labels(10))
+    assert (dispatcher.sent, dispatcher.failed) == (10, 0)
+    assert {path for path, _ in accountant.requests} == {"/gather/label"}
+
+
+def test_rejected_write_doesnt_fail_the_batch(tmp_path):
+    accountant = StandInAccountant(refuse=lambda item: item["perf_id"] == "3")
+    spill_path = tmp_path / "spill.jsonl"
+    dispatcher = dispatch_to(accountant, make_labels(10), spill_path=str(spill_path))
+    assert (dispatcher.sent, dispatcher.failed, dispatcher.rejected) == (9, 1, 1)
+    rejected = (tmp_path / "spill.jsonl.rejected").read_text().splitlines()
+    assert len(rejected) == 1 and '"perf_id": "3"' in rejected[0]
+
+
+def test_ensured_sessions_are_skipped():
+    sent = []
+    ensured = API.MemoryCache(API.CacheSettings(enabled=True, ttl=60.0))
+
+    async def send(data, *, deadline):
+        sent.append(data)
+
+    dispatcher = API.DataDispatcher(send, API.DispatchSettings(), ensured)
+
+    async def scenario():
+        for _ in range(2):
+            for data in make_data(2):
+                dispatcher.submit(data)
+            await dispatcher.close()
+
+    asyncio.run(scenario())
+    assert len(sent) == 2
+    assert dispatcher.skipped == 2
+    assert ensured.snapshot()["hit_ratio"] == 0.5
@@ -0,0 +1,46 @@
+import json
+import queue
+import logging
+from microfunkhaus import API
+
+
+def make_record(message, **fields):
+    record = logging.LogRecord("testing", logging.INFO, __file__, 1, message, None, None)
+    record.fields = fields
+    return record
+
+
+def test_records_carry_the_request_id():
+    records = queue.Queue()
+    handler = API.NonBlockingQueueHandler(records)
+    token = API.REQUEST_ID.set("abc")
+    try:
+        handler.handle(make_record("Served.", status=200))
+    finally:
+        API.REQUEST_ID.reset(token)
+    entry = json.loads(API.JSONFormatter().format(records.get_nowait()))
+    assert entry["request_id"] == "abc"
+    assert (entry["message"], entry["status"]) == ("Served.", 200)
+
+
+def test_full_queue_drops_records():
+    handler = API.NonBlockingQueueHandler(queue.Queue(1))
+    for _ in range(3):
+        handler.handle(make_record("Served."))
+    assert handler.dropped == 2
+
+
+def test_listener_stops_once_whatever_the_order(tmp_path):
+    settings = API.LoggingSettings(path=str(tmp_path / "log.jsonl"))
+    first = API.configure_logging(settings)
+    first.start()
+    second = API.configure_logging(settings)
+    second.start()
+    second.start()
+    API.LOGGER.info("Served.")
+    second.stop()
+    first.stop()
+    second.stop()
+    first.stop()
+    entries = (tmp_path / "log.jsonl").read_text().splitlines()
+    assert [json.loads(entry)["message"] for entry in entries] == ["Served."]
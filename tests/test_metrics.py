@@ -0,0 +1,83 @@
+import json
+import asyncio
+from fastapi.testclient import TestClient
+from microfunkhaus import generate_app_with_config, API
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = API.Histogram("testing_seconds", "Testing.", ("route",), (0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 5.0):
+        histogram.observe("/testing", value=value)
+    assert histogram.samples() == [
+        'testing_seconds_bucket{route="/testing",le="0.1"} 2',
+        'testing_seconds_bucket{route="/testing",le="1.0"} 3',
+        'testing_seconds_bucket{route="/testing",le="+Inf"} 4',
+        'testing_seconds_sum{route="/testing"} 5.65',
+        'testing_seconds_count{route="/testing"} 4',
+    ]
+
+
+def test_registry_renders_help_and_type():
+    registry = API.MetricsRegistry()
+    counter = registry.register(API.Counter("testing_total", "Testing.", ("status",)))
+    counter.inc('4"04')
+    assert registry.render() == (
+        "# HELP testing_total Testing.\n"
+        "# TYPE testing_total counter\n"
+        'testing_total{status="4\\"04"} 1.0\n'
+    )
+
+
+def test_app_registries_keep_their_own_gauges():
+    shared = API.MetricsRegistry()
+    shared.register(API.Counter("testing_total", "Testing.")).inc()
+    first, second = API.MetricsRegistry(shared), API.MetricsRegistry(shared)
+    for registry, value in ((first, 1), (second, 2)):
+        registry.register(
+            API.Gauge("testing_gauge", "Testing.", collect=lambda v=value: {(): v})
+        )
+    assert first.render().endswith(
+        "testing_total 1.0\n"
+        "# HELP testing_gauge Testing.\n"
+        "# TYPE testing_gauge gauge\n"
+        "testing_gauge 1\n"
+    )
+    assert "testing_gauge 2" in second.render()
+    assert "testing_gauge" not in shared.render()
+
+
+def test_cache_lookups_are_exported():
+    endpoint = API.Endpoint(
+        name="testing/metered",
+        host="127.0.0.1",
+        port="0",
+        path="testing",
+        cache=API.CacheSettings(enabled=True),
+    )
+    cache = API.get_cache(endpoint)
+
+    async def scenario():
+        await cache.get("missing")
+        return API.REGISTRY.render()
+
+    try:
+        rendered = asyncio.run(scenario())
+    finally:
+        API.CACHES.pop(endpoint.name)
+    assert "# TYPE microfunkhaus_cache_lookups_total counter" in rendered
+    labels = '{endpoint="testing/metered",outcome="miss"}'
+    assert f"microfunkhaus_cache_lookups_total{labels} 1" in rendered
+
+
+def test_background_work_is_exported(tmp_path, monkeypatch):
+    with open("config.json") as config_file:
+        config = json.load(config_file)
+    config["prefetch"]["enabled"] = True
+    (tmp_path / "config.json").write_text(json.dumps(config))
+    monkeypatch.chdir(tmp_path)
+    app = generate_app_with_config(remote_healthcheck_on_startup=False)
+    response = TestClient(app).get("/metrics", headers={"X-Token": "testing"})
+    assert response.ok
+    assert 'microfunkhaus_dispatch_total{outcome="submitted"} 0' in response.text
+    assert 'microfunkhaus_dispatch_total{outcome="spilled"} 0' in response.text
+    assert 'microfunkhaus_prefetch_total{outcome="hits"} 0' in response.text
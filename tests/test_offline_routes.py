@@ -0,0 +1,117 @@
+"""The batch and streaming routes against canned remote responses,
+so that they don't need the remote services running.
+"""
+
+import json
+import logging
+import pytest
+from aiohttp import ClientResponseError
+from fastapi.testclient import TestClient
+from microfunkhaus import generate_app_with_config, actions, API
+from benchmarks.stubs import RESPONDERS, get_service
+
+headers = {"X-Token": "testing"}
+
+# Keys the stand-in voicemaster fails on, with an expected and an unexpected error
+UNAVAILABLE_KEY = 1
+BROKEN_KEY = 2
+
+
+async def post_single_request(endpoint, payload, *, pool, deadline=None, option=None):
+    body = API.prepare(payload)
+    if get_service(endpoint) == "microvoicemaster":
+        if body["key"] == UNAVAILABLE_KEY:
+            raise ClientResponseError(None, (), status=502, message="Bad Gateway")
+        if body["key"] == BROKEN_KEY:
+            raise KeyError("structures")
+    return RESPONDERS[get_service(endpoint)](body).encode()
+
+
+class Collected(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(actions.scenarios, "post_single_request", post_single_request)
+    app = generate_app_with_config(remote_healthcheck_on_startup=False)
+    return TestClient(app)
+
+
+@pytest.fixture
+def logged():
+    handler = Collected()
+    API.LOGGER.addHandler(handler)
+    try:
+        yield handler.records
+    finally:
+        API.LOGGER.removeHandler(handler)
+
+
+def make_request(key):
+    return {"sess_id": "127.0.0.1", "performance_object": {"key": key}}
+
+
+def test_batch_isolates_failed_items(client, logged):
+    payload = [make_request(key) for key in (0, UNAVAILABLE_KEY, BROKEN_KEY, 3)]
+    response = client.post("/generate/batch", json=payload, headers=headers)
+    assert response.ok
+    items = response.json()
+    assert [item["status"] for item in items] == [200, 502, 500, 200]
+    assert items[0]["performance"]["key"] == 0
+    assert items[2]["detail"] == "Internal Server Error"
+    unhandled = [record for record in logged if record.exc_info]
+    assert [record.exc_info[0] for record in unhandled] == [KeyError]
+
+
+def test_batch_is_limited(client):
+    payload = [make_request(0)] * 33
+    response = client.post("/generate/batch", json=payload, headers=headers)
+    assert response.status_code == 413
+
+
+def test_stream_is_framed_as_ndjson(client):
+    response = client.post("/generate/stream", json=make_request(0), headers=headers)
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    stages = [json.loads(line) for line in response.text.splitlines()]
+    assert [s["stage"] for s in stages] == ["progression", "voices", "performance"]
+    assert stages[-1]["data"]["key"] == 0
+
+
+def test_stream_is_framed_as_sse(client):
+    response = client.post(
+        "/generate/stream",
+        json=make_request(0),
+        headers={**headers, "Accept": "text/event-stream"},
+    )
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = response.text.split("\n\n")
+    assert events[-1] == ""
+    stages = [event.split("\n") for event in events[:-1]]
+    assert [lines[0] for lines in stages] == [
+        "event: progression",
+        "event: voices",
+        "event: performance",
+    ]
+    assert all(lines[1].startswith("data: {") for lines in stages)
+
+
+@pytest.mark.parametrize(
+    "key, expected",
+    [
+        (UNAVAILABLE_KEY, {"status": 502, "detail": "Bad Gateway"}),
+        (BROKEN_KEY, {"status": 500, "detail": "Internal Server Error"}),
+    ],
+)
+def test_stream_ends_with_an_error_stage(client, logged, key, expected):
+    response = client.post("/generate/stream", json=make_request(key), headers=headers)
+    assert response.ok
+    stages = [json.loads(line) for line in response.text.splitlines()]
+    assert [s["stage"] for s in stages] == ["progression", "error"]
+    assert stages[-1]["data"] == expected
+    assert any(record.exc_info for record in logged) == (key == BROKEN_KEY)
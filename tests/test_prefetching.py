@@ -0,0 +1,76 @@
+import asyncio
+from microfunkhaus import actions, API
+from .mocking import f_perf_response
+
+
+def make_prefetcher(calls, **settings):
+    async def amend(performance, index, *, deadline):
+        calls.append(index)
+        return performance.copy(update={"ticket": f"{performance.ticket}-{index}"})
+
+    settings = actions.PrefetchSettings(enabled=True, max_cpu=float("inf"), **settings)
+    return actions.AmendmentPrefetcher(amend, settings)
+
+
+def test_prefetched_amendment_is_served_once(f_perf_response):
+    calls = []
+    prefetcher = make_prefetcher(calls)
+
+    async def scenario():
+        prefetcher.schedule(f_perf_response)
+        first = await prefetcher.take(f_perf_response, 1)
+        second = await prefetcher.take(f_perf_response, 1)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first.ticket == f"{f_perf_response.ticket}-1"
+    assert second is None
+    assert sorted(calls) == [0, 1, 2]
+    assert (prefetcher.hits, prefetcher.misses) == (1, 1)
+
+
+def test_changed_performance_is_not_served(f_perf_response):
+    prefetcher = make_prefetcher([])
+    changed = f_perf_response.copy(update={"hex_blob": "4d546864"})
+
+    async def scenario():
+        prefetcher.schedule(f_perf_response)
+        changed_amendment = await prefetcher.take(changed, 0)
+        return changed_amendment, await prefetcher.take(f_perf_response, 0)
+
+    changed_amendment, amendment = asyncio.run(scenario())
+    assert changed_amendment is None
+    assert amendment.ticket == f"{f_perf_response.ticket}-0"
+
+
+def test_prefetching_respects_pending_budget(f_perf_response):
+    calls = []
+    prefetcher = make_prefetcher(calls, max_pending=1)
+
+    async def scenario():
+        prefetcher.schedule(f_perf_response)
+        await prefetcher.close()
+
+    asyncio.run(scenario())
+    assert (prefetcher.scheduled, prefetcher.skipped) == (1, 2)
+
+
+def test_slow_prefetch_doesnt_outlast_the_deadline(f_perf_response):
+    async def amend(performance, index, *, deadline):
+        await asyncio.sleep(1.0)
+        return performance
+
+    settings = actions.PrefetchSettings(enabled=True, max_cpu=float("inf"))
+    prefetcher = actions.AmendmentPrefetcher(amend, settings)
+
+    async def scenario():
+        prefetcher.schedule(f_perf_response)
+        taken = await prefetcher.take(f_perf_response, 0, API.Deadline(0.01))
+        stored = prefetcher.snapshot()["stored"]
+        await prefetcher.close()
+        return taken, stored
+
+    taken, stored = asyncio.run(scenario())
+    assert taken is None
+    assert stored == 3  # Kept for a retry
+    assert prefetcher.misses == 1
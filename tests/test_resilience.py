@@ -0,0 +1,235 @@
+import asyncio
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from microfunkhaus import API
+from .mocking import f_perf_response
+
+
+def make_breaker(**settings):
+    return API.CircuitBreaker("testing", API.BreakerSettings(**settings))
+
+
+async def serve_slowly(seconds):
+    async def respond(request):
+        await asyncio.sleep(seconds)
+        return web.json_response(True)
+
+    app = web.Application()
+    app.router.add_post("/{path:.*}", respond)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+def call_slow_endpoint(name, calls, deadline_timeout=None, replicas=1, **fields):
+    """Calls an endpoint whose replicas are slower than any of the timeouts,
+    returns it.
+    """
+
+    async def scenario():
+        servers = [await serve_slowly(0.5) for _ in range(replicas)]
+        endpoint = API.Endpoint(
+            name=name,
+            path="testing",
+            replicas=[
+                {"host": server.host, "port": str(server.port)} for server in servers
+            ],
+            **fields,
+        )
+        pool = API.SessionPool([endpoint])
+        try:
+            for _ in range(calls):
+                deadline = None
+                if deadline_timeout is not None:
+                    deadline = API.Deadline(deadline_timeout)
+                with pytest.raises(asyncio.TimeoutError):
+                    await API.engine.post_json(
+                        endpoint, {}, pool=pool, deadline=deadline
+                    )
+        finally:
+            await pool.close()
+            for server in servers:
+                await server.close()
+        return endpoint
+
+    return asyncio.run(scenario())
+
+
+def test_breaker_opens_on_error_rate():
+    breaker = make_breaker(window=4, min_calls=4, error_rate=0.5)
+    for ok in (True, False, True, False):
+        breaker.acquire()
+        breaker.record(ok, 0.01)
+    assert breaker.state == API.BreakerStates.open
+    with pytest.raises(API.CircuitOpenError):
+        breaker.acquire()
+
+
+def test_breaker_counts_slow_calls_as_failures():
+    breaker = make_breaker(window=2, min_calls=2, error_rate=1.0, slow_call=0.1)
+    for _ in range(2):
+        breaker.acquire()
+        breaker.record(True, 0.5)
+    assert breaker.state == API.BreakerStates.open
+
+
+def test_breaker_closes_after_successful_probe():
+    breaker = make_breaker(window=1, min_calls=1, error_rate=1.0, open_for=0.0)
+    breaker.acquire()
+    breaker.record(False, 0.01)
+    assert breaker.state == API.BreakerStates.half_open
+    breaker.acquire()
+    with pytest.raises(API.CircuitOpenError):
+        breaker.acquire()  # Only one probe at a time
+    breaker.record(True, 0.01)
+    assert breaker.state == API.BreakerStates.closed
+
+
+def test_backoff_delay_is_capped():
+    endpoint = API.Endpoint(
+        name="testing",
+        host="127.0.0.1",
+        port="0",
+        path="testing",
+        retry=API.RetrySettings(attempts=10, backoff=0.1, backoff_max=0.3),
+    )
+    for attempt in range(1, 10):
+        assert 0 <= API.get_backoff_delay(endpoint, attempt) <= 0.3
+
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        (None, 10.0),
+        ("abc", 10.0),
+        ("0", 10.0),
+        ("-5", 10.0),
+        ("10", 0.5),
+        ("2000", 2.0),
+        ("60000", 10.0),
+    ],
+)
+def test_deadline_header_is_clamped(header, expected):
+    deadline = API.Deadline.from_header(
+        header, default=10.0, maximum=10.0, minimum=0.5
+    )
+    assert deadline.remaining() == pytest.approx(expected, abs=0.05)
+
+
+
+def test_client_budget_timeouts_dont_open_the_breaker():
+    endpoint = call_slow_endpoint("testing/budget", 10, deadline_timeout=0.02)
+    try:
+        breaker = API.get_breaker(endpoint)
+        assert breaker.state == API.BreakerStates.closed
+        assert breaker.snapshot()["calls"] == 0
+    finally:
+        API.BREAKERS.pop(endpoint.name)
+        API.SELECTORS.pop(endpoint.name)
+
+
+
+def test_client_budget_timeouts_dont_eject_replicas():
+    endpoint = call_slow_endpoint(
+        "testing/budget/replicas",
+        12,
+        deadline_timeout=0.02,
+        replicas=2,
+        outliers=API.OutlierSettings(min_requests=3),
+    )
+    try:
+        report = API.get_selector(endpoint).snapshot()
+        assert all(replica["ejections"] == 0 for replica in report.values())
+        assert all(replica["error_rate"] == 0.0 for replica in report.values())
+    finally:
+        API.BREAKERS.pop(endpoint.name)
+        API.SELECTORS.pop(endpoint.name)
+
+
+def test_endpoint_timeouts_open_the_breaker():
+    endpoint = call_slow_endpoint(
+        "testing/timeout",
+        5,
+        deadline_timeout=10.0,
+        timeout=API.TimeoutSettings(total=0.02),
+    )
+    try:
+        assert API.get_breaker(endpoint).state == API.BreakerStates.open
+    finally:
+        API.BREAKERS.pop(endpoint.name)
+        API.SELECTORS.pop(endpoint.name)
+
+
+def test_hedge_delay_needs_samples():
+    endpoint = API.Endpoint(
+        name="testing/hedged",
+        host="127.0.0.1",
+        port="0",
+        path="testing",
+        retry=API.RetrySettings(hedge=True, hedge_min_samples=10),
+    )
+    assert API.get_hedge_delay(endpoint) is None
+    for latency in range(1, 21):
+        API.record_latency(endpoint, latency / 100)
+    assert API.get_hedge_delay(endpoint) == 0.2
+
+
+
+def test_cancelled_hedge_cancels_its_first_request(monkeypatch):
+    endpoint = API.Endpoint(
+        name="testing/hedged/cancelled",
+        host="127.0.0.1",
+        port="0",
+        path="testing",
+        retry=API.RetrySettings(hedge=True, hedge_min_samples=1),
+    )
+    API.record_latency(endpoint, 10.0)
+    started = []
+
+    async def post_json(*args, **kwargs):
+        started.append(asyncio.current_task())
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(API.engine, "post_json", post_json)
+
+    async def scenario():
+        hedged = asyncio.create_task(
+            API.post_hedged_request(endpoint, {}, pool=API.SessionPool())
+        )
+        await asyncio.sleep(0.01)
+        hedged.cancel()
+        await asyncio.gather(hedged, return_exceptions=True)
+        await asyncio.sleep(0)
+        return started[0].cancelled()
+
+    assert asyncio.run(scenario())
+
+
+
+def test_pool_closes_sessions_left_from_a_finished_loop():
+    endpoint = API.ENDPOINTS["micropathforger/generate"]
+    pool = API.SessionPool([endpoint])
+
+    async def get_session():
+        return pool.session_for(endpoint)
+
+    async def replace_session():
+        session = pool.session_for(endpoint)
+        await pool.close()
+        return session
+
+    stale = asyncio.run(get_session())
+    fresh = asyncio.run(replace_session())
+    assert fresh is not stale
+    assert stale.closed and fresh.closed
+
+
+def test_amendment_option_is_per_call(f_perf_response):
+    registered = API.ENDPOINTS["micropathforger/amend"]
+    endpoint, _, option = API.get_req_progression_amendment(f_perf_response, 2)
+    assert endpoint is registered and registered.option is None
+    assert endpoint.get_url(option) == f"{endpoint}/2"
+    with pytest.raises(TypeError):
+        registered.option = "2"
@@ -1,3 +1,4 @@
+import json
 from hypothesis import given, strategies as st
 from microfunkhaus import generate_app_with_config, API
 from fastapi.testclient import TestClient
@@ -44,3 +45,97 @@ def test_amend_idiomatic_performance(r, ind):
     am_payload = amendment_req.json()
     response = TEST_APP.post(f"/amend/{ind}", am_payload, headers=headers)
     assert response.ok
+
+
+def get_pitch_classes(hex_blob):
+    chords = {}
+    for tick, note in API.read_hex_blob_notes(hex_blob):
+        chords.setdefault(tick, set()).add(note % 12)
+    return [chords[tick] for tick in sorted(chords)]
+
+
+@given(b_generic_request, st.integers(min_value=1, max_value=11))
+def test_local_transposition_matches_remote(r, shift):
+    payload = r.json()
+    generated_response = TEST_APP.post("/generate", payload, headers=headers)
+    performance = API.PerformanceResponse.parse_raw(generated_response.text)
+    key = (performance.key + shift) % 12
+    local_req = API.PerformanceRequest(
+        sess_id=r.sess_id,
+        performance_object=performance.copy(update={"key": key}),
+    )
+    # An unknown ticket makes the gateway ask the remote services
+    remote_req = API.PerformanceRequest(
+        sess_id=r.sess_id,
+        performance_object=performance.copy(update={"key": key, "ticket": "-1"}),
+    )
+    local = TEST_APP.post("/generate", local_req.json(), headers=headers)
+    remote = TEST_APP.post("/generate", remote_req.json(), headers=headers)
+    local_performance = API.PerformanceResponse.parse_raw(local.text)
+    remote_performance = API.PerformanceResponse.parse_raw(remote.text)
+    assert local_performance.human_readable == remote_performance.human_readable
+    assert get_pitch_classes(local_performance.hex_blob) == get_pitch_classes(
+        remote_performance.hex_blob
+    )
+
+
+@given(st.lists(b_perf_request, min_size=1, max_size=LENGTH))
+def test_batch_generation(rs):
+    payload = "[" + ",".join(r.json() for r in rs) + "]"
+    response = TEST_APP.post("/generate/batch", payload, headers=headers)
+    assert response.ok
+    items = response.json()
+    assert len(items) == len(rs)
+    assert all(item["status"] == 200 for item in items)
+
+
+@given(b_generic_request)
+def test_streamed_generation(r):
+    payload = r.json()
+    response = TEST_APP.post("/generate/stream", payload, headers=headers)
+    assert response.ok
+    stages = [json.loads(line) for line in response.text.splitlines()]
+    assert [s["stage"] for s in stages] == ["progression", "voices", "performance"]
+    preview, performance = stages[0]["data"], stages[-1]["data"]
+    assert preview["human_readable"] == performance["human_readable"]
+
+
+def test_metrics():
+    TEST_APP.get("/healthcheck", headers=headers)
+    response = TEST_APP.get("/metrics", headers=headers)
+    assert response.ok
+    sample = 'microfunkhaus_requests_total{route="/healthcheck",method="GET",status="200"}'
+    assert sample in response.text
+    assert "microfunkhaus_upstream_ttfb_seconds_bucket" in response.text
+
+
+def test_request_id_is_echoed():
+    response = TEST_APP.get("/healthcheck", headers={**headers, "X-Request-ID": "abc"})
+    assert response.headers["X-Request-ID"] == "abc"
+
+
+@given(b_perf_request)
+def test_generation_is_traced(r):
+    exporter = API.configure_tracing(API.TracingSettings(enabled=True))
+    try:
+        traced_headers = {**headers, "X-Request-ID": "traced"}
+        TEST_APP.post("/generate", r.json(), headers=traced_headers)
+    finally:
+        API.configure_tracing(API.TracingSettings())
+    root = next(
+        span
+        for span in reversed(exporter.spans)
+        if span.attributes.get("request_id") == "traced"
+    )
+    names = {span.name for span in exporter.get_trace(root.trace_id)}
+    assert "POST /generate" in names
+    assert "POST microvoicemaster/perform" in names
+    assert "parse PseudoMIDI" in names
+
+
+def test_replicas_table():
+    response = TEST_APP.get("/admin/replicas", headers=headers)
+    assert response.ok
+    table = response.json()
+    assert set(table) == set(API.ENDPOINTS)
+    assert all("ejected" in row for rows in table.values() for row in rows.values())
@@ -0,0 +1,29 @@
+from microfunkhaus import API
+
+
+def test_spans_nest_and_continue_the_callers_trace():
+    tracer = API.Tracer()
+    tracer.exporter = API.MemoryExporter(API.TracingSettings(enabled=True))
+    parent = API.parse_traceparent(
+        "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+    )
+
+    with tracer.span("request", parent=parent) as root:
+        with tracer.span("child") as child:
+            headers = {"traceparent": child.traceparent}
+
+    assert root.trace_id == child.trace_id == "4bf92f3577b34da6a3ce929d0e0e4736"
+    assert root.parent_id == "00f067aa0ba902b7"
+    assert child.parent_id == root.span_id
+    assert headers["traceparent"] == f"00-{root.trace_id}-{child.span_id}-01"
+    assert [span.name for span in tracer.exporter.spans] == ["child", "request"]
+
+
+def test_malformed_traceparent_is_ignored():
+    assert API.parse_traceparent("00-xyz-00f067aa0ba902b7-01") is None
+    assert API.parse_traceparent(None) is None
+
+
+def test_disabled_tracer_yields_nothing():
+    with API.Tracer().span("request") as span:
+        assert span is None
@@ -0,0 +1,47 @@
+import pytest
+from chrdiotypes.data_enums import NotesInt
+from microfunkhaus import API
+from .mocking import f_perf_response
+
+
+def test_transpose_hex_blob_shifts_every_note(f_perf_response):
+    hex_blob = f_perf_response.hex_blob
+    transposed = API.transpose_hex_blob(hex_blob, 2)
+    assert len(transposed) == len(hex_blob)
+    assert API.read_hex_blob_notes(transposed) == [
+        (tick, note + 2) for tick, note in API.read_hex_blob_notes(hex_blob)
+    ]
+
+
+def test_transpose_hex_blob_keeps_midi_range(f_perf_response):
+    with pytest.raises(ValueError):
+        API.transpose_hex_blob(f_perf_response.hex_blob, 127)
+
+
+@pytest.mark.parametrize(
+    "old_key, new_key, shift", [(0, 2, 2), (10, 0, 2), (0, 10, -2), (0, 6, 6)]
+)
+def test_get_shift(old_key, new_key, shift):
+    assert API.get_shift(old_key, new_key) == shift
+
+
+def test_served_performance_is_transposed(f_perf_response):
+    served = API.ServedPerformances()
+    served.remember(f_perf_response)
+    request = f_perf_response.copy(update={"key": NotesInt(0)})
+    transposed = served.transpose(request)
+    assert transposed is not None
+    assert transposed.key == 0
+    assert transposed.ticket == f_perf_response.ticket
+    assert transposed.human_readable[0][0] == "C"
+    assert API.read_hex_blob_notes(transposed.hex_blob)[0][1] == 48
+
+
+def test_unknown_performance_is_not_transposed(f_perf_response):
+    served = API.ServedPerformances()
+    served.remember(f_perf_response)
+    request = f_perf_response.copy(
+        update={"key": NotesInt(0), "hex_blob": "4d546864"}
+    )
+    assert served.transpose(request) is None
+    assert served.transpose(f_perf_response) is None  # Same key